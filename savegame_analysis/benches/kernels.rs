@@ -0,0 +1,197 @@
+// Benchmarks of the hot functions of the crate, on generated inputs of realistic sizes. Run with
+// `cargo bench`. Criterion writes the results as JSON into target/criterion/<group>/<function>/
+// (estimates.json has the mean, median etc. in nanoseconds). To compare a rewrite against the
+// current state, save a baseline first and compare against it afterwards:
+//
+//     cargo bench -- --save-baseline before
+//     (change things)
+//     cargo bench -- --baseline before
+//
+// All inputs are generated from fixed seeds, so every run measures the same work
+
+use std::path::{Path, PathBuf};
+use criterion::{criterion_group, criterion_main, black_box, BenchmarkId, Criterion, Throughput};
+use savegame_analysis::{Wife, Wife3, ScoringSystem, MatchingScorer, TimingInfo};
+
+
+const NUM_REPLAY_NOTES: usize = 10_000;
+const NUM_SONGS: usize = 2_000;
+const SONGS_PER_PACK: usize = 40;
+// A gimmick chart with a bpm change every quarter beat
+const NUM_GIMMICK_BPM_CHANGES: usize = 5_000;
+
+// xorshift64*, good enough for benchmark inputs and keeps rand out of the dependencies
+struct Rng(u64);
+
+impl Rng {
+	fn next_u64(&mut self) -> u64 {
+		self.0 ^= self.0 >> 12;
+		self.0 ^= self.0 << 25;
+		self.0 ^= self.0 >> 27;
+		return self.0.wrapping_mul(0x2545F4914F6CDD1D);
+	}
+
+	// uniform in [0, 1)
+	fn next_f32(&mut self) -> f32 {
+		return (self.next_u64() >> 40) as f32 / (1u64 << 24) as f32;
+	}
+
+	// roughly normally distributed hit offset in seconds, with a standard deviation of ~20ms
+	fn offset(&mut self) -> f32 {
+		let sum: f32 = (0..4).map(|_| self.next_f32()).sum();
+		return (sum - 2.0) * 0.035;
+	}
+}
+
+// Chronologically sorted note positions in seconds, at around 15 nps on average
+fn note_seconds(rng: &mut Rng, num_notes: usize) -> Vec<f32> {
+	let mut second = 0.0;
+	return (0..num_notes).map(|_| {
+		second += 0.01 + rng.next_f32() * 0.11;
+		second
+	}).collect();
+}
+
+fn temp_path(name: &str) -> PathBuf {
+	return std::env::temp_dir().join(format!("savegame_analysis_bench_{}", name));
+}
+
+// Writes a ReplaysV2 file with `num_notes` taps spread over four columns, a few of them misses,
+// and returns its path
+fn write_replay(rng: &mut Rng, num_notes: usize) -> PathBuf {
+	let mut contents = String::with_capacity(num_notes * 20);
+	let mut tick = 0;
+	for _ in 0..num_notes {
+		tick += 1 + rng.next_u64() % 24;
+		let offset = if rng.next_f32() < 0.01 { 1.0 } else { rng.offset() };
+		contents.push_str(&format!("{} {:.6} {} 1\n", tick, offset, rng.next_u64() % 4));
+	}
+	contents.push_str("H 1200 2 2\n");
+
+	let path = temp_path("replay");
+	std::fs::write(&path, contents).expect("Couldn't write benchmark replay");
+	return path;
+}
+
+// Writes a Songs folder with `num_songs` .sm files (only #TITLE and #BPMS, which is all that's
+// read), every tenth of them with a bunch of bpm changes, and returns its path
+fn write_songs_folder(rng: &mut Rng, num_songs: usize) -> PathBuf {
+	let root = temp_path("songs");
+	let _ = std::fs::remove_dir_all(&root);
+	for i in 0..num_songs {
+		let song_dir = root.join(format!("Pack {}", i / SONGS_PER_PACK)).join(format!("Song {}", i));
+		std::fs::create_dir_all(&song_dir).expect("Couldn't create benchmark song folder");
+
+		let num_changes = if i % 10 == 0 { 200 } else { 1 };
+		let bpms = (0..num_changes)
+				.map(|j| format!("{:.3}={:.3}", j as f32 * 4.0, 100.0 + rng.next_f32() * 150.0))
+				.collect::<Vec<_>>()
+				.join(",\n");
+		let sm = format!("#TITLE:Song {};\n#ARTIST:Benchmark;\n#BPMS:{};\n#NOTES:\n;\n", i, bpms);
+		std::fs::write(song_dir.join(format!("Song {}.sm", i)), sm)
+				.expect("Couldn't write benchmark sm file");
+	}
+	return root;
+}
+
+fn gimmick_timing_info(rng: &mut Rng) -> TimingInfo {
+	let bpm_string = (0..NUM_GIMMICK_BPM_CHANGES)
+			.map(|i| format!("{:.3}={:.3}", i as f32 * 0.25, 60.0 + rng.next_f32() * 400.0))
+			.collect::<Vec<_>>()
+			.join(",");
+	return TimingInfo::from_sm_bpm_string(bpm_string.as_bytes())
+			.expect("Generated bpm string doesn't parse");
+}
+
+fn bench_replays(c: &mut Criterion) {
+	let mut rng = Rng(1);
+	let replay_path = write_replay(&mut rng, NUM_REPLAY_NOTES);
+	let replay_path = replay_path.to_str().unwrap();
+
+	let seconds = note_seconds(&mut rng, NUM_REPLAY_NOTES);
+	let wife_pts: Vec<f32> = (0..NUM_REPLAY_NOTES).map(|_| Wife3::calc(rng.offset())).collect();
+
+	let mut group = c.benchmark_group("replays");
+	group.throughput(Throughput::Elements(NUM_REPLAY_NOTES as u64));
+	group.bench_function("parse_replay_file", |b| b.iter(|| {
+		savegame_analysis::parse_replay_file(black_box(replay_path))
+	}));
+	// same subset sizes as in the replays analysis
+	group.bench_function("find_fastest_note_subset", |b| b.iter(|| {
+		savegame_analysis::find_fastest_note_subset(black_box(&seconds), 100, 130)
+	}));
+	group.bench_function("find_fastest_note_subset_wife_pts", |b| b.iter(|| {
+		savegame_analysis::find_fastest_note_subset_wife_pts(black_box(&seconds), 100, 130,
+				black_box(&wife_pts))
+	}));
+	group.finish();
+}
+
+fn bench_scoring(c: &mut Criterion) {
+	let mut rng = Rng(2);
+	let deviations: Vec<f32> = (0..NUM_REPLAY_NOTES).map(|_| rng.offset()).collect();
+
+	// One column of a 10k note chart: every note is hit except for a few misses, plus some stray
+	// taps in between
+	let notes = note_seconds(&mut rng, NUM_REPLAY_NOTES / 4);
+	let mut hits = Vec::with_capacity(notes.len());
+	for &second in &notes {
+		if rng.next_f32() >= 0.01 {
+			hits.push(second + rng.offset());
+		}
+	}
+	for _ in 0..notes.len() / 50 {
+		hits.push(rng.next_f32() * notes[notes.len() - 1]);
+	}
+	hits.sort_by(|a, b| a.partial_cmp(b).unwrap());
+
+	let mut group = c.benchmark_group("scoring");
+	group.throughput(Throughput::Elements(deviations.len() as u64));
+	group.bench_function("wife3_calc", |b| b.iter(|| {
+		black_box(&deviations).iter().map(|&deviation| Wife3::calc(deviation)).sum::<f32>()
+	}));
+	group.throughput(Throughput::Elements(notes.len() as u64));
+	group.bench_function("matching_scorer_evaluate", |b| b.iter(|| {
+		MatchingScorer::evaluate::<Wife3>(black_box(&notes), black_box(&hits))
+	}));
+	group.finish();
+}
+
+fn bench_calc_rating(c: &mut Criterion) {
+	let mut rng = Rng(3);
+	let ssrs: Vec<f32> = (0..100_000).map(|_| 5.0 + rng.next_f32() * 25.0).collect();
+
+	let mut group = c.benchmark_group("calc_rating");
+	for &num_ssrs in &[1_000, 10_000, 100_000] {
+		group.throughput(Throughput::Elements(num_ssrs as u64));
+		group.bench_with_input(BenchmarkId::from_parameter(num_ssrs), &ssrs[..num_ssrs],
+				|b, ssrs| b.iter(|| savegame_analysis::calc_rating::calc_rating(black_box(ssrs))));
+	}
+	group.finish();
+}
+
+fn bench_timing_info(c: &mut Criterion) {
+	let mut rng = Rng(4);
+	let timing_info = gimmick_timing_info(&mut rng);
+	let mut tick = 0;
+	let ticks: Vec<u64> = (0..NUM_REPLAY_NOTES).map(|_| {
+		tick += 1 + rng.next_u64() % 12;
+		tick
+	}).collect();
+	let songs_root = write_songs_folder(&mut rng, NUM_SONGS);
+
+	let mut group = c.benchmark_group("timing_info");
+	group.throughput(Throughput::Elements(ticks.len() as u64));
+	group.bench_function("ticks_to_seconds_gimmick", |b| b.iter(|| {
+		timing_info.ticks_to_seconds(black_box(&ticks))
+	}));
+	group.throughput(Throughput::Elements(NUM_SONGS as u64));
+	group.sample_size(10);
+	group.bench_function("build_timing_info_index", |b| b.iter(|| {
+		savegame_analysis::build_timing_info_index(black_box(Path::new(&songs_root)))
+	}));
+	group.finish();
+}
+
+criterion_group!(benches, bench_replays, bench_scoring, bench_calc_rating, bench_timing_info);
+criterion_main!(benches);
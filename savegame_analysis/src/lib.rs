@@ -15,17 +15,29 @@ pub use wife::*;
 mod rescore;
 pub use rescore::*;
 
+mod score_table;
+pub use score_table::*;
+
+mod progress;
+pub use progress::*;
+
 pub mod util; // pub, because the stuff in util should be general-purpose anyway
 // also, don't pub-use util, because the general-purpose stuff that's not really connected to the
 // rest of the program shouldn't be in the same place as the rest of the program either.
 
 
 use pyo3::prelude::*;
+use pyo3::wrap_pyfunction;
 
 #[pymodule]
-fn savegame_analysis(_py: Python, m: &PyModule) -> PyResult<()> {
+fn savegame_analysis(py: Python, m: &PyModule) -> PyResult<()> {
 	m.add_class::<ReplaysAnalysis>()?;
 	m.add_class::<SkillTimeline>()?;
+	m.add_class::<ScoreTable>()?;
+	m.add_class::<SongsTimingIndex>()?;
+	m.add_class::<CancelToken>()?;
+	m.add("Cancelled", py.get_type::<Cancelled>())?;
+	m.add_wrapped(wrap_pyfunction!(parse_etterna_xml))?;
 	
 	return Ok(());
 }
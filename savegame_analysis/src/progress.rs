@@ -0,0 +1,187 @@
+use std::sync::{Arc, Mutex};
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::time::{Duration, Instant};
+use pyo3::prelude::*;
+use pyo3::create_exception;
+
+
+// Minimum time between two calls of the progress callback
+const REPORT_INTERVAL: Duration = Duration::from_millis(100);
+
+create_exception!(savegame_analysis, Cancelled, pyo3::exceptions::Exception);
+
+/// Passed to a long-running function to abort it from another thread. The function raises
+/// Cancelled once it notices
+#[pyclass]
+#[derive(Default)]
+pub struct CancelToken {
+	pub cancelled: Arc<AtomicBool>,
+}
+
+#[pymethods]
+impl CancelToken {
+	#[new]
+	pub fn create() -> Self {
+		return Self::default();
+	}
+
+	pub fn cancel(&self) {
+		self.cancelled.store(true, Ordering::Relaxed);
+	}
+
+	#[getter]
+	pub fn cancelled(&self) -> bool {
+		return self.cancelled.load(Ordering::Relaxed);
+	}
+}
+
+type Callback<'a, E> = Box<dyn Fn(u64, u64, u64) -> Result<(), E> + Send + Sync + 'a>;
+
+/// Counts finished items from any number of threads, and calls a progress callback with
+/// `(items_done, items_total, bytes_read)` at most every REPORT_INTERVAL. If the callback returns
+/// an error, the work is cancelled and the error is kept for the caller
+pub struct ProgressReporter<'a, E> {
+	callback: Option<Callback<'a, E>>,
+	items_total: u64,
+	items_done: AtomicU64,
+	bytes_read: AtomicU64,
+	report_interval: Duration,
+	last_report: Mutex<Instant>,
+	cancelled: Arc<AtomicBool>,
+	error: Mutex<Option<E>>, // error returned by the callback
+}
+
+impl<'a, E> ProgressReporter<'a, E> {
+	pub fn new<F>(callback: Option<F>, items_total: u64, cancel: Option<&CancelToken>) -> Self
+			where F: Fn(u64, u64, u64) -> Result<(), E> + Send + Sync + 'a {
+
+		let cancelled = match cancel {
+			Some(token) => token.cancelled.clone(),
+			None => Arc::new(AtomicBool::new(false)),
+		};
+		return Self {
+			callback: callback.map(|callback| Box::new(callback) as Callback<'a, E>),
+			items_total, cancelled,
+			items_done: AtomicU64::new(0),
+			bytes_read: AtomicU64::new(0),
+			report_interval: REPORT_INTERVAL,
+			last_report: Mutex::new(Instant::now()),
+			error: Mutex::new(None),
+		};
+	}
+
+	pub fn with_report_interval(mut self, report_interval: Duration) -> Self {
+		self.report_interval = report_interval;
+		return self;
+	}
+
+	pub fn is_cancelled(&self) -> bool {
+		return self.cancelled.load(Ordering::Relaxed);
+	}
+
+	pub fn items_done(&self) -> u64 {
+		return self.items_done.load(Ordering::Relaxed);
+	}
+
+	pub fn item_done(&self, num_bytes: u64) {
+		self.items_done.fetch_add(1, Ordering::Relaxed);
+		self.bytes_read.fetch_add(num_bytes, Ordering::Relaxed);
+		self.report(false);
+	}
+
+	// Reports the final state, regardless of when the last report was
+	pub fn finish(&self) {
+		self.report(true);
+	}
+
+	fn report(&self, force: bool) {
+		let callback = match &self.callback {
+			Some(callback) => callback,
+			None => return,
+		};
+		// If another thread is reporting right now, this one doesn't need to
+		let mut last_report = match self.last_report.try_lock() {
+			Ok(last_report) => last_report,
+			Err(_) => return,
+		};
+		if !force && last_report.elapsed() < self.report_interval { return }
+		if self.error.lock().unwrap().is_some() { return }
+		*last_report = Instant::now();
+
+		if let Err(e) = callback(self.items_done(), self.items_total,
+				self.bytes_read.load(Ordering::Relaxed)) {
+			self.cancelled.store(true, Ordering::Relaxed);
+			*self.error.lock().unwrap() = Some(e);
+		}
+	}
+
+	/// The error returned by the callback, if any. Only the first call returns it
+	pub fn take_error(&self) -> Option<E> {
+		return self.error.lock().unwrap().take();
+	}
+}
+
+impl<'a> ProgressReporter<'a, PyObject> {
+	/// Reports to a Python callable. The counting threads must not hold the GIL (i.e. run inside
+	/// `allow_threads`), because the callback takes it. If the callable raises, the exception
+	/// instance is kept
+	pub fn python(callback: Option<&'a PyObject>, items_total: u64, cancel: Option<&CancelToken>
+		) -> Self {
+
+		let callback = callback.map(|callback| {
+			move |items_done: u64, items_total: u64, bytes_read: u64| {
+				let gil = Python::acquire_gil();
+				let py = gil.python();
+				return match callback.call1(py, (items_done, items_total, bytes_read)) {
+					Ok(_) => Ok(()),
+					Err(e) => Err(e.instance(py)),
+				};
+			}
+		});
+		return Self::new(callback, items_total, cancel);
+	}
+
+	/// The error to return after the work stopped: the exception raised by the callback, or
+	/// Cancelled if the work was cancelled. Must be called with the GIL held
+	pub fn error(&self, py: Python) -> Option<PyErr> {
+		if let Some(instance) = self.take_error() {
+			return Some(PyErr::from_instance(instance.as_ref(py)));
+		}
+		if self.is_cancelled() {
+			return Some(Cancelled::py_err("cancelled"));
+		}
+		return None;
+	}
+}
+
+#[cfg(test)]
+mod tests {
+	use super::*;
+
+	#[test]
+	fn test_cancel_from_callback() {
+		let reporter = ProgressReporter::new(
+				Some(|items_done, _, _| if items_done >= 3 { Err("stop") } else { Ok(()) }),
+				10, None)
+				.with_report_interval(Duration::from_secs(0));
+		for _ in 0..3 {
+			assert!(!reporter.is_cancelled());
+			reporter.item_done(100);
+		}
+		assert!(reporter.is_cancelled());
+		assert_eq!(reporter.take_error(), Some("stop"));
+		assert_eq!(reporter.take_error(), None);
+	}
+
+	#[test]
+	fn test_cancel_token() {
+		let token = CancelToken::create();
+		let reporter = ProgressReporter::<()>::new(None::<fn(u64, u64, u64) -> Result<(), ()>>,
+				10, Some(&token));
+		reporter.item_done(0);
+		assert!(!reporter.is_cancelled());
+		token.cancel();
+		assert!(reporter.is_cancelled());
+		assert!(reporter.take_error().is_none()); // cancelled from outside, not by the callback
+	}
+}
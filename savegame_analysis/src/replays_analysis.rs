@@ -1,4 +1,4 @@
-use std::path::PathBuf;
+use std::borrow::Cow;
 use std::ops::Deref;
 use itertools::{izip/*, Itertools*/};
 use rayon::prelude::*;
@@ -9,7 +9,9 @@ use crate::util;
 use crate::wife::Wife;
 use crate::wife::wife3;
 use crate::rescore;
+use crate::ScoreTable;
 
+mod cache;
 
 // IMPORTANT ANNOUNCE FOR WIFE POINTS:
 // In this crate, wife points are scaled to a maximum of 1 (not 2 like in the Etterna source code)!
@@ -28,7 +30,7 @@ const NOTE_SUBSET_SEARCH_SPACE_SIZE: u64 = 20;
 #[derive(Default, Debug)]
 pub struct ReplaysAnalysis {
 	#[pyo3(get)]
-	pub score_indices: Vec<u64>, // the indices of the scores whose analysis didn't fail
+	pub score_indices: Vec<u64>, // the score table indices of the scores whose analysis didn't fail
 	#[pyo3(get)]
 	pub manipulations: Vec<f32>,
 	#[pyo3(get)]
@@ -81,7 +83,7 @@ pub struct FastestComboInfo {
 	speed: f32,
 }
 
-#[derive(Default)]
+#[derive(Default, Clone)]
 struct ScoreAnalysis {
 	// a percentage (from 0.0 to 1.0) that says how many notes were hit out of order
 	manipulation: f32,
@@ -101,12 +103,15 @@ struct ScoreAnalysis {
 	offset_buckets: Vec<u64>,
 	
 	wife2_wifescore: f32,
+	// size of the replay file
+	num_replay_bytes: u64,
 
 	timing_info_dependant_analysis: Option<TimingInfoDependantAnalysis>,
 }
 
 // This is the part of score analysis that's dependant on timing info and therefore may not be
 // available for every score
+#[derive(Clone)]
 struct TimingInfoDependantAnalysis {
 	// the note subset (with >= 100 notes) with the highest nps (`speed` = nps)
 	fastest_combo: FastestComboInfo,
@@ -120,7 +125,8 @@ struct TimingInfoDependantAnalysis {
 	new_wifescore: f32,
 }
 
-struct ReplayFileData {
+pub struct ReplayFileData {
+	num_bytes: u64,
 	ticks: Vec<u64>,
 	deviations: Vec<f32>,
 	columns: Vec<u8>,
@@ -160,7 +166,7 @@ pub fn parse_sm_float(string: &[u8]) -> Option<f32> {
 
 // The caller still has to scale the returned nps by the music rate
 // `seconds` must be sorted
-fn find_fastest_note_subset(seconds: &[f32],
+pub fn find_fastest_note_subset(seconds: &[f32],
 		min_num_notes: u64,
 		max_num_notes: u64, // inclusive
 	) -> FastestComboInfo {
@@ -198,7 +204,7 @@ fn find_fastest_note_subset(seconds: &[f32],
 
 // The caller still has to scale the returned nps by the music rate
 // `seconds` must be sorted, and in the same order as `wife_pts`
-fn find_fastest_note_subset_wife_pts(seconds: &[f32],
+pub fn find_fastest_note_subset_wife_pts(seconds: &[f32],
 		min_num_notes: u64,
 		max_num_notes: u64, // inclusive
 		wife_pts: &[f32],
@@ -326,7 +332,7 @@ fn put_deviations_into_buckets(deviations: &[f32]) -> Vec<u64> {
 	return offset_buckets;
 }
 
-fn parse_replay_file(path: &str) -> Option<ReplayFileData> {
+pub fn parse_replay_file(path: &str) -> Option<ReplayFileData> {
 	let bytes = std::fs::read(path).ok()?;
 	let approx_max_num_lines = bytes.len() / 16; // 16 is a pretty good appproximation	
 	
@@ -369,7 +375,9 @@ fn parse_replay_file(path: &str) -> Option<ReplayFileData> {
 		}
 	}
 	
-	return Some(ReplayFileData { ticks, deviations, columns, num_mine_hits, num_hold_drops });
+	return Some(ReplayFileData {
+		num_bytes: bytes.len() as u64, ticks, deviations, columns, num_mine_hits, num_hold_drops
+	});
 }
 
 // Analyze a single score's replay
@@ -387,6 +395,7 @@ fn analyze(path: &str,
 
 	// Construct empty score analysis object into which all the data will be put in
 	let mut score = ScoreAnalysis::default();
+	score.num_replay_bytes = replay_file_data.num_bytes;
 	
 	for (&_tick, &deviation, &column) in izip!(&unsorted_ticks, &unsorted_deviations, &unsorted_columns) {
 		if column < 4 {
@@ -478,6 +487,52 @@ fn analyze(path: &str,
 	return Some(score);
 }
 
+// The score index, scorekey, wifescore, pack, song and rate of a score to analyze
+type ReplayTuple<'a> = (usize, &'a str, f32, &'a str, &'a str, f32);
+// The score index, scorekey, wifescore, replay cache key and analysis of an analyzed score
+type AnalyzedReplay<'a> = (usize, &'a str, f32, cache::ReplayKey, Option<Cow<'a, ScoreAnalysis>>);
+
+// Analyzes the replays of the given scores, or takes the results from the cache for replays that
+// didn't change. Once the reporter is cancelled, the remaining replays are skipped (None). Doesn't
+// touch Python, so that it can run without the GIL
+fn analyze_replays<'a, E: Send>(prefix: &str,
+		tuples: &[ReplayTuple<'a>],
+		timing_info_index: &crate::TimingInfoIndex,
+		cache: &'a cache::ReplayCache,
+		reporter: &crate::ProgressReporter<E>,
+	) -> Vec<Option<AnalyzedReplay<'a>>> {
+	
+	// Only use rayon in release modes cuz rayon makes the call stack practically unviewable
+	#[cfg(debug_assertions)]
+	let tuples_iter = tuples.iter();
+	#[cfg(not(debug_assertions))]
+	let tuples_iter = tuples.par_iter();
+
+	return tuples_iter
+			.map(|&(score_index, scorekey, wifescore, pack, song, rate)| {
+				if reporter.is_cancelled() { return None }
+				
+				let replay_path = prefix.to_string() + scorekey;
+				let song_id = crate::SongId { pack: pack.to_string(), song: song.to_string() };
+				let timing_info_maybe = timing_info_index.get(&song_id);
+				
+				// None if the replay doesn't exist, in which case there's nothing to cache
+				let key = cache::ReplayKey::of(&replay_path, rate, timing_info_maybe);
+				if let (Some(key), Some((cached_key, cached_score))) = (key, cache.get(scorekey)) {
+					if key == *cached_key {
+						reporter.item_done(0); // nothing was read
+						return Some((score_index, scorekey, wifescore, key,
+								cached_score.as_ref().map(Cow::Borrowed)));
+					}
+				}
+				
+				let score = analyze(&replay_path, timing_info_maybe, rate);
+				reporter.item_done(score.as_ref().map_or(0, |score| score.num_replay_bytes));
+				return Some((score_index, scorekey, wifescore, key?, score.map(Cow::Owned)));
+			})
+			.collect();
+}
+
 // This standard deviation function adheres Bessler's correction! (see comment inside)
 fn calculate_standard_deviation(offset_buckets: &[u64], offset_bucket_range: u64) -> f32 {
 	/*
@@ -531,18 +586,22 @@ fn calculate_standard_deviation(offset_buckets: &[u64], offset_bucket_range: u64
 
 #[pymethods]
 impl ReplaysAnalysis {
+	// The replays are analyzed without holding the GIL. `progress` is called with
+	// (replays_done, replays_total, bytes_read) every now and then, from another thread. If it
+	// raises, or if `cancel` is cancelled, the analysis stops and raises that exception or
+	// Cancelled respectively.
+	// If `cache_path` is given, the results of every replay are kept in that file, and only the
+	// replays which are new or changed since the last run are analyzed (see cache.rs)
 	#[new]
-	pub fn create(prefix: &str, scorekeys: Vec<&str>, wifescores: Vec<f32>,
-			packs: Vec<&str>, songs: Vec<&str>,
-			rates: Vec<f32>,
-			songs_root: &str
-		) -> Self {
+	#[args(progress = "None", cancel = "None", cache_path = "None")]
+	pub fn create(py: Python, prefix: &str, table: PyRef<ScoreTable>, score_indices: Vec<usize>,
+			songs: PyRef<crate::SongsTimingIndex>, progress: Option<PyObject>,
+			cancel: Option<PyRef<crate::CancelToken>>, cache_path: Option<&str>
+		) -> PyResult<Self> {
 		
 		// Validate parameters
-		assert_eq!(scorekeys.len(), wifescores.len());
-		assert_eq!(scorekeys.len(), packs.len());
-		assert_eq!(scorekeys.len(), songs.len());
-		assert_eq!(scorekeys.len(), rates.len());
+		let table: &ScoreTable = &table;
+		assert!(score_indices.iter().all(|&i| i < table.scorekeys.len()));
 		
 		// Setup rayon
 		let rayon_config_result = rayon::ThreadPoolBuilder::new()
@@ -556,34 +615,53 @@ impl ReplaysAnalysis {
 		analysis.offset_buckets = vec![0; NUM_OFFSET_BUCKETS as usize];
 		analysis.sub_93_offset_buckets = vec![0; NUM_OFFSET_BUCKETS as usize];
 		
-		let timing_info_index = crate::build_timing_info_index(&PathBuf::from(songs_root));
+		let timing_info_index: &crate::TimingInfoIndex = &songs.index;
 		
-		let tuples: Vec<_> = izip!(scorekeys, wifescores, packs, songs, rates).collect();
-
-		// Only use rayon in release modes cuz rayon makes the call stack practically unviewable
-		#[cfg(debug_assertions)]
-		let tuples_iter = tuples.iter();
-		#[cfg(not(debug_assertions))]
-		let tuples_iter = tuples.par_iter();
-
-		let score_analyses: Vec<_> = tuples_iter
-				// must not filter_map here (need to keep indices accurate)!
-				.map(|(scorekey, wifescore_ref, pack, song, rate)| {
-					let replay_path = prefix.to_string() + scorekey;
-					let song_id = crate::SongId { pack: pack.to_string(), song: song.to_string() };
-					let timing_info_maybe = timing_info_index.get(&song_id);
-					let score = analyze(&replay_path, timing_info_maybe, *rate)?;
-					return Some((scorekey, score, *wifescore_ref));
+		let tuples: Vec<_> = score_indices.iter()
+				.map(|&i| {
+					let chart = table.chart_indices[i] as usize;
+					let pack = table.packs[chart].as_deref().unwrap_or("");
+					let song = table.songs[chart].as_deref().unwrap_or("");
+					(i, table.scorekeys[i].as_str(), table.wifescores[i] as f32, pack, song,
+							table.rates[i] as f32)
 				})
 				.collect();
+
+		let reporter = crate::ProgressReporter::python(progress.as_ref(), tuples.len() as u64,
+				cancel.as_deref());
+		
+		let cache = match cache_path {
+			Some(cache_path) => py.allow_threads(|| cache::load(cache_path)),
+			None => cache::ReplayCache::new(),
+		};
+		
+		let score_analyses = py.allow_threads(|| analyze_replays(prefix, &tuples,
+				timing_info_index, &cache, &reporter));
+		
+		if let Some(error) = reporter.error(py) {
+			return Err(error);
+		}
+		reporter.finish();
+		
+		// Only the replays of this run are written, so that the cache doesn't keep growing with
+		// scores that were deleted or filtered out
+		if let Some(cache_path) = cache_path {
+			let records = score_analyses.iter()
+					.filter_map(|entry| entry.as_ref())
+					.map(|(_, scorekey, _, key, score)| (*scorekey, key, score.as_deref()));
+			if let Err(e) = py.allow_threads(|| cache::write(cache_path, records)) {
+				println!("Warning: couldn't write the replay analysis cache: {:?}", e);
+			}
+		}
 		
 		let mut deviation_mean_sum: f32 = 0.0;
 		let mut longest_mcombo: u64 = 0;
 		let mut longest_mcombo_scorekey: &str = "<no chart>";
-		for (i, score_analysis_option) in score_analyses.into_iter().enumerate() {
-			let (scorekey, score, wifescore) = some_or_continue!(score_analysis_option);
+		for score_analysis_option in score_analyses {
+			let (score_index, scorekey, wifescore, _, score) = some_or_continue!(score_analysis_option);
+			let score: &ScoreAnalysis = some_or_continue!(score.as_deref());
 			
-			analysis.score_indices.push(i as u64);
+			analysis.score_indices.push(score_index as u64);
 			analysis.manipulations.push(score.manipulation);
 			analysis.wife2_wifescores.push(score.wife2_wifescore);
 			deviation_mean_sum += score.deviation_mean;
@@ -608,23 +686,23 @@ impl ReplaysAnalysis {
 				longest_mcombo_scorekey = scorekey;
 			}
 			
-			if let Some(score_analysis) = score.timing_info_dependant_analysis {
-				analysis.timing_info_dependant_score_indices.push(i as u64);
+			if let Some(score_analysis) = &score.timing_info_dependant_analysis {
+				analysis.timing_info_dependant_score_indices.push(score_index as u64);
 				analysis.current_wifescores.push(wifescore);
 				analysis.new_wifescores.push(score_analysis.new_wifescore);
 				
 				if score_analysis.fastest_combo.speed > analysis.fastest_combo.speed {
-					analysis.fastest_combo = score_analysis.fastest_combo;
+					analysis.fastest_combo = score_analysis.fastest_combo.clone();
 					analysis.fastest_combo_scorekey = scorekey.to_string();
 				}
 				
 				if score_analysis.fastest_acc.speed > analysis.fastest_acc.speed {
-					analysis.fastest_acc = score_analysis.fastest_acc;
+					analysis.fastest_acc = score_analysis.fastest_acc.clone();
 					analysis.fastest_acc_scorekey = scorekey.to_string();
 				}
 				
 				if score_analysis.fastest_jack.speed > analysis.fastest_jack.speed {
-					analysis.fastest_jack = score_analysis.fastest_jack;
+					analysis.fastest_jack = score_analysis.fastest_jack.clone();
 					analysis.fastest_jack_scorekey = scorekey.to_string();
 				}
 			}
@@ -641,7 +719,7 @@ impl ReplaysAnalysis {
 		analysis.standard_deviation = calculate_standard_deviation(&analysis.offset_buckets,
 				OFFSET_BUCKET_RANGE);
 		
-		return analysis;
+		return Ok(analysis);
 	}
 } 
 
@@ -721,4 +799,45 @@ mod tests {
 		assert_float_eq!(calculate_standard_deviation(&buckets, 10), 3.00175403186607;
 				epsilon=0.0001);
 	}
+	
+	#[test]
+	fn test_cancel_partway() {
+		let dir = std::env::temp_dir().join("savegame_analysis_test_cancel_partway");
+		std::fs::create_dir_all(&dir).unwrap();
+		let scorekeys: Vec<String> = (0..1000).map(|i| format!("S{}", i)).collect();
+		for scorekey in &scorekeys {
+			let replay = "0 0.010000 0\n48 -0.020000 1\n96 0.100000 2\n";
+			std::fs::write(dir.join(scorekey), replay).unwrap();
+		}
+		let tuples: Vec<ReplayTuple> = scorekeys.iter().enumerate()
+				.map(|(i, scorekey)| (i, scorekey.as_str(), 0.95, "", "", 1.0))
+				.collect();
+		
+		// The callback cancels the analysis after the third replay
+		let reporter = crate::ProgressReporter::new(
+				Some(|replays_done, _, _| if replays_done >= 3 { Err("stop") } else { Ok(()) }),
+				tuples.len() as u64, None)
+				.with_report_interval(std::time::Duration::from_secs(0));
+		let prefix = format!("{}/", dir.to_str().unwrap());
+		let cache = cache::ReplayCache::new();
+		let analyzed = analyze_replays(&prefix, &tuples, &crate::TimingInfoIndex::new(), &cache,
+				&reporter);
+		std::fs::remove_dir_all(&dir).unwrap();
+		
+		assert!(reporter.is_cancelled());
+		assert_eq!(reporter.take_error(), Some("stop"));
+		assert_eq!(analyzed.len(), tuples.len());
+		// Replays that were already being analyzed when the callback cancelled still finish, so
+		// with rayon (release builds) a few more than three can be done
+		let num_analyzed = analyzed.iter().filter(|entry| entry.is_some()).count();
+		assert!(num_analyzed >= 3 && num_analyzed < 100);
+		assert_eq!(num_analyzed as u64, reporter.items_done());
+		#[cfg(debug_assertions)]
+		assert!(analyzed[..3].iter().all(|entry| entry.is_some()) && analyzed[3].is_none());
+		
+		let (_, _, _, _, score) = analyzed.iter().flatten().next().unwrap();
+		let score = score.as_ref().unwrap();
+		assert_eq!(score.notes_per_column, [1, 1, 1, 0]);
+		assert_eq!(score.cbs_per_column, [0, 0, 1, 0]);
+	}
 }
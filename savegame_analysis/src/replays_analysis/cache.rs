@@ -0,0 +1,300 @@
+use std::collections::HashMap;
+use std::time::UNIX_EPOCH;
+use anyhow::{anyhow, Context, Result};
+use super::{ScoreAnalysis, TimingInfoDependantAnalysis, FastestComboInfo, NUM_OFFSET_BUCKETS};
+
+
+// The analysis results of every replay, from the last run. Replay files never change once they're
+// written, so a replay only needs to be analyzed again if its record is missing or its key
+// changed. Replays that couldn't be analyzed are recorded too (as None), so that they aren't
+// tried again and again.
+//
+// File format (little endian): MAGIC, VERSION as u32, number of records as u64, and then the
+// records: scorekey (u16 length + bytes), the ReplayKey fields, and a u8 tag (0 = failed, 1 = ok)
+// followed by the ScoreAnalysis if ok
+
+const MAGIC: &[u8; 4] = b"EGRC";
+// Bump this whenever the results of analyze() change, so that outdated records are dropped
+const VERSION: u32 = 1;
+
+/// Everything a replay's analysis result depends on, apart from the replay analysis code itself
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub struct ReplayKey {
+	size: u64,
+	mtime_nanos: u64,
+	rate_bits: u32,
+	timing_info_fingerprint: u64, // 0 without timing info
+}
+
+impl ReplayKey {
+	// None if the replay file doesn't exist
+	pub fn of(path: &str, rate: f32, timing_info: Option<&crate::TimingInfo>) -> Option<Self> {
+		let metadata = std::fs::metadata(path).ok()?;
+		let mtime_nanos = metadata.modified().ok()?.duration_since(UNIX_EPOCH).ok()?.as_nanos();
+		return Some(Self {
+			size: metadata.len(),
+			mtime_nanos: mtime_nanos as u64,
+			rate_bits: rate.to_bits(),
+			timing_info_fingerprint: timing_info.map_or(0, |timing_info| timing_info.fingerprint()),
+		});
+	}
+}
+
+pub(super) type ReplayCache = HashMap<String, (ReplayKey, Option<ScoreAnalysis>)>;
+
+/// Reads the cache file. A missing, outdated or broken cache is an empty one
+pub(super) fn load(path: &str) -> ReplayCache {
+	let bytes = match std::fs::read(path) {
+		Ok(bytes) => bytes,
+		Err(_) => return ReplayCache::new(), // no cache yet
+	};
+	return match parse(&bytes) {
+		Ok(cache) => cache,
+		Err(e) => {
+			println!("Warning: ignoring the replay analysis cache {}: {:?}", path, e);
+			ReplayCache::new()
+		}
+	};
+}
+
+/// Writes the given records as the new cache file. The file is replaced at once, so that a crash
+/// never leaves half of a cache behind
+pub(super) fn write<'a, I>(path: &str, records: I) -> Result<()>
+		where I: IntoIterator<Item=(&'a str, &'a ReplayKey, Option<&'a ScoreAnalysis>)> {
+
+	let mut bytes = Vec::new();
+	bytes.extend_from_slice(MAGIC);
+	put_u32(&mut bytes, VERSION);
+	let num_records_offset = bytes.len();
+	put_u64(&mut bytes, 0); // filled in below
+
+	let mut num_records: u64 = 0;
+	for (scorekey, key, score) in records {
+		put_u16(&mut bytes, scorekey.len() as u16);
+		bytes.extend_from_slice(scorekey.as_bytes());
+		put_u64(&mut bytes, key.size);
+		put_u64(&mut bytes, key.mtime_nanos);
+		put_u32(&mut bytes, key.rate_bits);
+		put_u64(&mut bytes, key.timing_info_fingerprint);
+		match score {
+			Some(score) => {
+				bytes.push(1);
+				put_score_analysis(&mut bytes, score);
+			},
+			None => bytes.push(0),
+		}
+		num_records += 1;
+	}
+	bytes[num_records_offset..num_records_offset+8].copy_from_slice(&num_records.to_le_bytes());
+
+	let temporary_path = format!("{}.tmp", path);
+	std::fs::write(&temporary_path, &bytes)
+			.with_context(|| format!("Couldn't write {}", temporary_path))?;
+	std::fs::rename(&temporary_path, path)
+			.with_context(|| format!("Couldn't replace {}", path))?;
+	return Ok(());
+}
+
+fn parse(bytes: &[u8]) -> Result<ReplayCache> {
+	let mut reader = Reader { bytes, pos: 0 };
+	if reader.take(4)? != MAGIC {
+		return Err(anyhow!("Not a replay analysis cache"));
+	}
+	let version = reader.u32()?;
+	if version != VERSION {
+		return Err(anyhow!("Cache version is {}, expected {}", version, VERSION));
+	}
+
+	let num_records = reader.u64()?;
+	let mut cache = ReplayCache::with_capacity(num_records.min(1 << 20) as usize);
+	for _ in 0..num_records {
+		let scorekey_len = reader.u16()? as usize;
+		let scorekey = String::from_utf8(reader.take(scorekey_len)?.to_vec())?;
+		let key = ReplayKey {
+			size: reader.u64()?,
+			mtime_nanos: reader.u64()?,
+			rate_bits: reader.u32()?,
+			timing_info_fingerprint: reader.u64()?,
+		};
+		let score = match reader.u8()? {
+			0 => None,
+			1 => Some(reader.score_analysis()?),
+			other => return Err(anyhow!("Invalid record tag {}", other)),
+		};
+		cache.insert(scorekey, (key, score));
+	}
+	return Ok(cache);
+}
+
+fn put_u16(bytes: &mut Vec<u8>, value: u16) { bytes.extend_from_slice(&value.to_le_bytes()) }
+fn put_u32(bytes: &mut Vec<u8>, value: u32) { bytes.extend_from_slice(&value.to_le_bytes()) }
+fn put_u64(bytes: &mut Vec<u8>, value: u64) { bytes.extend_from_slice(&value.to_le_bytes()) }
+fn put_f32(bytes: &mut Vec<u8>, value: f32) { put_u32(bytes, value.to_bits()) }
+
+// LEB128. Most offset bucket counts are tiny, so this makes the records a lot smaller
+fn put_varint(bytes: &mut Vec<u8>, mut value: u64) {
+	while value >= 0x80 {
+		bytes.push((value as u8) | 0x80);
+		value >>= 7;
+	}
+	bytes.push(value as u8);
+}
+
+fn put_fastest_combo_info(bytes: &mut Vec<u8>, info: &FastestComboInfo) {
+	put_f32(bytes, info.start_second);
+	put_f32(bytes, info.end_second);
+	put_u64(bytes, info.length);
+	put_f32(bytes, info.speed);
+}
+
+fn put_score_analysis(bytes: &mut Vec<u8>, score: &ScoreAnalysis) {
+	put_f32(bytes, score.manipulation);
+	put_f32(bytes, score.deviation_mean);
+	put_u64(bytes, score.num_deviation_notes);
+	for i in 0..4 {
+		put_u64(bytes, score.notes_per_column[i]);
+		put_u64(bytes, score.cbs_per_column[i]);
+	}
+	put_u64(bytes, score.longest_mcombo);
+	for &count in &score.offset_buckets {
+		put_varint(bytes, count);
+	}
+	put_f32(bytes, score.wife2_wifescore);
+	put_u64(bytes, score.num_replay_bytes);
+
+	match &score.timing_info_dependant_analysis {
+		Some(analysis) => {
+			bytes.push(1);
+			put_fastest_combo_info(bytes, &analysis.fastest_combo);
+			put_fastest_combo_info(bytes, &analysis.fastest_jack);
+			put_fastest_combo_info(bytes, &analysis.fastest_acc);
+			put_f32(bytes, analysis.new_wifescore);
+		},
+		None => bytes.push(0),
+	}
+}
+
+struct Reader<'a> {
+	bytes: &'a [u8],
+	pos: usize,
+}
+
+impl<'a> Reader<'a> {
+	fn take(&mut self, n: usize) -> Result<&'a [u8]> {
+		let slice = self.bytes.get(self.pos..self.pos + n).ok_or_else(|| anyhow!("Truncated"))?;
+		self.pos += n;
+		return Ok(slice);
+	}
+
+	fn u8(&mut self) -> Result<u8> {
+		return Ok(self.take(1)?[0]);
+	}
+
+	fn u16(&mut self) -> Result<u16> {
+		let mut buf = [0; 2];
+		buf.copy_from_slice(self.take(2)?);
+		return Ok(u16::from_le_bytes(buf));
+	}
+
+	fn u32(&mut self) -> Result<u32> {
+		let mut buf = [0; 4];
+		buf.copy_from_slice(self.take(4)?);
+		return Ok(u32::from_le_bytes(buf));
+	}
+
+	fn u64(&mut self) -> Result<u64> {
+		let mut buf = [0; 8];
+		buf.copy_from_slice(self.take(8)?);
+		return Ok(u64::from_le_bytes(buf));
+	}
+
+	fn f32(&mut self) -> Result<f32> {
+		return Ok(f32::from_bits(self.u32()?));
+	}
+
+	fn varint(&mut self) -> Result<u64> {
+		let mut value: u64 = 0;
+		for shift in (0..64).step_by(7) {
+			let byte = self.u8()?;
+			value |= ((byte & 0x7F) as u64) << shift;
+			if byte & 0x80 == 0 {
+				return Ok(value);
+			}
+		}
+		return Err(anyhow!("Varint too long"));
+	}
+
+	fn fastest_combo_info(&mut self) -> Result<FastestComboInfo> {
+		return Ok(FastestComboInfo {
+			start_second: self.f32()?,
+			end_second: self.f32()?,
+			length: self.u64()?,
+			speed: self.f32()?,
+		});
+	}
+
+	fn score_analysis(&mut self) -> Result<ScoreAnalysis> {
+		let mut score = ScoreAnalysis::default();
+		score.manipulation = self.f32()?;
+		score.deviation_mean = self.f32()?;
+		score.num_deviation_notes = self.u64()?;
+		for i in 0..4 {
+			score.notes_per_column[i] = self.u64()?;
+			score.cbs_per_column[i] = self.u64()?;
+		}
+		score.longest_mcombo = self.u64()?;
+		score.offset_buckets = (0..NUM_OFFSET_BUCKETS).map(|_| self.varint()).collect::<Result<_>>()?;
+		score.wife2_wifescore = self.f32()?;
+		score.num_replay_bytes = self.u64()?;
+
+		score.timing_info_dependant_analysis = match self.u8()? {
+			0 => None,
+			1 => Some(TimingInfoDependantAnalysis {
+				fastest_combo: self.fastest_combo_info()?,
+				fastest_jack: self.fastest_combo_info()?,
+				fastest_acc: self.fastest_combo_info()?,
+				new_wifescore: self.f32()?,
+			}),
+			other => return Err(anyhow!("Invalid timing info tag {}", other)),
+		};
+		return Ok(score);
+	}
+}
+
+#[cfg(test)]
+mod tests {
+	use super::*;
+
+	#[test]
+	fn test_roundtrip() {
+		let mut score = ScoreAnalysis::default();
+		score.manipulation = 0.05;
+		score.notes_per_column = [1, 2, 3, 4];
+		score.offset_buckets = (0..NUM_OFFSET_BUCKETS).map(|i| i * i).collect();
+		score.timing_info_dependant_analysis = Some(TimingInfoDependantAnalysis {
+			fastest_combo: FastestComboInfo { start_second: 1.0, end_second: 2.0, length: 100, speed: 20.0 },
+			fastest_jack: FastestComboInfo::default(),
+			fastest_acc: FastestComboInfo::default(),
+			new_wifescore: 0.93,
+		});
+		let key = ReplayKey { size: 1234, mtime_nanos: 5678, rate_bits: 1.1f32.to_bits(),
+				timing_info_fingerprint: 42 };
+
+		let path = std::env::temp_dir().join("savegame_analysis_test_replay_cache");
+		let path = path.to_str().unwrap();
+		write(path, vec![("S1", &key, Some(&score)), ("S2", &key, None)]).unwrap();
+		let cache = load(path);
+		std::fs::remove_file(path).unwrap();
+
+		assert_eq!(cache.len(), 2);
+		assert!(cache["S2"].1.is_none());
+		let (cached_key, cached_score) = &cache["S1"];
+		let cached_score = cached_score.as_ref().unwrap();
+		assert_eq!(*cached_key, key);
+		assert_eq!(cached_score.notes_per_column, score.notes_per_column);
+		assert_eq!(cached_score.offset_buckets, score.offset_buckets);
+		let timing = cached_score.timing_info_dependant_analysis.as_ref().unwrap();
+		assert_eq!(timing.fastest_combo.length, 100);
+		assert_eq!(timing.new_wifescore, 0.93);
+	}
+}
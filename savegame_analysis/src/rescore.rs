@@ -45,8 +45,9 @@ mod tests {
 	
 	#[test]
 	fn test_rescore() {
-		rescore(&[0.0, 0.1, 0.2, 0.3, 0.4, 0.5],
-				&[0.0, 0.07, 0.11, 0.24, 0.32, 0.50],
-				0, 0);
+		let note_seconds = [vec![0.0, 0.1, 0.2, 0.3, 0.4, 0.5], vec![], vec![], vec![]];
+		let hit_seconds = [vec![0.0, 0.07, 0.11, 0.24, 0.32, 0.50], vec![], vec![], vec![]];
+		rescore::<MatchingScorer, crate::Wife3>(&note_seconds, &hit_seconds, 0, 0);
+		rescore::<NaiveScorer, crate::Wife3>(&note_seconds, &hit_seconds, 0, 0);
 	}
 }
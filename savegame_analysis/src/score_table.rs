@@ -0,0 +1,468 @@
+use std::borrow::Cow;
+use std::collections::HashMap;
+use anyhow::{anyhow, Result};
+use rayon::prelude::*;
+use pyo3::prelude::*;
+use crate::util;
+
+
+// Number of ssrs per score, in the order of the children of <SkillsetSSRs>
+pub const NUM_SSRS: usize = 8;
+// Column order of the judgements column (children of <TapNoteScores>)
+pub const JUDGEMENT_NAMES: [&str; 8] = ["W1", "W2", "W3", "W4", "W5", "Miss", "HitMine", "AvoidMine"];
+// Column order of the holds column (children of <HoldNoteScores>)
+pub const HOLD_NAMES: [&str; 3] = ["LetGo", "Held", "MissedHold"];
+
+// The encodings a ScoreTable can be decoded with, like in score_table.py
+pub const UTF_8: &str = "UTF-8";
+pub const LATIN_1: &str = "ISO-8859-1";
+
+// numpy's representation of NaT (not-a-time) in a datetime64 array. Used for scores without
+// DateTime
+const NAT: i64 = std::i64::MIN;
+
+// The Rust counterpart to the ScoreTable in score_table.py: a columnar table with one row per
+// score. The Python side wraps these columns into numpy arrays. The multi-valued columns (ssrs,
+// judgements, holds) are flattened, e.g. the ssrs of score `i` are at `ssrs[i*8..i*8+8]`
+#[pyclass]
+#[derive(Default, Debug)]
+pub struct ScoreTable {
+	// Chart metadata. Every score points into these via `chart_indices`
+	#[pyo3(get)]
+	pub chart_keys: Vec<Option<String>>,
+	#[pyo3(get)]
+	pub packs: Vec<Option<String>>,
+	#[pyo3(get)]
+	pub songs: Vec<Option<String>>,
+	#[pyo3(get)]
+	pub steps: Vec<Option<String>>,
+	// byte range of each chart in Etterna.xml
+	#[pyo3(get)]
+	pub chart_ranges: Vec<(usize, usize)>,
+
+	#[pyo3(get)]
+	pub scorekeys: Vec<String>,
+	#[pyo3(get)]
+	pub chart_indices: Vec<u32>,
+	#[pyo3(get)]
+	pub rates: Vec<f64>,
+	#[pyo3(get)]
+	pub datetimes: Vec<i64>, // seconds since 1970-01-01 00:00:00, or NAT
+	#[pyo3(get)]
+	pub wifescores: Vec<f64>,
+	#[pyo3(get)]
+	pub ssrs: Vec<f64>, // NUM_SSRS per score, NaN if not available
+	#[pyo3(get)]
+	pub survive_seconds: Vec<f64>,
+	#[pyo3(get)]
+	pub max_combos: Vec<i32>,
+	#[pyo3(get)]
+	pub judgements: Vec<i32>, // JUDGEMENT_NAMES.len() per score
+	#[pyo3(get)]
+	pub holds: Vec<i32>, // HOLD_NAMES.len() per score
+	#[pyo3(get)]
+	pub valid: Vec<bool>,
+	#[pyo3(get)]
+	pub grades: Vec<u8>, // index into grade_names
+	#[pyo3(get)]
+	pub grade_names: Vec<String>,
+	#[pyo3(get)]
+	pub modifier_ids: Vec<u32>, // index into modifiers
+	#[pyo3(get)]
+	pub modifiers: Vec<String>,
+
+	#[pyo3(get)]
+	pub total_session_seconds: i64,
+	#[pyo3(get)]
+	pub total_gameplay_seconds: i64,
+	// The encoding all charts were decoded with, UTF_8 or LATIN_1
+	#[pyo3(get)]
+	pub encoding: String,
+}
+
+struct ParsedChart {
+	key: Option<String>,
+	pack: Option<String>,
+	song: Option<String>,
+	steps: Option<String>,
+	scores: Vec<ParsedScore>,
+}
+
+struct ParsedScore {
+	scorekey: String,
+	rate: f64,
+	datetime: i64,
+	wifescore: f64,
+	ssrs: [f64; NUM_SSRS],
+	survive_seconds: f64,
+	max_combo: i32,
+	judgements: [i32; 8],
+	holds: [i32; 3],
+	valid: bool,
+	grade: String,
+	modifiers: String,
+}
+
+// Days since 1970-01-01 of the given date in the proleptic Gregorian calendar. Algorithm from
+// http://howardhinnant.github.io/date_algorithms.html#days_from_civil
+fn days_from_civil(year: i64, month: i64, day: i64) -> i64 {
+	let year = if month <= 2 { year - 1 } else { year };
+	let era = (if year >= 0 { year } else { year - 399 }) / 400;
+	let year_of_era = year - era * 400;
+	let month_index = if month > 2 { month - 3 } else { month + 9 }; // March is 0
+	let day_of_year = (153 * month_index + 2) / 5 + day - 1;
+	let day_of_era = year_of_era * 365 + year_of_era / 4 - year_of_era / 100 + day_of_year;
+	return era * 146097 + day_of_era - 719468;
+}
+
+// Parses "YYYY-MM-DD HH:MM:SS" into seconds since 1970-01-01 00:00:00. Etterna omits the time
+// part on midnight, so "YYYY-MM-DD" is accepted too
+fn parse_datetime(string: &str) -> Option<i64> {
+	let bytes = string.as_bytes();
+	if bytes.len() != 10 && bytes.len() != 19 { return None }
+
+	let number = |start: usize, end: usize| btoi::btou::<i64>(&bytes[start..end]).ok();
+	let days = days_from_civil(number(0, 4)?, number(5, 7)?, number(8, 10)?);
+	if bytes.len() == 10 {
+		return Some(days * 86400);
+	}
+
+	let seconds = number(11, 13)? * 3600 + number(14, 16)? * 60 + number(17, 19)?;
+	return Some(days * 86400 + seconds);
+}
+
+// Returns the byte ranges of all <Chart> elements in <PlayerScores>. Each range covers exactly one
+// chart, from the opening tag to the end of the closing tag
+pub fn find_chart_ranges(bytes: &[u8]) -> Vec<(usize, usize)> {
+	let mut ranges = Vec::new();
+	let begin = match twoway::find_bytes(bytes, b"<PlayerScores>") {
+		Some(begin) => begin,
+		None => return ranges,
+	};
+	let end = match twoway::find_bytes(&bytes[begin..], b"</PlayerScores>") {
+		Some(end) => begin + end,
+		None => return ranges,
+	};
+
+	let mut pos = begin;
+	while let Some(chart_start) = twoway::find_bytes(&bytes[pos..end], b"<Chart ") {
+		let chart_start = pos + chart_start;
+		let tag_end = match bytes[chart_start..end].iter().position(|&c| c == b'>') {
+			Some(tag_end) => chart_start + tag_end,
+			None => break,
+		};
+
+		let chart_end = if bytes[tag_end - 1] == b'/' { // <Chart .../> without any scores
+			tag_end + 1
+		} else {
+			match twoway::find_bytes(&bytes[tag_end..end], b"</Chart>") {
+				Some(close_tag) => tag_end + close_tag + b"</Chart>".len(),
+				None => break,
+			}
+		};
+		ranges.push((chart_start, chart_end));
+		pos = chart_end;
+	}
+
+	return ranges;
+}
+
+fn find_general_data_int(bytes: &[u8], tag: &str) -> i64 {
+	let open_tag = format!("<{}>", tag);
+	let close_tag = format!("</{}>", tag);
+	return util::extract_bstr(bytes, open_tag.as_bytes(), close_tag.as_bytes())
+			.and_then(|string| btoi::btoi(util::trim_bstr(string)).ok())
+			.unwrap_or(0);
+}
+
+// The encoding is decided once for the whole file, with the same rule as _charts_encoding in
+// score_table.py: UTF_8 if every chart is valid UTF-8, LATIN_1 otherwise. Ranges that are out of
+// bounds are left to the parser to complain about
+fn charts_encoding(bytes: &[u8], chart_ranges: &[(usize, usize)]) -> &'static str {
+	let all_utf8 = chart_ranges.par_iter().all(|&(start, end)| {
+		bytes.get(start..end).map_or(true, |chart_bytes| std::str::from_utf8(chart_bytes).is_ok())
+	});
+	return if all_utf8 { UTF_8 } else { LATIN_1 };
+}
+
+fn decode(bytes: &[u8], latin1: bool) -> Result<Cow<str>> {
+	if latin1 {
+		return Ok(Cow::Owned(bytes.iter().map(|&c| c as char).collect()));
+	}
+	return Ok(Cow::Borrowed(std::str::from_utf8(bytes)?));
+}
+
+fn child_elements<'a, 'input>(node: roxmltree::Node<'a, 'input>)
+		-> impl Iterator<Item=roxmltree::Node<'a, 'input>> {
+	return node.children().filter(|child| child.is_element());
+}
+
+fn parse_number<T: std::str::FromStr>(node: roxmltree::Node) -> Result<T> {
+	let text = node.text().unwrap_or("").trim();
+	return text.parse().map_err(|_| anyhow!("Invalid number in <{}>: {:?}",
+			node.tag_name().name(), text));
+}
+
+fn parse_score(elem: roxmltree::Node, rate: f64) -> Result<ParsedScore> {
+	let mut score = ParsedScore {
+		scorekey: elem.attribute("Key").unwrap_or("").to_owned(),
+		rate,
+		datetime: NAT,
+		wifescore: std::f64::NAN,
+		ssrs: [std::f64::NAN; NUM_SSRS],
+		survive_seconds: 0.0,
+		max_combo: 0,
+		judgements: [0; 8],
+		holds: [0; 3],
+		valid: true,
+		grade: String::new(),
+		modifiers: String::new(),
+	};
+
+	// A single pass over the children, like in the Python parser
+	for child in child_elements(elem) {
+		match child.tag_name().name() {
+			"SSRNormPercent" => score.wifescore = parse_number(child)?,
+			"DateTime" => {
+				let text = child.text().unwrap_or("").trim();
+				score.datetime = parse_datetime(text)
+						.ok_or_else(|| anyhow!("Invalid DateTime: {:?}", text))?;
+			},
+			"SkillsetSSRs" => {
+				for (ssr, ssr_elem) in score.ssrs.iter_mut().zip(child_elements(child)) {
+					*ssr = parse_number(ssr_elem)?;
+				}
+			},
+			"TapNoteScores" => {
+				for judgement_elem in child_elements(child) {
+					let name = judgement_elem.tag_name().name();
+					if let Some(i) = JUDGEMENT_NAMES.iter().position(|&n| n == name) {
+						score.judgements[i] = parse_number(judgement_elem)?;
+					}
+				}
+			},
+			"HoldNoteScores" => {
+				for hold_elem in child_elements(child) {
+					let name = hold_elem.tag_name().name();
+					if let Some(i) = HOLD_NAMES.iter().position(|&n| n == name) {
+						score.holds[i] = parse_number(hold_elem)?;
+					}
+				}
+			},
+			"SurviveSeconds" => score.survive_seconds = parse_number(child)?,
+			"MaxCombo" => score.max_combo = parse_number(child)?,
+			"EtternaValid" => score.valid = child.text() != Some("0"),
+			"Grade" => score.grade = child.text().unwrap_or("").to_owned(),
+			"Modifiers" => score.modifiers = child.text().unwrap_or("").to_owned(),
+			_ => {},
+		}
+	}
+
+	return Ok(score);
+}
+
+// `bytes` must contain exactly one <Chart> element
+fn parse_chart(bytes: &[u8], latin1: bool) -> Result<ParsedChart> {
+	let text = decode(bytes, latin1)?;
+	let doc = roxmltree::Document::parse(&text)?;
+	let chart_elem = doc.root_element();
+
+	let mut chart = ParsedChart {
+		key: chart_elem.attribute("Key").map(str::to_owned),
+		pack: chart_elem.attribute("Pack").map(str::to_owned),
+		song: chart_elem.attribute("Song").map(str::to_owned),
+		steps: chart_elem.attribute("Steps").map(str::to_owned),
+		scores: Vec::new(),
+	};
+
+	for scores_at in child_elements(chart_elem).filter(|e| e.tag_name().name() == "ScoresAt") {
+		let rate = scores_at.attribute("Rate").unwrap_or("");
+		let rate: f64 = rate.trim().parse()
+				.map_err(|_| anyhow!("Invalid ScoresAt rate: {:?}", rate))?;
+		for score_elem in child_elements(scores_at).filter(|e| e.tag_name().name() == "Score") {
+			chart.scores.push(parse_score(score_elem, rate)?);
+		}
+	}
+
+	return Ok(chart);
+}
+
+fn intern(strings: &mut Vec<String>, ids: &mut HashMap<String, u32>, string: String) -> u32 {
+	if let Some(&id) = ids.get(&string) { return id }
+
+	let id = strings.len() as u32;
+	ids.insert(string.clone(), id);
+	strings.push(string);
+	return id;
+}
+
+impl ScoreTable {
+	// Parses the given <Chart> byte ranges of Etterna.xml in parallel. If `chart_ranges` is None,
+	// all charts in <PlayerScores> are parsed. If `encoding` is None, it's decided from the parsed
+	// charts (see charts_encoding)
+	pub fn parse(path: &str, chart_ranges: Option<Vec<(usize, usize)>>, encoding: Option<&str>)
+			-> Result<Self> {
+		let file = std::fs::File::open(path)?;
+		// Safety: undefined behavior if the file is truncated while mapped. Etterna only writes
+		// Etterna.xml when a session ends, and we're done reading long before that
+		let mmap = unsafe { memmap::Mmap::map(&file)? };
+		let bytes: &[u8] = &mmap;
+
+		let chart_ranges = chart_ranges.unwrap_or_else(|| find_chart_ranges(bytes));
+		let encoding = match encoding {
+			None => charts_encoding(bytes, &chart_ranges),
+			Some(UTF_8) => UTF_8,
+			Some(LATIN_1) => LATIN_1,
+			Some(other) => return Err(anyhow!("Unsupported encoding {:?}", other)),
+		};
+		let latin1 = encoding == LATIN_1;
+		let charts = chart_ranges.par_iter()
+				.map(|&(start, end)| {
+					let chart_bytes = bytes.get(start..end)
+							.ok_or_else(|| anyhow!("Chart range {}..{} out of bounds", start, end))?;
+					return parse_chart(chart_bytes, latin1);
+				})
+				.collect::<Result<Vec<ParsedChart>>>()?;
+
+		let mut table = Self::default();
+		let mut grade_ids = HashMap::new();
+		let mut modifier_ids = HashMap::new();
+		for (chart_index, chart) in charts.into_iter().enumerate() {
+			table.chart_keys.push(chart.key);
+			table.packs.push(chart.pack);
+			table.songs.push(chart.song);
+			table.steps.push(chart.steps);
+
+			for score in chart.scores {
+				table.scorekeys.push(score.scorekey);
+				table.chart_indices.push(chart_index as u32);
+				table.rates.push(score.rate);
+				table.datetimes.push(score.datetime);
+				table.wifescores.push(score.wifescore);
+				table.ssrs.extend_from_slice(&score.ssrs);
+				table.survive_seconds.push(score.survive_seconds);
+				table.max_combos.push(score.max_combo);
+				table.judgements.extend_from_slice(&score.judgements);
+				table.holds.extend_from_slice(&score.holds);
+				table.valid.push(score.valid);
+				let grade = intern(&mut table.grade_names, &mut grade_ids, score.grade);
+				table.grades.push(grade as u8);
+				let modifiers = intern(&mut table.modifiers, &mut modifier_ids, score.modifiers);
+				table.modifier_ids.push(modifiers);
+			}
+		}
+		table.chart_ranges = chart_ranges;
+		table.encoding = encoding.to_owned();
+
+		// <GeneralData> comes before <PlayerScores>
+		let general_data_end = twoway::find_bytes(bytes, b"<PlayerScores>").unwrap_or(bytes.len());
+		let general_data = &bytes[..general_data_end];
+		table.total_session_seconds = find_general_data_int(general_data, "TotalSessionSeconds");
+		table.total_gameplay_seconds = find_general_data_int(general_data, "TotalGameplaySeconds");
+
+		return Ok(table);
+	}
+}
+
+#[pymethods]
+impl ScoreTable {
+	// Builds a table with only the columns that ReplaysAnalysis reads, from the Python ScoreTable.
+	// For when that one was loaded from the snapshot, so that Etterna.xml doesn't need to be parsed
+	// again just for the replays analysis. All other columns stay empty
+	#[staticmethod]
+	pub fn from_replays_columns(scorekeys: Vec<String>, chart_indices: Vec<u32>, rates: Vec<f64>,
+			wifescores: Vec<f64>, packs: Vec<Option<String>>, songs: Vec<Option<String>>
+		) -> PyResult<Self> {
+		
+		let num_scores = scorekeys.len();
+		if chart_indices.len() != num_scores || rates.len() != num_scores
+				|| wifescores.len() != num_scores {
+			return Err(PyErr::new::<pyo3::exceptions::ValueError, _>(
+					"The score columns must all have the same length"));
+		}
+		if packs.len() != songs.len()
+				|| chart_indices.iter().any(|&chart| chart as usize >= packs.len()) {
+			return Err(PyErr::new::<pyo3::exceptions::ValueError, _>(
+					"Chart index out of range of the chart columns"));
+		}
+		
+		return Ok(Self { scorekeys, chart_indices, rates, wifescores, packs, songs, ..Self::default() });
+	}
+}
+
+// Python entry point. `chart_ranges` and `encoding` may be None, see ScoreTable::parse
+#[pyfunction]
+pub fn parse_etterna_xml(path: &str, chart_ranges: Option<Vec<(usize, usize)>>,
+		encoding: Option<&str>) -> PyResult<ScoreTable> {
+	return ScoreTable::parse(path, chart_ranges, encoding)
+			.map_err(|e| PyErr::new::<pyo3::exceptions::ValueError, _>(format!("{:?}", e)));
+}
+
+
+#[cfg(test)]
+mod tests {
+	use super::*;
+
+	#[test]
+	fn test_parse_datetime() {
+		assert_eq!(parse_datetime("1970-01-01 00:00:00"), Some(0));
+		assert_eq!(parse_datetime("2019-05-24 13:22:01"), Some(1558704121));
+		assert_eq!(parse_datetime("2000-02-29"), Some(951782400));
+		assert_eq!(parse_datetime("2000-02-29 2"), None);
+	}
+
+	#[test]
+	fn test_find_chart_ranges() {
+		let xml: &[u8] = br#"<Stats><Playlists><Chart Key="x"/></Playlists><PlayerScores><Chart Key="a"><ScoresAt Rate="1.0"/></Chart><Chart Key="b"/></PlayerScores></Stats>"#;
+		let ranges = find_chart_ranges(xml);
+		assert_eq!(ranges.len(), 2);
+		assert_eq!(&xml[ranges[0].0..ranges[0].1], &br#"<Chart Key="a"><ScoresAt Rate="1.0"/></Chart>"#[..]);
+		assert_eq!(&xml[ranges[1].0..ranges[1].1], &br#"<Chart Key="b"/>"#[..]);
+	}
+
+	#[test]
+	fn test_parse_chart() {
+		let chart = parse_chart(br#"<Chart Key="X1" Pack="P &amp; Q" Song="S" Steps="Hard">
+			<ScoresAt Rate="1.5">
+				<Score Key="S1">
+					<SSRNormPercent>0.93</SSRNormPercent>
+					<DateTime>2020-01-02 03:04:05</DateTime>
+					<SkillsetSSRs><Overall>20.5</Overall><Stream>19</Stream></SkillsetSSRs>
+					<TapNoteScores><W1>10</W1><Miss>2</Miss></TapNoteScores>
+					<Grade>Tier04</Grade>
+					<EtternaValid>0</EtternaValid>
+				</Score>
+			</ScoresAt>
+		</Chart>"#, false).unwrap();
+
+		assert_eq!(chart.pack.as_deref(), Some("P & Q"));
+		assert_eq!(chart.scores.len(), 1);
+		let score = &chart.scores[0];
+		assert_eq!(score.scorekey, "S1");
+		assert_eq!(score.rate, 1.5);
+		assert_eq!(score.wifescore, 0.93);
+		assert_eq!(score.ssrs[1], 19.0);
+		assert!(score.ssrs[2].is_nan());
+		assert_eq!(score.judgements, [10, 0, 0, 0, 0, 2, 0, 0]);
+		assert_eq!(score.grade, "Tier04");
+		assert!(!score.valid);
+	}
+
+	#[test]
+	fn test_charts_encoding() {
+		let xml: &[u8] = b"<Chart Song=\"S\xc3\xb3ng\"/><Chart Song=\"S\xf3ng\"/>";
+		let split = xml.iter().position(|&c| c == b'>').unwrap() + 1;
+		let utf8_chart = (0, split);
+		let latin1_chart = (split, xml.len());
+		assert_eq!(charts_encoding(xml, &[utf8_chart]), UTF_8);
+		assert_eq!(charts_encoding(xml, &[utf8_chart, latin1_chart]), LATIN_1);
+
+		// Either way every chart is decoded the same, whatever its own bytes are
+		let song = |range: (usize, usize), latin1| parse_chart(&xml[range.0..range.1], latin1)
+				.unwrap().song.unwrap();
+		assert_eq!(song(utf8_chart, false), "Sóng");
+		assert_eq!(song(utf8_chart, true), "SÃ³ng");
+		assert_eq!(song(latin1_chart, true), "Sóng");
+		assert!(parse_chart(&xml[latin1_chart.0..latin1_chart.1], false).is_err());
+	}
+}
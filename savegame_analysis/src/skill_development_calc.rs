@@ -2,7 +2,7 @@ use itertools::Itertools;
 use pyo3::prelude::*;
 
 
-mod calc_rating {
+pub mod calc_rating {
 	fn erfc(x: f32) -> f32 { libm::erfc(x as f64) as f32 }
 	
 	fn is_rating_okay(rating: f32, ssrs: &[f32]) -> bool {
@@ -2,6 +2,7 @@ use std::path::{PathBuf, Path};
 use std::collections::HashMap;
 use anyhow::{anyhow, Context, Result};
 use walkdir::WalkDir;
+use pyo3::prelude::*;
 use crate::util::{trim_bstr, extract_bstr};
 use crate::{some_or_continue, ok_or_continue};
 
@@ -88,6 +89,25 @@ impl TimingInfo {
 		
 		return seconds_vec;
 	}
+
+	/// A hash of the bpms, which changes whenever the conversion from ticks to seconds changes.
+	/// FNV-1a, because std's hasher isn't guaranteed to stay the same across Rust versions, and
+	/// this is stored on disk (see replays_analysis/cache.rs). Never 0
+	pub fn fingerprint(&self) -> u64 {
+		let mut hash: u64 = 0xcbf29ce484222325;
+		let mut feed = |value: f64| {
+			for &byte in &value.to_bits().to_le_bytes() {
+				hash ^= byte as u64;
+				hash = hash.wrapping_mul(0x100000001b3);
+			}
+		};
+		feed(self.first_bpm);
+		for change in &self.changes {
+			feed(change.beat);
+			feed(change.bpm);
+		}
+		return hash.max(1);
+	}
 }
 
 fn find_sm_like_from_root(base: &Path) -> Vec<PathBuf> {
@@ -161,6 +181,28 @@ pub fn build_timing_info_index(songs_root: &Path) -> TimingInfoIndex {
 } 
 
 
+/// The timing info of every song in a Songs folder. Building it reads every .sm file, so it's built
+/// once and passed to every ReplaysAnalysis of the same Songs folder
+#[pyclass]
+pub struct SongsTimingIndex {
+	pub index: TimingInfoIndex,
+}
+
+#[pymethods]
+impl SongsTimingIndex {
+	// Reads the .sm files without holding the GIL
+	#[new]
+	pub fn create(py: Python, songs_root: &str) -> Self {
+		let index = py.allow_threads(|| build_timing_info_index(&PathBuf::from(songs_root)));
+		return Self { index };
+	}
+	
+	#[getter]
+	pub fn num_songs(&self) -> usize {
+		return self.index.len();
+	}
+}
+
 #[cfg(test)]
 mod tests {
 	use super::*; // Use all functions above
@@ -183,4 +225,22 @@ mod tests {
 					epsilon=0.001);
 		}
 	}
+	
+	#[test]
+	fn test_fingerprint() {
+		let timing_info = TimingInfo::from_sm_bpm_string(b"0.000=120.000,4.000=240.000").unwrap();
+		// The fingerprint is stored in the replay analysis cache, so it mustn't change between
+		// builds or Rust versions
+		assert_eq!(timing_info.fingerprint(), 14395443575635828389);
+		
+		let same = TimingInfo::from_sm_bpm_string(b"4.000=240.000,0.000=120.000").unwrap();
+		assert_eq!(same.fingerprint(), timing_info.fingerprint());
+		
+		let other_bpm = TimingInfo::from_sm_bpm_string(b"0.000=120.000,4.000=241.000").unwrap();
+		let other_beat = TimingInfo::from_sm_bpm_string(b"0.000=120.000,8.000=240.000").unwrap();
+		let no_changes = TimingInfo::from_sm_bpm_string(b"0.000=120.000").unwrap();
+		assert_ne!(other_bpm.fingerprint(), timing_info.fingerprint());
+		assert_ne!(other_beat.fingerprint(), timing_info.fingerprint());
+		assert_ne!(no_changes.fingerprint(), timing_info.fingerprint());
+	}
 }
@@ -38,6 +38,7 @@ pub fn wife3(deviation: f32) -> f32 { Wife3::calc(deviation) }
 #[cfg(test)]
 mod tests {
 	use super::*; // Use all functions above
+	use super::wife3::ett_erf;
 	use crate::assert_float_eq;
 	
 	#[test]
@@ -2,7 +2,7 @@ use super::Wife;
 
 
 // erf approxmation function, as used in Etterna (same file as in the link below)
-fn ett_erf(x: f32) -> f32 {
+pub(super) fn ett_erf(x: f32) -> f32 {
 	let exp = |x| std::f32::consts::E.powf(x);
 	
 	const A1: f32 = 0.254829592;
@@ -0,0 +1,72 @@
+from typing import *
+
+import numpy as np
+
+
+"""
+This file holds the ActivityCube, a dense aggregate of a set of scores by day, hour of day and main
+skillset. It's built once with a few vectorized bincounts, after which all plots that bucket scores
+by time (plays per hour, hours per week, skillsets per week...) are cheap sums over some of its
+axes
+"""
+
+# The ScoreTable columns the cube is built from
+COLUMNS = ("datetimes", "ssrs", "survive_seconds")
+
+# Index of the skillset axis for scores without SkillsetSSRs. 0-6 are the skillsets without
+# Overall, like in util.skillsets
+NO_SKILLSET = 7
+NUM_SKILLSETS = 8
+
+# Returns the index of the highest skillset (0-6, without Overall) for every row of the given SSRs,
+# or NO_SKILLSET for scores without SkillsetSSRs
+def main_skillsets(ssrs: np.ndarray) -> np.ndarray:
+	has_ssrs = ~np.isnan(ssrs[:, 0])
+	skillsets = np.full(len(ssrs), NO_SKILLSET)
+	skillsets[has_ssrs] = np.argmax(np.nan_to_num(ssrs[has_ssrs, 1:], nan=-np.inf), axis=1)
+	return skillsets
+
+class ActivityCube:
+	def __init__(self, datetimes: np.ndarray, ssrs: np.ndarray, survive_seconds: np.ndarray):
+		# Scores without a date can't be put anywhere
+		has_date = ~np.isnat(datetimes)
+		datetimes, ssrs, survive_seconds = datetimes[has_date], ssrs[has_date], survive_seconds[has_date]
+
+		score_days = datetimes.astype("datetime64[D]")
+		# Only days with at least one score get a slice, so that a single bogus date can't blow up
+		# the cube
+		self.days, day_indices = np.unique(score_days, return_inverse=True) # datetime64[D]
+		hours = (datetimes - score_days) // np.timedelta64(1, "h")
+
+		skillsets = main_skillsets(ssrs)
+		has_ssrs = skillsets != NO_SKILLSET
+
+		shape = (len(self.days), 24, NUM_SKILLSETS)
+		cells = np.ravel_multi_index((day_indices.ravel(), hours, skillsets), shape)
+		def aggregate(weights=None):
+			return np.bincount(cells, weights, minlength=np.prod(shape)).reshape(shape)
+
+		# All of these have the shape (days, hour of day, main skillset)
+		self.plays = aggregate() # number of scores
+		self.seconds = aggregate(survive_seconds) # gameplay seconds (SurviveSeconds)
+		self.ssr_sums = aggregate(np.where(has_ssrs, ssrs[:, 0], 0)) # sum of Overall SSRs
+
+	# Sums the given per-day values into weeks, starting at the first day. Returns the start day of
+	# every week (datetime64[D]) and the sums. Weeks without scores are included, with a sum of 0
+	def weekly(self, per_day: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+		if len(self.days) == 0:
+			return self.days, per_day
+
+		weeks = (self.days - self.days[0]).astype(int) // 7
+		sums = np.bincount(weeks, weights=per_day).astype(per_day.dtype)
+		week_starts = self.days[0] + 7 * np.arange(len(sums))
+		return week_starts, sums
+
+	# Returns the ISO year and ISO week number of every day
+	def iso_weeks(self) -> Tuple[np.ndarray, np.ndarray]:
+		weekdays = (self.days.astype(int) + 3) % 7 # Monday is 0, 1970-01-01 was a Thursday
+		# The ISO year and week are the ones of the Thursday in the same week
+		thursdays = self.days + (3 - weekdays)
+		years = thursdays.astype("datetime64[Y]")
+		weeks = (thursdays - years.astype("datetime64[D]")).astype(int) // 7 + 1
+		return years.astype(int) + 1970, weeks
@@ -4,3 +4,13 @@ from typing import *
 # everywhere, because it was getting real annoying it not being
 # accessible from everywhere.
 app: Any = None
+
+# Stand-in for the main.Application where there's no GUI (worker processes, the command line), with
+# the state that the data generators read
+class HeadlessApp:
+	def __init__(self, prefs, blacklisted_charts):
+		self.prefs = prefs
+		self.blacklisted_charts = blacklisted_charts
+	
+	def is_blacklisted(self, songname: str, stepstype: str) -> bool:
+		return (songname, stepstype) in self.blacklisted_charts
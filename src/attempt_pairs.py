@@ -0,0 +1,51 @@
+from typing import *
+
+import numpy as np
+
+
+"""
+This file holds AttemptPairs, which pairs up every score with the next attempt of the same chart
+on the same rate (i.e. the next score in the same ScoresAt). The scores are lexsorted by chart,
+rate and datetime once, after which the idle time, wifescore change and SSR change of all pairs
+are computed in one vectorized pass. Retry analyses are then just masks and reductions over the
+pair arrays
+"""
+
+# The ScoreTable columns the pairs are built from
+COLUMNS = ("chart_indices", "rates", "datetimes", "survive_seconds", "wifescores", "ssrs")
+
+class AttemptPairs:
+	# `scores` are score table indices, and the other arrays hold the respective values of those
+	# scores. They don't need to be sorted
+	def __init__(self, scores: np.ndarray, chart_indices: np.ndarray, rates: np.ndarray,
+			datetimes: np.ndarray, survive_seconds: np.ndarray, wifescores: np.ndarray,
+			ssrs: np.ndarray):
+		# The last key is the primary one. Scores with the same chart, rate and datetime keep their
+		# order
+		order = np.lexsort((datetimes, rates, chart_indices))
+		chart_indices, rates = chart_indices[order], rates[order]
+
+		is_group_start = np.ones(len(order), dtype=bool)
+		is_group_start[1:] = (chart_indices[1:] != chart_indices[:-1]) | (rates[1:] != rates[:-1])
+		# 0 for the first attempt in a ScoresAt, 1 for the first retry and so on
+		group_starts = np.maximum.accumulate(np.where(is_group_start, np.arange(len(order)), 0))
+		attempt_numbers = np.arange(len(order)) - group_starts
+
+		is_retry = ~is_group_start
+		first, second = order[:-1][is_retry[1:]], order[is_retry]
+
+		# All of these have one entry per pair
+		self.first_scores = scores[first] # score table indices
+		self.second_scores = scores[second] # score table indices
+		# How often the chart was played on this rate before the second score. 1 for the first
+		# retry
+		self.attempt_numbers = attempt_numbers[is_retry]
+		# Seconds between the end of the first score and the start of the second one
+		self.idle_seconds = ((datetimes[second] - datetimes[first]) / np.timedelta64(1, "s")
+				- survive_seconds[first])
+		self.wifescore_deltas = wifescores[second] - wifescores[first]
+		# NaN if one of the scores doesn't have SkillsetSSRs
+		self.ssr_deltas = ssrs[second, 0] - ssrs[first, 0]
+
+	def __len__(self) -> int:
+		return len(self.first_scores)
@@ -0,0 +1,272 @@
+from typing import *
+
+import os, json, argparse, logging, traceback
+from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+import util
+import app
+import snapshot
+import score_table
+import replays_analysis
+import generator_engine
+import headless
+from process_pool import DEFAULT_PROCESSES
+
+
+"""
+This file analyzes a whole directory of profiles at once, e.g. for community statistics, without a
+GUI. Every directory with an Etterna.xml in it is a profile. Its replays are taken from a ReplaysV2
+directory next to the Etterna.xml, or from the one in the Save directory above it, like in an
+Etterna installation (Save/LocalProfiles/<profile>/Etterna.xml and Save/ReplaysV2). All profiles
+share one Songs directory.
+
+Profiles are analyzed in a pool of worker processes. The summary of every profile is written to
+<output>/profiles/<profile>.json as soon as it's done, and profiles whose summary is up to date are
+skipped, so a run that crashed or was cancelled continues where it stopped. At the end, the
+summaries of all profiles are merged into cross-profile tables (rating timelines, accuracy
+distributions, CB ratios and one row of totals per profile).
+
+The timing info index of the Songs directory is built once in the main process before the pool
+starts. Where worker processes are forked (Linux), they inherit it; otherwise every worker
+process builds it once when it starts.
+
+	python src/batch.py path/to/profiles --songs-root path/to/Songs --output stats
+"""
+
+PROFILES_DIR = "profiles"
+
+# headless.OUTPUTS behind the merged tables
+TABLE_OUTPUTS = {
+	"rating_timelines": "skillset_development",
+	"accuracy_distributions": "wifescore_frequencies",
+}
+
+DATETIME_COLUMNS = {"datetime", "first_play", "last_play"}
+
+@dataclass
+class Profile:
+	name: str # unique within the profiles directory, usable as a file name
+	xml_path: str
+	replays_dir: Optional[str]
+
+def find_profiles(root: str) -> List[Profile]:
+	profiles = []
+	for directory, _, files in os.walk(root):
+		if "Etterna.xml" not in files: continue
+
+		candidates = [os.path.join(directory, "ReplaysV2"),
+				os.path.join(directory, "..", "..", "ReplaysV2")]
+		replays_dir = next((os.path.normpath(path) for path in candidates if os.path.isdir(path)),
+				None)
+
+		relative_path = os.path.relpath(directory, root)
+		if relative_path == ".":
+			relative_path = os.path.basename(os.path.abspath(root))
+		name = relative_path.replace(os.sep, "__")
+
+		profiles.append(Profile(name, os.path.join(directory, "Etterna.xml"), replays_dir))
+	return sorted(profiles, key=lambda profile: profile.name)
+
+def _summary_path(output: str, profile: Profile) -> str:
+	return os.path.join(output, PROFILES_DIR, f"{profile.name}.json")
+
+def _error_path(output: str, profile: Profile) -> str:
+	return os.path.join(output, PROFILES_DIR, f"{profile.name}.error.txt")
+
+# Whether the profile has a summary of its current Etterna.xml already
+def is_done(output: str, profile: Profile) -> bool:
+	try:
+		with open(_summary_path(output, profile)) as f:
+			summary = json.load(f)
+		return summary["fingerprint"] == snapshot.fingerprint(profile.xml_path)
+	except (OSError, ValueError):
+		return False
+
+# Writes to a temporary file first, so that a crash never leaves a half-written summary behind
+def _write_json_atomically(path: str, data: Any) -> None:
+	temporary_path = path + ".tmp"
+	with open(temporary_path, "w") as f:
+		json.dump(data, f, allow_nan=False)
+	os.replace(temporary_path, path)
+
+def _table_values(table: Dict[str, np.ndarray]) -> Dict[str, List[Any]]:
+	return {column: headless.column_values(values) for column, values in table.items()}
+
+# Fraction of notes that were combo breakers, by column, from the replays analysis
+def _cb_ratios(analysis: replays_analysis.ReplaysAnalysis) -> Dict[str, np.ndarray]:
+	notes = np.array(analysis.notes_per_column, dtype=float)
+	cbs = np.array(analysis.cbs_per_column, dtype=float)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		ratios = cbs / notes
+	return {"column": np.arange(1, len(notes) + 1), "notes": notes, "cbs": cbs, "cb_ratio": ratios}
+
+# Analyzes one profile and returns its summary. Runs in a worker process
+def summarize(profile: Profile, songs_index) -> Dict[str, Any]:
+	xml_fingerprint = snapshot.fingerprint(profile.xml_path)
+	table = score_table.load(profile.xml_path)
+	analysis = None
+	if profile.replays_dir is not None and songs_index is not None:
+		# No replays cache: the profiles are analyzed in parallel, and would all write the same file
+		analysis = replays_analysis.analyze(table, profile.replays_dir, songs_index, cache_path=None)
+	view = generator_engine.prepare(table, analysis)
+
+	outputs = [output for output in headless.OUTPUTS if output.name in TABLE_OUTPUTS.values()]
+	results = headless.compute(view, analysis, outputs)
+	tables = {name: results[output_name] for name, output_name in TABLE_OUTPUTS.items()}
+
+	ratings = tables["rating_timelines"]
+	datetimes = view.datetimes[~np.isnat(view.datetimes)]
+	totals = {
+		"scores": len(view.scores),
+		"play_hours": float(view.survive_seconds.sum() / 3600),
+		"first_play": datetimes.min() if len(datetimes) > 0 else None,
+		"last_play": datetimes.max() if len(datetimes) > 0 else None,
+		"overall_rating": float(ratings["overall"][-1]) if len(ratings["overall"]) > 0 else None,
+		"analyzed_replays": 0,
+		"cb_ratio": None,
+		"standard_deviation": None,
+	}
+	if analysis is not None:
+		tables["cb_ratios"] = _cb_ratios(analysis)
+		totals["analyzed_replays"] = len(analysis.scores)
+		notes = sum(analysis.notes_per_column)
+		totals["cb_ratio"] = sum(analysis.cbs_per_column) / notes if notes > 0 else None
+		totals["standard_deviation"] = float(analysis.standard_deviation)
+	for key in ("first_play", "last_play"):
+		if totals[key] is not None:
+			totals[key] = headless.column_values(np.array([totals[key]]))[0]
+
+	return {
+		"profile": asdict(profile),
+		"fingerprint": xml_fingerprint,
+		"totals": totals,
+		"tables": {name: _table_values(table) for name, table in tables.items()},
+	}
+
+# State of a worker process, set up by _init_process
+_songs_index = None
+
+def _init_process(prefs, blacklisted_charts) -> None:
+	global _songs_index
+	app.app = app.HeadlessApp(prefs, blacklisted_charts)
+	if prefs.songs_root is not None:
+		# Already there if the process was forked off the main process
+		_songs_index = replays_analysis.songs_timing_index(prefs.songs_root)
+
+def _summarize(profile: Profile) -> Dict[str, Any]:
+	return summarize(profile, _songs_index)
+
+# Analyzes all profiles that aren't done yet in `processes` worker processes, and writes their
+# summaries. Returns the number of profiles that failed
+def analyze_profiles(profiles: Sequence[Profile], output: str, processes: int=DEFAULT_PROCESSES
+		) -> int:
+	os.makedirs(os.path.join(output, PROFILES_DIR), exist_ok=True)
+	pending = [profile for profile in profiles if not is_done(output, profile)]
+	util.logger.info(f"{len(profiles) - len(pending)} of {len(profiles)} profiles are done already")
+	if len(pending) == 0:
+		return 0
+
+	prefs = app.app.prefs
+	if prefs.songs_root is not None:
+		util.logger.info(f"Building the timing info index of {prefs.songs_root}")
+		replays_analysis.songs_timing_index(prefs.songs_root)
+
+	num_failed = 0
+	with ProcessPoolExecutor(max_workers=min(processes, len(pending)), initializer=_init_process,
+			initargs=(prefs, app.app.blacklisted_charts)) as executor:
+		futures = {executor.submit(_summarize, profile): profile for profile in pending}
+		for i, future in enumerate(as_completed(futures)):
+			profile = futures[future]
+			try:
+				summary = future.result()
+			except BrokenProcessPool:
+				# A worker process died (e.g. a crash in savegame_analysis), which takes down the
+				# whole pool. The profiles that are done stay done
+				util.logger.error("A worker process died, run again to continue with the rest")
+				raise
+			except Exception:
+				num_failed += 1
+				util.logger.exception(f"Couldn't analyze profile {profile.name}")
+				with open(_error_path(output, profile), "w") as f:
+					f.write(traceback.format_exc())
+				continue
+
+			_write_json_atomically(_summary_path(output, profile), summary)
+			if os.path.exists(_error_path(output, profile)):
+				os.remove(_error_path(output, profile))
+			util.logger.info(f"[{i + 1}/{len(pending)}] {profile.name}")
+	return num_failed
+
+def _merged_column(name: str, values: List[Any]) -> np.ndarray:
+	if name in DATETIME_COLUMNS:
+		return np.array(values, dtype="datetime64[s]")
+	# Numbers with missing values in between become floats with NaNs
+	is_number = [value is None or isinstance(value, (int, float)) for value in values]
+	if all(is_number) and not all(isinstance(value, int) for value in values):
+		return np.array([np.nan if value is None else value for value in values], dtype=float)
+	return np.array(values)
+
+# Merges the summaries of the given profiles into tables with a "profile" column in front. Profiles
+# without a summary are left out
+def merge(profiles: Sequence[Profile], output: str) -> Dict[str, Dict[str, np.ndarray]]:
+	merged: Dict[str, Dict[str, List[Any]]] = {}
+	def append(table_name: str, profile_name: str, table: Dict[str, List[Any]]):
+		columns = merged.setdefault(table_name, {"profile": []})
+		num_rows = len(next(iter(table.values()), []))
+		columns["profile"].extend([profile_name] * num_rows)
+		for column, values in table.items():
+			columns.setdefault(column, []).extend(values)
+
+	for profile in profiles:
+		try:
+			with open(_summary_path(output, profile)) as f:
+				summary = json.load(f)
+		except FileNotFoundError:
+			continue
+		append("profiles", profile.name, {key: [value] for key, value in summary["totals"].items()})
+		for table_name, table in summary["tables"].items():
+			append(table_name, profile.name, table)
+
+	return {
+		table_name: {column: _merged_column(column, values) for column, values in columns.items()}
+		for table_name, columns in merged.items()
+	}
+
+def parse_args(argv: Optional[Sequence[str]]=None) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description="Analyzes a directory of Etterna profiles and "
+			+ "merges the results into cross-profile tables")
+	parser.add_argument("profiles", help="directory that contains the profiles")
+	headless.add_settings_arguments(parser, exclude=("xml_path", "replays_dir", "trace"))
+	parser.add_argument("--format", choices=headless.FORMATS, default="csv",
+			help="format of the merged tables (default: %(default)s)")
+	parser.add_argument("--output", default="etterna-graph-batch", help="output directory")
+	parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES,
+			help="number of profiles analyzed at once (default: %(default)s)")
+	return parser.parse_args(argv)
+
+def main(argv: Optional[Sequence[str]]=None) -> None:
+	logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+	args = parse_args(argv)
+
+	prefs = headless.settings_from_args(args)
+	if prefs.songs_root is None:
+		util.logger.warning("No --songs-root given, the replays won't be analyzed")
+	app.app = app.HeadlessApp(prefs, headless.load_blacklisted_charts(args.unranked))
+
+	profiles = find_profiles(args.profiles)
+	num_failed = analyze_profiles(profiles, args.output, args.processes)
+
+	tables = merge(profiles, args.output)
+	headless.WRITERS[args.format](tables, args.output, basename="merged")
+	num_merged = len(tables["profiles"]["profile"]) if "profiles" in tables else 0
+	util.logger.info(f"Merged {num_merged} profiles into {args.output}")
+	if num_failed > 0:
+		raise SystemExit(f"{num_failed} profiles failed, see the .error.txt files in "
+				+ os.path.join(args.output, PROFILES_DIR))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,267 @@
+from typing import *
+
+import os, sys, json, time, shutil, logging, argparse, platform, resource, statistics, subprocess
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+import util
+import app
+import memo
+import snapshot
+import score_table
+import replays_analysis
+import generator_engine
+import headless
+import synthetic
+from process_pool import DEFAULT_PROCESSES
+
+
+"""
+This file is the end-to-end benchmark. It times every stage of an analysis on a synthetic corpus
+(see synthetic.py) or on a real Etterna installation: parsing the Etterna.xml, saving and loading
+the snapshot, filtering the scores, building the timing info index of the Songs folder, the
+replays analysis in savegame_analysis (without and with its replays cache), and every data
+generator on its own. Each stage is run --repeat times with the memo cleared before every run, so
+that nothing is served from a cache, except in replays_analysis_cached.
+
+For every stage, the wall times of all runs and the peak RSS are written into a JSON report,
+together with the commit and the machine it was made on. Two reports are compared with --compare:
+
+	python src/benchmark.py --scores 100000 --output before.json
+	python src/benchmark.py --scores 100000 --output after.json --compare before.json
+
+Generated corpora are kept in --corpus-cache and reused by later runs with the same arguments.
+The stages that need savegame_analysis are skipped (and marked as such in the report) if it
+isn't available.
+"""
+
+REPORT_VERSION = 1
+CORPUS_CACHE = "benchmark-corpora"
+# Written into a generated corpus once it's complete, so that an interrupted generation is redone
+_CORPUS_DONE_FILE = "complete"
+
+def _has_savegame_analysis() -> bool:
+	try:
+		import savegame_analysis
+		return True
+	except ImportError:
+		return False
+
+# Resets the peak RSS of this process to the current RSS, if the OS supports it (Linux). Returns
+# whether it did
+def _reset_peak_rss() -> bool:
+	try:
+		with open("/proc/self/clear_refs", "w") as f:
+			f.write("5")
+		return True
+	except OSError:
+		return False
+
+# Peak RSS of this process in MB, since the last _reset_peak_rss()
+def _peak_rss_mb() -> float:
+	try:
+		with open("/proc/self/status") as f:
+			for line in f:
+				if line.startswith("VmHWM:"):
+					return int(line.split()[1]) / 1024
+	except OSError:
+		pass
+	# ru_maxrss can't be reset, and is in KB on Linux but in bytes on macOS
+	max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+class Benchmark:
+	def __init__(self, repeat: int):
+		self.repeat = repeat
+		self.stages: Dict[str, Dict[str, Any]] = {}
+		self.peak_rss_resets = True
+
+	# Runs fn `repeat` times and records the stage. `setup` is run before every run, untimed.
+	# Returns the result of the last run
+	def run(self, name: str, fn: Callable[[], Any], setup: Callable[[], Any]=lambda: None) -> Any:
+		times = []
+		peak_rss = 0.0
+		result = None
+		for _ in range(self.repeat):
+			(setup)()
+			result = None # so that the result of the previous run doesn't count into the peak RSS
+			self.peak_rss_resets &= _reset_peak_rss()
+			start = time.perf_counter()
+			result = (fn)()
+			times.append(time.perf_counter() - start)
+			peak_rss = max(peak_rss, _peak_rss_mb())
+
+		self.stages[name] = {
+			"seconds": times,
+			"min": min(times),
+			"median": statistics.median(times),
+			"peak_rss_mb": round(peak_rss, 1),
+		}
+		util.logger.info(f"{name}: {statistics.median(times) * 1000:.1f} ms")
+		return result
+
+	def skip(self, name: str, reason: str) -> None:
+		self.stages[name] = {"skipped": reason}
+		util.logger.info(f"{name}: skipped ({reason})")
+
+# Times all stages on the corpus
+def run_stages(bench: Benchmark, corpus: synthetic.Corpus, processes: int) -> None:
+	bench.run("parse_xml", lambda: score_table.load(corpus.xml_path), setup=memo.memo.clear)
+	table = score_table.load(corpus.xml_path)
+
+	with tempfile.TemporaryDirectory() as directory:
+		xml_fingerprint = snapshot.fingerprint(corpus.xml_path)
+		bench.run("snapshot_save", lambda: snapshot.save(table, xml_fingerprint, directory))
+		bench.run("snapshot_load", lambda: snapshot.load(xml_fingerprint, directory))
+
+	analysis = None
+	if not _has_savegame_analysis():
+		for name in ("songs_timing_index", "replays_analysis", "replays_analysis_cached"):
+			bench.skip(name, "savegame_analysis isn't available")
+	else:
+		import savegame_analysis
+		songs_index = bench.run("songs_timing_index",
+				lambda: savegame_analysis.SongsTimingIndex(corpus.songs_root))
+		analysis = bench.run("replays_analysis",
+				lambda: replays_analysis.analyze(table, corpus.replays_dir, songs_index,
+					cache_path=None),
+				setup=memo.memo.clear)
+		# Every replay is served from the cache, which is filled once before the timed runs
+		with tempfile.TemporaryDirectory() as directory:
+			cache_path = os.path.join(directory, "replays-cache.bin")
+			replays_analysis.analyze(table, corpus.replays_dir, songs_index, cache_path=cache_path)
+			bench.run("replays_analysis_cached",
+					lambda: replays_analysis.analyze(table, corpus.replays_dir, songs_index,
+						cache_path=cache_path),
+					setup=memo.memo.clear)
+
+	bench.run("prepare", lambda: generator_engine.prepare(table, analysis), setup=memo.memo.clear)
+	view = generator_engine.prepare(table, analysis)
+
+	for output in headless.OUTPUTS:
+		name = f"generators/{output.name}"
+		if output.requires_analysis and analysis is None:
+			bench.skip(name, "no replays analysis")
+			continue
+		bench.run(name, lambda: headless.compute(view, analysis, [output]), setup=memo.memo.clear)
+
+	if processes > 1:
+		bench.run(f"generators/all_in_{processes}_processes",
+				lambda: headless.compute(view, analysis, processes=processes), setup=memo.memo.clear)
+
+# Generates the corpus into the cache, unless it's there already
+def cached_corpus(cache: str, num_scores: int, seed: int, replay_fraction: float
+		) -> synthetic.Corpus:
+	directory = os.path.join(cache, f"{num_scores}-scores-seed-{seed}-replays-{replay_fraction}")
+	if os.path.exists(os.path.join(directory, _CORPUS_DONE_FILE)):
+		return synthetic.corpus_paths(directory)
+
+	if os.path.exists(directory):
+		shutil.rmtree(directory)
+	util.logger.info(f"Generating a corpus of {num_scores} scores into {directory}")
+	corpus = synthetic.generate(directory, num_scores, seed, replay_fraction=replay_fraction)
+	open(os.path.join(directory, _CORPUS_DONE_FILE), "w").close()
+	return corpus
+
+def _git_commit() -> Optional[str]:
+	try:
+		return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+				cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def _meta(corpus: synthetic.Corpus, corpus_args: Dict[str, Any], bench: Benchmark
+		) -> Dict[str, Any]:
+	return {
+		"report_version": REPORT_VERSION,
+		"date": datetime.now().isoformat(timespec="seconds"),
+		"git_commit": _git_commit(),
+		"python": platform.python_version(),
+		"numpy": np.__version__,
+		"platform": platform.platform(),
+		"cpu_count": os.cpu_count(),
+		"savegame_analysis": _has_savegame_analysis(),
+		"repeat": bench.repeat,
+		# If false, the peak RSS of a stage is the peak of the whole process up to that stage
+		"peak_rss_per_stage": bench.peak_rss_resets,
+		"corpus": {
+			**corpus_args,
+			"xml_path": corpus.xml_path,
+			"xml_mb": round(os.path.getsize(corpus.xml_path) / (1024 * 1024), 1),
+			"replays": len(os.listdir(corpus.replays_dir)) if os.path.isdir(corpus.replays_dir)
+					else 0,
+		},
+	}
+
+# Prints the median times of both reports side by side
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+	print(f"{'stage':<48} {'old ms':>10} {'new ms':>10} {'ratio':>7}")
+	for name in [*old["stages"], *(name for name in new["stages"] if name not in old["stages"])]:
+		old_stage = old["stages"].get(name, {})
+		new_stage = new["stages"].get(name, {})
+		if "median" not in old_stage or "median" not in new_stage:
+			old_text = f"{old_stage['median'] * 1000:.1f}" if "median" in old_stage else "-"
+			new_text = f"{new_stage['median'] * 1000:.1f}" if "median" in new_stage else "-"
+			print(f"{name:<48} {old_text:>10} {new_text:>10} {'':>7}")
+			continue
+		ratio = new_stage["median"] / old_stage["median"] if old_stage["median"] > 0 else np.inf
+		print(f"{name:<48} {old_stage['median'] * 1000:>10.1f} {new_stage['median'] * 1000:>10.1f} "
+				+ f"{ratio:>7.2f}")
+
+def parse_args(argv: Optional[Sequence[str]]=None) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description="Times every stage of the analysis and writes "
+			+ "a JSON report")
+	parser.add_argument("--corpus", help="directory laid out like an Etterna installation "
+			+ "(Save/LocalProfiles/00000000/Etterna.xml, Save/ReplaysV2, Songs) to use instead of "
+			+ "a synthetic corpus")
+	parser.add_argument("--scores", type=int, default=10000,
+			help="number of scores of the synthetic corpus (default: %(default)s)")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--replay-fraction", type=float, default=0.2,
+			help="fraction of the synthetic scores with a replay (default: %(default)s)")
+	parser.add_argument("--corpus-cache", default=CORPUS_CACHE,
+			help="where synthetic corpora are kept (default: %(default)s)")
+	parser.add_argument("--repeat", type=int, default=3,
+			help="number of runs of every stage (default: %(default)s)")
+	parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES,
+			help="also time all generators in this many worker processes, if more than one "
+			+ "(default: %(default)s)")
+	headless.add_settings_arguments(parser, exclude=("xml_path", "replays_dir", "songs_root", "trace"))
+	parser.add_argument("--output", default="benchmark.json", help="report file")
+	parser.add_argument("--compare", metavar="REPORT", help="earlier report to compare with")
+	return parser.parse_args(argv)
+
+def main(argv: Optional[Sequence[str]]=None) -> None:
+	logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+	args = parse_args(argv)
+
+	if args.corpus is not None:
+		corpus = synthetic.corpus_paths(args.corpus)
+		corpus_args = {"directory": args.corpus}
+	else:
+		corpus = cached_corpus(args.corpus_cache, args.scores, args.seed, args.replay_fraction)
+		corpus_args = {"scores": args.scores, "seed": args.seed,
+				"replay_fraction": args.replay_fraction}
+
+	prefs = headless.settings_from_args(args)
+	prefs.xml_path = corpus.xml_path
+	prefs.replays_dir = corpus.replays_dir
+	prefs.songs_root = corpus.songs_root
+	app.app = app.HeadlessApp(prefs, headless.load_blacklisted_charts(args.unranked))
+
+	bench = Benchmark(args.repeat)
+	run_stages(bench, corpus, args.processes)
+
+	report = {"meta": _meta(corpus, corpus_args, bench), "stages": bench.stages}
+	with open(args.output, "w") as f:
+		json.dump(report, f, indent=2)
+	util.logger.info(f"Wrote {args.output}")
+
+	if args.compare is not None:
+		with open(args.compare) as f:
+			compare(json.load(f), report)
+
+if __name__ == "__main__":
+	main()
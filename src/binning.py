@@ -0,0 +1,52 @@
+from typing import *
+
+import numpy as np
+
+
+"""
+This file holds the histogram kernel shared by all plots that put values into bins (wifescore
+frequencies, grades, idle times, scores per hour...). Values are assigned to bins with one
+searchsorted over the bin edges, and the bins are reduced with bincount (or ufunc.at for min/max),
+so it's a single vectorized pass for any bin resolution
+"""
+
+REDUCERS = ("count", "sum", "mean", "min", "max")
+
+# Returns the bin index of every value, where bin i is [edges[i], edges[i + 1]). `edges` must be
+# sorted. Values outside of all bins, and NaNs, get -1
+def bin_indices(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+	indices = np.searchsorted(edges, values, side="right") - 1
+	indices[indices >= len(edges) - 1] = -1
+	return indices
+
+# Reduces the `weights` of every group with the given reducer. For "count", the number of members
+# of every group is returned and `weights` isn't needed. `groups` holds the group index of every
+# value, values with a negative group index are left out. Groups without any values get `empty`
+def reduce_groups(groups: np.ndarray, num_groups: int, weights: Optional[np.ndarray]=None,
+		reducer: str="count", empty: Any=0) -> np.ndarray:
+	assert reducer in REDUCERS, f"Unknown reducer {reducer}"
+
+	is_member = groups >= 0
+	groups = groups[is_member]
+	counts = np.bincount(groups, minlength=num_groups)
+	if reducer == "count":
+		return counts
+
+	weights = np.asarray(weights)[is_member]
+	if reducer in ("sum", "mean"):
+		result = np.bincount(groups, weights=weights, minlength=num_groups)
+		if reducer == "mean":
+			with np.errstate(invalid="ignore", divide="ignore"):
+				result /= counts
+	else:
+		result = np.full(num_groups, np.inf if reducer == "min" else -np.inf)
+		(np.minimum if reducer == "min" else np.maximum).at(result, groups, weights)
+
+	result[counts == 0] = empty
+	return result
+
+# Puts the values into the bins given by `edges` (see bin_indices) and reduces every bin with
+# reduce_groups
+def histogram(values: np.ndarray, edges: np.ndarray, weights: Optional[np.ndarray]=None,
+		reducer: str="count", empty: Any=0) -> np.ndarray:
+	return reduce_groups(bin_indices(values, edges), len(edges) - 1, weights, reducer, empty)
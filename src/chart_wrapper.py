@@ -1,8 +1,9 @@
 from typing import *
 
 import math
-from datetime import datetime
+from datetime import datetime, timezone
 
+import numpy as np
 import pyqtgraph as pg
 
 import util
@@ -30,7 +31,7 @@ class TimeAxisItem(pg.AxisItem):
 		strings = []
 		for value in values:
 			value = min(capmax, max(capmin, value))
-			strings.append(datetime.fromtimestamp(value).strftime("%Y-%m-%d"))
+			strings.append(datetime.fromtimestamp(value, timezone.utc).strftime("%Y-%m-%d"))
 		return strings
 
 class DIYLogAxisItem(pg.AxisItem):
@@ -75,12 +76,16 @@ class DIYLogAxisItem(pg.AxisItem):
 # type_: either "scatter", "bubble", "bar", "stacked bar" or
 #  "stacked line"
 # width: (only for bar charts) width of the bars
+# plot_widget: a widget returned by an earlier draw() call to draw into
+#  instead of creating a new one. Its contents are replaced, but its axes
+#  are kept
 def draw(data,
 		flags="", title=None,
 		color="white", alpha=0.4, legend=None,
 		log_axis_max_shown_value=None,
 		log_axis_min_shown_value=None,
-		click_callback=None, type_="scatter", width=0.8):
+		click_callback=None, type_="scatter", width=0.8,
+		plot_widget=None):
 	
 	log_axis_kwargs = {}
 	if log_axis_max_shown_value:
@@ -101,8 +106,10 @@ def draw(data,
 		axisItems["left"] = DIYLogAxisItem(accuracy=False, decimal_places=1,
 				orientation="left", **log_axis_kwargs)
 	
-	plot_widget = pg.PlotWidget(axisItems=axisItems)
+	if plot_widget is None:
+		plot_widget = pg.PlotWidget(axisItems=axisItems)
 	plot = plot_widget.getPlotItem()
+	plot.clear()
 	plot.setTitle(title)
 	if "log" in flags: plot.setLogMode(x=False, y=True) # does this do anything? idk
 	
@@ -119,8 +126,6 @@ def draw(data,
 				util.logger.exception("Click handler")
 				app.app.set_infobar("[Error while generating info text]")
 	
-	# ~ plot.clear()
-	
 	if isinstance(data, str):
 		item = pg.TextItem(data, anchor=(0.5, 0.5))
 		plot.addItem(item)
@@ -134,7 +139,9 @@ def draw(data,
 	else: (x, y) = data
 	
 	if "time_xaxis" in flags:
-		x = [value.timestamp() for value in x]
+		# Works for both lists of datetimes and datetime64 arrays. The datetimes are naive, so
+		# they're converted as if they were UTC, and TimeAxisItem displays them as UTC again
+		x = np.asarray(x, dtype="datetime64[s]").astype(np.int64)
 	
 	step_mode = ("step" in flags)
 	if step_mode:
@@ -181,8 +188,7 @@ def draw(data,
 		if type_ == "scatter":
 			item = pg.ScatterPlotItem(x, y, pen=None, size=8, brush=color, data=ids)
 		elif type_ == "bar":
-			x_values = [v + 0.5 for v in x] if "align_to_whole" in flags else x
-			item = pg.BarGraphItem(x=x_values, height=y, width=width, pen=(200, 200, 200), brush=color)
+			item = pg.BarGraphItem(x=x, height=y, width=width, pen=(200, 200, 200), brush=color)
 		elif type_ == "bubble":
 			item = pg.ScatterPlotItem(x, y, pen=None, size=sizes, brush=color, data=ids)
 		elif type_ == "line":
@@ -4,144 +4,131 @@ import math
 from datetime import datetime, timedelta
 from collections import Counter
 
+import numpy as np
+
 import app
 import util
-from util import parsedate, cache, iter_scores
+import activity_cube, attempt_pairs, binning, session_table
+from activity_cube import ActivityCube
+from attempt_pairs import AttemptPairs
+from session_table import SessionTable
+from generator_engine import generator, FILTER_INPUTS
+from memo import memoized
 
 
 """
 This file holds all the so-called data generators. Those take save data
 and generate data points out of them. There are multiple data generator
-functions here, one for each plot
+functions here, one for each plot.
+
+The generators take a generator_engine.ScoreView, which holds the filtered scores, and declare
+the score columns they read with the @generator decorator. The engine gathers all those columns
+once per draw, so the generators never filter the table themselves
 """
 
-def gen_manip(xml, analysis):
+@generator()
+def gen_manip(view, analysis):
 	x = analysis.datetimes
 	y = [math.log(max(m * 100, 0.01)) / math.log(10) for m in analysis.manipulations]
 	ids = analysis.scores
 	return ((x, y), ids)
 
-def score_to_wifescore(score):
-	overall = float(score.findtext(".//Overall"))
+# The score_to_* mappers take a ScoreView and return one value per score in the view, computed
+# from the view's columns. Scores that can't be mapped get NaN and are discarded by map_scores
+
+def score_to_wifescore(view):
+	overall = view.ssrs[:, 0]
 	return overall
 
-def score_to_accuracy(score):
-	percent = float(score.findtext("SSRNormPercent")) * 100
-	if percent <= -400: return None # Those are weird
-	if percent > 100: return None
-	return -(math.log(100 - percent) / math.log(10))
+def score_to_accuracy(view):
+	percent = view.wifescores * 100
+	# Scores below -400% are weird, and at 100% the log is undefined
+	percent[(percent <= -400) | (percent >= 100)] = np.nan
+	return -(np.log(100 - percent) / math.log(10))
 
-def score_to_ma(score):
-	tap_note_scores = score.find("TapNoteScores")
-	marvelouses = float(tap_note_scores.findtext("W1"))
-	perfects = float(tap_note_scores.findtext("W2"))
+def score_to_ma(view):
+	marvelouses = view.judgements[:, 0].astype(float)
+	perfects = view.judgements[:, 1].astype(float)
 	
 	ma = marvelouses / perfects
-	return math.log(ma) / math.log(10) # For log scale support
+	return np.log(ma) / math.log(10) # For log scale support
 
-def map_scores(xml, mapper, *mapper_args, discard_errors=True, brush_color_over_10_notes=None):
-	x, y = [], []
-	ids = []
-	if brush_color_over_10_notes:
-		brushes = []
-	for score in iter_scores(xml):
-		if discard_errors:
-			try: value = (mapper)(score, *mapper_args)
-			except Exception: continue
-		else:
-			value = (mapper)(score, *mapper_args)
-		if value is None: continue
-		
-		x.append(parsedate(score.findtext("DateTime")))
-		y.append(value)
-		ids.append(score)
-		if brush_color_over_10_notes:
-			tap_note_scores = score.find("TapNoteScores")
-			if tap_note_scores:
-				judgements = ["Miss", "W1", "W2", "W3", "W4", "W5"]
-				total_notes = sum(int(tap_note_scores.findtext(x)) for x in judgements)
-			else:
-				total_notes = 500 # just assume 100 as a default yolo
-			
-			brushes.append(brush_color_over_10_notes if total_notes > 10 else "#AAAAAA")
+def map_scores(view, mapper, *mapper_args, brush_color_over_10_notes=None):
+	with np.errstate(all="ignore"): # division by zero etc. is expected and yields NaN/inf
+		values = (mapper)(view, *mapper_args)
+	is_valid = np.isfinite(values)
 	
+	x = view.datetimes[is_valid]
+	y = values[is_valid].tolist()
+	ids = view.scores[is_valid]
 	if brush_color_over_10_notes:
+		# Miss, W1, W2, W3, W4, W5
+		total_notes = view.judgements[is_valid, :6].sum(axis=1)
+		brushes = [brush_color_over_10_notes if n > 10 else "#AAAAAA" for n in total_notes]
 		return (((x, y), ids), brushes)
 	else:
 		return ((x, y), ids)
 
-def gen_wifescore(xml): return map_scores(xml, score_to_wifescore)
-def gen_accuracy(xml, color): return map_scores(xml, score_to_accuracy, brush_color_over_10_notes=color)
-def gen_ma(xml): return map_scores(xml, score_to_ma)
-
-# Returns list of sessions where a session is [(Score, datetime)]
-# A session is defined to end when there's no play in 60 minutes or more
-def divide_into_sessions(xml):
-	if cache("sessions_division_cache"):
-		return cache("sessions_division_cache")
-	
-	session_end_threshold = timedelta(hours=1)
-	
-	scores = list(iter_scores(xml))
-	datetimes = [parsedate(s.find("DateTime").text) for s in scores]
-	zipped = zip(scores, datetimes)
-	zipped = sorted(zipped, key=lambda pair: pair[1])
-	
-	# zipped is a list of chronologically sorted (score object, datetime) tuples
-	
-	prev_score_datetime = zipped[0][1] # first datetime
-	current_session = [zipped[0]] # list of (score object, datetime) tuples in current session
-	sessions = [] # list of sessions where every session is like `current_session`
-	for score, score_datetime in zipped[1:]:
-		score_interval = score_datetime - prev_score_datetime
-		# check if timedelta between two scores is too high
-		if score_interval > session_end_threshold:
-			sessions.append(current_session)
-			current_session = []
-		current_session.append((score, score_datetime))
-		prev_score_datetime = score_datetime
-	sessions.append(current_session)
-	
-	return cache("sessions_division_cache", sessions)
-
-def gen_wifescore_frequencies(xml):
-	# e.g. the 0.70 bucket corresponds to all scores between 0.70 and 0.71 (not 0.695 and 0.705!)
-	frequencies = {percent: 0 for percent in range(70, 100)}
-	
-	for score in iter_scores(xml):
-		wifescore = float(score.findtext("SSRNormPercent"))
-		percent = round(wifescore * 100)
-		if percent in frequencies:
-			frequencies[percent] += 1
-	return list(frequencies.keys()), list(frequencies.values())
+@generator("datetimes", "ssrs")
+def gen_wifescore(view): return map_scores(view, score_to_wifescore)
+@generator("datetimes", "wifescores", "judgements")
+def gen_accuracy(view, color): return map_scores(view, score_to_accuracy, brush_color_over_10_notes=color)
+@generator("datetimes", "judgements")
+def gen_ma(view): return map_scores(view, score_to_ma)
+
+# Sessions of the scores in the view. A session ends when there's no play for longer than the
+# session gap setting
+@memoized(*FILTER_INPUTS, "session_gap")
+def session_table_of(view) -> SessionTable:
+	gap = timedelta(minutes=view.inputs["session_gap"])
+	return SessionTable(view.scores, view.datetimes, view.survive_seconds, view.ssrs, gap)
+
+# Pairs of consecutive attempts of the same chart on the same rate, among the scores in the view
+@memoized(*FILTER_INPUTS)
+def attempt_pairs_of(view) -> AttemptPairs:
+	return AttemptPairs(view.scores, view.chart_indices, view.rates, view.datetimes,
+			view.survive_seconds, view.wifescores, view.ssrs)
+
+# `bin_width` is in percent. Every bucket is labeled with its lowest wifescore, e.g. with a bin
+# width of 1 the 70 bucket holds all scores from 70% up to 71% (not 69.5% to 70.5%!). Only 70% up
+# to 100% (exclusive) is tracked
+@generator("wifescores")
+def gen_wifescore_frequencies(view, bin_width=1):
+	# Binned in millionths, where Etterna's six wifescore decimals and the bin edges are whole
+	# numbers. In percent, 0.57 * 100 is 56.99999999999999 and would land in the 56 bucket
+	millionths = np.round(view.wifescores * 1e6)
+	bin_millionths = round(bin_width * 1e4)
+	first_bin, end_bin = math.ceil(70 / bin_width), math.ceil(100 / bin_width)
+	edges = np.arange(first_bin, end_bin + 1) * bin_millionths
+	frequencies = binning.histogram(millionths, edges)
+	return (np.arange(first_bin, end_bin) * bin_width).tolist(), frequencies.tolist()
+
+# Activity cube of the scores in the view
+@memoized(*FILTER_INPUTS)
+def activity_cube_of(view) -> ActivityCube:
+	return ActivityCube(view.datetimes, view.ssrs, view.survive_seconds)
 
 # Return format: [[a,a...],[b,b...],[c,c...],[d,d...],[e,e...],[f,f...],[g,g...]]
-def gen_week_skillsets(xml):
-	# returns an integer week from 0-51
-	def week_from_score(score) -> int:
-		datetime = parsedate(score.findtext("DateTime"))
-		week = datetime.isocalendar()[1]
-		return week
-
-	chronological_scores = sorted(iter_scores(xml), key=lambda s: s.findtext("DateTime"))
-
+@generator(*activity_cube.COLUMNS)
+def gen_week_skillsets(view):
+	cube = activity_cube_of(view)
+	
+	# groups the days by ISO week
+	years, weeks = cube.iso_weeks()
+	_, first_days, day_weeks = np.unique(years * 100 + weeks, return_index=True, return_inverse=True)
+	plays_per_week = np.zeros((len(first_days), activity_cube.NUM_SKILLSETS), dtype=cube.plays.dtype)
+	np.add.at(plays_per_week, day_weeks.ravel(), cube.plays.sum(axis=1))
+	
 	week_start_datetimes: List[datetime] = []
 	diffsets: List[List[float]] = []
-
-	for week, scores_in_week in util.groupby(chronological_scores, week_from_score):
-		diffset = [0, 0, 0, 0, 0, 0, 0]
-		for score in scores_in_week:
-			skillset_ssrs = score.find("SkillsetSSRs")
-			if skillset_ssrs is None: continue
-			diffs = [float(diff.text) for diff in skillset_ssrs[1:]]
-			main_diff = diffs.index(max(diffs))
-			diffset[main_diff] += 1
-		
+	
+	for first_day, week, diffset in zip(first_days.tolist(), weeks[first_days].tolist(),
+			plays_per_week[:, :activity_cube.NO_SKILLSET].tolist()):
 		total = sum(diffset)
 		if total == 0: continue
 		diffset = [diff / total * 100 for diff in diffset]
 
-		year = scores_in_week[0].findtext("DateTime")[:4]
+		year = cube.days[first_day].tolist().year
 		week_start_datetime = datetime.strptime(f"{year} {week} {0}", "%Y %W %w")
 
 		diffsets.append(diffset)
@@ -149,11 +136,9 @@ def gen_week_skillsets(xml):
 
 	return (week_start_datetimes, diffsets)
 
-def gen_plays_by_hour(xml):
-	num_plays = [0] * 24
-	for score in iter_scores(xml):
-		datetime = parsedate(score.find("DateTime").text)
-		num_plays[datetime.hour] += 1
+@generator(*activity_cube.COLUMNS)
+def gen_plays_by_hour(view):
+	num_plays = activity_cube_of(view).plays.sum(axis=(0, 2)).tolist()
 	
 	# I tried to use a datetime as key (would be nicer to display), but
 	# it doesn't play nicely with matplotlib, so we need to use an
@@ -161,122 +146,66 @@ def gen_plays_by_hour(xml):
 	#return {time(hour=i): num_plays[i] for i in range(24)}
 	return list(range(24)), num_plays
 
-def gen_most_played_charts(xml, num_charts):
-	charts_num_plays = []
-	for chart in xml.iter("Chart"):
-		score_filter = lambda s: float(s.findtext("SSRNormPercent")) > 0.5
-		num_plays = len([s for s in iter_scores(chart) if score_filter(s)])
-		if num_plays > 0: charts_num_plays.append((chart, num_plays))
+# Returns list of `(chart index, num_plays)` tuples
+@generator("wifescores", "chart_indices")
+def gen_most_played_charts(view, num_charts):
+	nums_plays = np.bincount(view.chart_indices[view.wifescores > 0.5],
+			minlength=view.table.num_charts)
 	
-	charts_num_plays.sort(key=lambda pair: pair[1], reverse=True)
-	return charts_num_plays[:num_charts]
+	charts = np.argsort(-nums_plays, kind="stable")[:num_charts]
+	return [(chart, nums_plays[chart]) for chart in charts.tolist() if nums_plays[chart] > 0]
 
-def gen_hours_per_skillset(xml):
-	hours = [0, 0, 0, 0, 0, 0, 0]
-	
-	for score in iter_scores(xml):
-		skillset_ssrs = score.find("SkillsetSSRs")
-		if skillset_ssrs is None: continue
-		diffs = [float(diff.text) for diff in skillset_ssrs[1:]]
-		main_diff = diffs.index(max(diffs))
-		
-		length_hours = float(score.findtext("SurviveSeconds")) / 3600
-		hours[main_diff] += length_hours
-	
-	return hours
-
-def gen_hours_per_week(xml):
-	scores = iter_scores(xml)
-	pairs = [(s, parsedate(s.findtext("DateTime"))) for s in scores]
-	pairs.sort(key=lambda pair: pair[1]) # Sort by datetime
-	
-	weeks = {}
-	week_end = pairs[0][1] # First (earliest) datetime
-	week_start = week_end - timedelta(weeks=1)
-	i = 0
-	while i < len(pairs):
-		score, datetime = pairs[i][0], pairs[i][1]
-		if datetime < week_end:
-			score_seconds = float(score.findtext("SurviveSeconds")) or 0
-			weeks[week_start] += score_seconds / 3600
-			i += 1
-		else:
-			week_start += timedelta(weeks=1)
-			week_end += timedelta(weeks=1)
-			weeks[week_start] = 0
-	
-	return (list(weeks.keys()), list(weeks.values()))
+@generator(*activity_cube.COLUMNS)
+def gen_hours_per_skillset(view):
+	seconds = activity_cube_of(view).seconds.sum(axis=(0, 1))[:activity_cube.NO_SKILLSET]
+	return (seconds / 3600).tolist()
 
-def calc_average_hours_per_day(xml, timespan=timedelta(days=365/2)):
-	scores = sorted(iter_scores(xml), key=lambda s: s.findtext("DateTime"))
-	
-	total_hours = 0
-	for score in scores:
-		total_hours += float(score.findtext("SurviveSeconds")) / 3600
+@generator(*activity_cube.COLUMNS)
+def gen_hours_per_week(view):
+	cube = activity_cube_of(view)
+	week_starts, seconds = cube.weekly(cube.seconds.sum(axis=(1, 2)))
+	return (week_starts.astype("datetime64[s]").tolist(), (seconds / 3600).tolist())
+
+@generator(*activity_cube.COLUMNS)
+def calc_average_hours_per_day(view, timespan=timedelta(days=365/2)):
+	total_hours = activity_cube_of(view).seconds.sum() / 3600
 	
 	return total_hours / timespan.days
 
 # OPTIONAL PLOTS BEGINNING
 
-def gen_hit_distribution_sub_93(xml, analysis):
+@generator()
+def gen_hit_distribution_sub_93(view, analysis):
 	buckets = analysis.sub_93_offset_buckets
 	return (list(buckets.keys()), list(buckets.values()))
 
-def gen_idle_time_buckets(xml):
-	# Each bucket is 5 seconds. Total 10 minutes is tracked
-	buckets = [0] * 600
-	
-	a, b = 0, 0
-	
-	scores = []
-	for scoresat in xml.iter("ScoresAt"):
-		rate = float(scoresat.get("Rate"))
-		scores.extend(((score, rate) for score in iter_scores(scoresat)))
-	
+# Idle time between the end of a play and the start of the next one. `bucket_seconds` is the width
+# of each bucket, and every bucket is labeled with its lowest idle time in seconds. Total 50 minutes
+# is tracked
+@generator("datetimes", "survive_seconds", "rates")
+def gen_idle_time_buckets(view, bucket_seconds=5):
 	# Sort scores by datetime, oldest first
-	scores.sort(key=lambda pair: pair[0].findtext("DateTime"))
-	
-	last_play_end = None
-	for score, rate in scores:
-		a += 1
-		datetime = util.parsedate(score.findtext("DateTime"))
-		survive_seconds = float(score.findtext("SurviveSeconds"))
-		#print(survive_seconds, rate)
-		length = timedelta(seconds=survive_seconds*rate)
-		
-		#print("Datetime:", datetime)
-		#print("Play length:", str(length)[:-7], "(according to SurviveSeconds)")
-		if last_play_end is not None:
-			idle_time = datetime - last_play_end
-			if idle_time >= timedelta():
-				bucket_index = int(idle_time.total_seconds() // 5)
-				if bucket_index < len(buckets):
-					buckets[bucket_index] += 1
-			else:
-				#print("Negative idle time!")
-				b += 1
-		
-		last_play_end = datetime + length
-		#print("Finished", last_play_end)
-		#print()
-	
-	# ~ keys = [i * 5 for i in range(len(buckets))]
-	keys = range(len(buckets))
-	return (keys, buckets)
-
-def gen_session_length(xml):
-	sessions = divide_into_sessions(xml)
-	x, y = [], []
-	for s in sessions:
-		x.append(s[0][1]) # Datetime [1] of first play [0] in session
-		y.append((s[-1][1] - s[0][1]).total_seconds() / 60) # Length in minutes
+	order = view.chronological_order()
+	datetimes = view.datetimes[order]
+	lengths = view.survive_seconds[order] * view.rates[order]
+	
+	idle_seconds = (datetimes[1:] - datetimes[:-1]) / np.timedelta64(1, "s") - lengths[:-1]
+	# Negative idle times (overlapping plays) and scores without a date end up outside of the bins
+	edges = np.arange(0, 3000 + bucket_seconds, bucket_seconds)
+	buckets = binning.histogram(idle_seconds, edges)
+	return (edges[:-1].tolist(), buckets.tolist())
+
+@generator(*session_table.COLUMNS)
+def gen_session_length(view):
+	sessions = session_table_of(view)
+	x = sessions.start_datetimes.tolist()
+	y = (sessions.wall_seconds / 60).tolist() # Length in minutes
 	
 	return (x, y)
 
-def gen_session_plays(xml):
-	sessions = divide_into_sessions(xml)
-	nums_plays = [len(session) for session in sessions]
-	nums_sessions_with_x_plays = Counter(nums_plays)
+@generator(*session_table.COLUMNS)
+def gen_session_plays(view):
+	nums_sessions_with_x_plays = Counter(session_table_of(view).num_plays.tolist())
 	return (list(nums_sessions_with_x_plays.keys()),
 			list(nums_sessions_with_x_plays.values()))
 
@@ -291,94 +220,48 @@ def gen_session_plays(xml):
 	x_list = range(max_combo)
 	return (x_list, [cbs[i]/base[i] for i in x_list])"""
 
-def gen_plays_per_week(xml):
-	datetimes = [parsedate(s.findtext("DateTime")) for s in iter_scores(xml)]
-	datetimes.sort()
-	
-	weeks = {}
-	week_end = datetimes[0]
-	week_start = week_end - timedelta(weeks=1)
-	i = 0
-	while i < len(datetimes):
-		if datetimes[i] < week_end:
-			weeks[week_start] += 1
-			i += 1
-		else:
-			week_start += timedelta(weeks=1)
-			week_end += timedelta(weeks=1)
-			weeks[week_start] = 0
-	
-	return (list(weeks.keys()), list(weeks.values()))
+@generator(*activity_cube.COLUMNS)
+def gen_plays_per_week(view):
+	cube = activity_cube_of(view)
+	week_starts, nums_plays = cube.weekly(cube.plays.sum(axis=(1, 2)))
+	return (week_starts.astype("datetime64[s]").tolist(), nums_plays.tolist())
 
 # OPTIONAL PLOTS END
 
-def gen_scores_per_hour(xml):
-	hours_of_day = []
-	overalls = []
-	ids = []
-	for score in xml.iter("Score"):
-		skillset_ssrs = score.find("SkillsetSSRs")
-		if not skillset_ssrs: continue
-		overalls.append(float(skillset_ssrs.findtext("Overall")))
-		
-		dt = parsedate(score.findtext("DateTime"))
-		midnight = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-		hour_of_day = (dt - midnight).total_seconds() / 3600
-		hours_of_day.append(hour_of_day)
-		
-		ids.append(score)
+# Unlike most other generators, this one looks at all scores, not just the ones in the view
+@generator()
+def gen_scores_per_hour(view):
+	table = view.table
+	ids = np.flatnonzero(table.has_ssrs_mask())
+	overalls = table.ssrs[ids, 0].tolist()
+	hours_of_day = util.hour_of_day(table.datetimes[ids]).tolist()
 	
 	return (hours_of_day, overalls), ids
 
-def gen_avg_score_per_hour(xml):
-	nums_scores = [0] * 24
-	score_sums = [0] * 24
-	for score in xml.iter("Score"):
-		skillset_ssrs = score.find("SkillsetSSRs")
-		if not skillset_ssrs: continue
-		
-		hour = parsedate(score.findtext("DateTime")).hour
-		nums_scores[hour] += 1
-		
-		score_sums[hour] += float(skillset_ssrs.findtext("Overall"))
+# Like gen_scores_per_hour, this one looks at all scores
+@generator()
+def gen_avg_score_per_hour(view):
+	table = view.table
+	ids = np.flatnonzero(table.has_ssrs_mask())
+	hours_of_day = util.hour_of_day(table.datetimes[ids])
 	
-	x, y = [], []
-	for i, (num_scores, score_sum) in enumerate(zip(nums_scores, score_sums)):
-		x.append(i)
-		try:
-			y.append(score_sum / num_scores)
-		except ZeroDivisionError:
-			y.append(0)
-	return x, y
+	averages = binning.histogram(hours_of_day, np.arange(25), weights=table.ssrs[ids, 0],
+			reducer="mean", empty=0)
+	return list(range(24)), averages.tolist()
 
 # the Python wrapping adds about +30% execution time
-def calc_ratings_for_sessions(xml):
-	if cache("calc_ratings_for_sessions"):
-		return cache("calc_ratings_for_sessions")
-	
+@generator(*session_table.COLUMNS)
+@memoized(depends=[session_table_of])
+def calc_ratings_for_sessions(view):
 	from savegame_analysis import SkillTimeline
 	
-	sessions = []
-	session_ids = []
-	ssr_lists = [[], [], [], [], [], [], []]
-	for (session_i, session) in enumerate(divide_into_sessions(xml)):
-		session_has_been_added = False
-		
-		for (score, _score_datetime) in session:
-			player_skillsets = score.find("SkillsetSSRs")
-			if player_skillsets is None: continue
-
-			if not session_has_been_added:
-				session_has_been_added = True
-				sessions.append(session)		
-
-			session_ids.append(session_i)
-
-			for i in range(7):
-				value = float(player_skillsets[i + 1].text)
-				ssr_lists[i].append(value)
+	sessions = session_table_of(view)
+	ssrs = view.table.ssrs[sessions.scores]
+	has_ssrs = ~np.isnan(ssrs[:, 0])
+	session_ids = sessions.session_indices()[has_ssrs]
+	ssr_lists = ssrs[has_ssrs, 1:].T.tolist()
 	
-	timeline = SkillTimeline(ssr_lists, session_ids)
+	timeline = SkillTimeline(ssr_lists, session_ids.tolist())
 	
 	def ratings_list(i):
 		ratings = [rating_vector[i] for rating_vector in timeline.rating_vectors]
@@ -386,20 +269,28 @@ def calc_ratings_for_sessions(xml):
 		ratings.insert(0, overall)
 		return ratings
 	
-	session_rating_pairs = [(session, ratings_list(i)) for (i, session) in enumerate(sessions)]
+	# Sessions without any score with SkillsetSSRs don't get ratings
+	rated_sessions = np.unique(session_ids).tolist()
+	session_rating_pairs = [(session, ratings_list(i)) for (i, session) in enumerate(rated_sessions)]
 	# session_rating_pairs format:
 	# [
-	#   (<session>, [25, 17, 41, 23, 25, 26, 12]),
-	#   (<session>, [25, 25, 26, 12, 17, 41, 23]),
+	#   (<session index>, [25, 17, 41, 23, 25, 26, 12]),
+	#   (<session index>, [25, 25, 26, 12, 17, 41, 23]),
 	# ]
 	
-	return cache("calc_ratings_for_sessions", session_rating_pairs)
+	return session_rating_pairs
 
-def gen_session_rating_improvement(xml):
+@generator(*session_table.COLUMNS)
+def gen_session_rating_improvement(view):
 	datetimes, lengths, sizes, ids = [], [], [], []
 	
+	sessions = session_table_of(view)
+	start_datetimes = sessions.start_datetimes.tolist()
+	lengths_minutes = (sessions.wall_seconds / 60).tolist()
+	nums_plays = sessions.num_plays.tolist()
+	
 	previous_overall = 0
-	for (session, ratings) in calc_ratings_for_sessions(xml):
+	for (session, ratings) in calc_ratings_for_sessions(view):
 		# Overall-rating delta
 		overall_delta = ratings[0] - previous_overall
 		
@@ -408,137 +299,91 @@ def gen_session_rating_improvement(xml):
 		sizes.append(min(150, max(4, size)))
 		
 		# Append session datetime and length
-		datetimes.append(session[0][1])
-		length = (session[-1][1] - session[0][1]).total_seconds() / 60
+		datetimes.append(start_datetimes[session])
+		length = lengths_minutes[session]
 		lengths.append(length)
 		
-		ids.append((previous_overall, ratings[0], len(session), length))
+		ids.append((previous_overall, ratings[0], nums_plays[session], length))
 		
 		previous_overall = ratings[0]
 	
 	return ((datetimes, lengths, sizes), ids)
 
-# Returns tuple of `(max_combo_chart_element, max_combo_int)`
-def find_longest_combo(xml):
-	max_combo_chart = None
-	max_combo = 0
-	for chart in xml.iter("Chart"):
-		for score in iter_scores(chart):
-			combo = int(score.findtext("MaxCombo"))
-			if combo > max_combo:
-				max_combo = combo
-				max_combo_chart = chart
-	return max_combo_chart, max_combo
+# Returns tuple of `(max_combo_chart_index, max_combo_int)`
+@generator("max_combos", "chart_indices")
+def find_longest_combo(view):
+	if len(view) == 0 or view.max_combos.max() <= 0:
+		return None, 0
+	
+	i = np.argmax(view.max_combos)
+	return view.chart_indices[i], int(view.max_combos[i])
 
 # Returns dict with pack names as keys and the respective "pack liking"
 # as value. The liking value is currently simply the amount of plays in the pack
-def generate_pack_likings(xml, months):
+@generator("datetimes", "chart_indices")
+def generate_pack_likings(view, months):
+	relevant = view.time_range(util.months_ago(months))
+	nums_relevant_plays = np.bincount(view.chart_indices[relevant],
+			minlength=view.table.num_charts)
+	
 	likings = {}
-	for chart in xml.iter("Chart"):
-		num_relevant_plays = 0
-		for score in iter_scores(chart):
-			if util.score_within_n_months(score, months):
-				num_relevant_plays += 1
-		pack = chart.get("Pack")
-		
+	for pack, num_relevant_plays in zip(view.table.packs, nums_relevant_plays.tolist()):
 		if pack not in likings: likings[pack] = 0
 		likings[pack] += num_relevant_plays
 	
 	return likings
 
-def calculate_total_wifescore(xml, months=6):
-	weighted_sum = 0
-	num_notes_sum = 0
-	for score in iter_scores(xml):
-		if not util.score_within_n_months(score, months): continue
-		
-		num_notes = util.num_notes(score)
-		num_notes_sum += util.num_notes(score)
-		
-		wifescore = float(score.findtext("SSRNormPercent"))
-		weighted_sum += wifescore * num_notes
+@generator("datetimes", "judgements", "wifescores")
+def calculate_total_wifescore(view, months=6):
+	relevant = view.time_range(util.months_ago(months))
+	
+	nums_notes = view.judgements[relevant].sum(axis=1)
+	num_notes_sum = int(nums_notes.sum())
+	weighted_sum = float((view.wifescores[relevant] * nums_notes).sum())
 	
 	try:
 		return weighted_sum / num_notes_sum
 	except ZeroDivisionError:
 		return 0
 
-def gen_skillset_development(xml):
+@generator(*session_table.COLUMNS)
+def gen_skillset_development(view):
+	start_datetimes = session_table_of(view).start_datetimes.tolist()
 	datetimes, all_ratings = [], []
-	for (session, ratings) in calc_ratings_for_sessions(xml):
-		datetimes.append(session[0][1])
+	for (session, ratings) in calc_ratings_for_sessions(view):
+		datetimes.append(start_datetimes[session])
 		all_ratings.append(ratings)
 	return (datetimes, all_ratings)
 
-def gen_cmod_over_time(xml):
-	# These values were gathered through a quick-and-dirty screen recording based test
-	perspective_mod_multipliers = {
-		"Incoming": 1 / 1.2931,
-		"Space": 1 / 1.2414,
-		"Hallway": 1 / 1.2931,
-		"Distant": 1 / 1.2759,
-	}
-	
-	datetime_cmod_map = {}
-	for score in xml.iter("Score"):
-		modifiers = score.findtext("Modifiers").split(", ")
-		cmod = None
-		receptor_size = None
-		perspective_mod_multiplier = 1
-		for modifier in modifiers:
-			if cmod is None and modifier.startswith("C") and modifier[1:].isdecimal():
-				try:
-					cmod = float(modifier[1:])
-				except ValueError:
-					print("huh a weird cmod:", modifier)
-					continue
-			elif receptor_size is None and modifier.endswith("Mini"):
-				mini_percentage_string = modifier[:-4]
-				if mini_percentage_string == "":
-					receptor_size = 0.5
-				else:
-					if not mini_percentage_string.endswith("% "): continue # false positive
-					mini = float(mini_percentage_string[:-2]) / 100
-					receptor_size = 1 - mini / 2
-			elif any(persp_mod in modifier for persp_mod in perspective_mod_multipliers.keys()):
-				# modifier can either be something like "Distant" or "50% Distant"
-				tokens = modifier.split(" ")
-				if len(tokens) == 1:
-					perspective_mod_multiplier = perspective_mod_multipliers[tokens[0]]
-				elif len(tokens) == 2:
-					perspective_mod_multiplier = perspective_mod_multipliers[tokens[1]]
-					
-					# factor in the "50%" (or whichever number it is)
-					perspective_strength = float(tokens[0][:-1]) / 100
-					perspective_mod_multiplier **= perspective_strength
-				else:
-					print(f"uhh this shouldn't happen? '{modifier}'")
-		if receptor_size is None: receptor_size = 1
-		
-		# TODO: decide if MMod should be counted as CMod in this function
-		
-		if cmod is None: continue # player's using xmod or something
-		
-		effective_cmod = cmod * receptor_size * perspective_mod_multiplier
-		
-		dt = parsedate(score.findtext("DateTime"))
-		datetime_cmod_map[dt] = effective_cmod
-	
-	datetimes = list(sorted(datetime_cmod_map.keys()))
-	cmods = [datetime_cmod_map[dt] for dt in datetimes]
-	return datetimes, cmods
-	
-def count_nums_grades(xml):
-	grades = []
-	for score in util.iter_scores(xml):
-		percent = float(score.findtext("SSRNormPercent"))
-		grade = sum(percent >= t for t in util.grade_thresholds) - 1
-		grades.append(util.grade_names[grade])
-	return Counter(grades)
-
-def gen_text_most_played_charts(xml, limit=5):
+@generator("datetimes", "modifier_ids")
+def gen_cmod_over_time(view):
+	cmods = view.table.modifier_table().effective_cmods[view.modifier_ids]
+	# Scores without a CMod (XMod, MMod...) are left out
+	is_cmod = ~np.isnan(cmods) & ~np.isnat(view.datetimes)
+	datetimes, cmods = view.datetimes[is_cmod], cmods[is_cmod]
+	
+	# TODO: decide if MMod should be counted as CMod in this function
+	
+	order = np.argsort(datetimes, kind="stable")
+	datetimes, cmods = datetimes[order], cmods[order]
+	# One point per datetime. Of multiple scores with the same datetime, the last one counts
+	is_last = np.ones(len(datetimes), dtype=bool)
+	is_last[:-1] = datetimes[1:] != datetimes[:-1]
+	return datetimes[is_last].tolist(), cmods[is_last].tolist()
+
+@generator("wifescores")
+def count_nums_grades(view):
+	# The last grade has no upper bound
+	edges = np.array(util.grade_thresholds + [np.inf])
+	nums_grades = binning.histogram(view.wifescores, edges)
+	return Counter({util.grade_names[grade]: num for grade, num in enumerate(nums_grades.tolist())
+			if num > 0})
+
+@generator("wifescores", "chart_indices")
+def gen_text_most_played_charts(view, limit=5):
+	table = view.table
 	text = ["Most played charts:"]
-	charts = gen_most_played_charts(xml, num_charts=limit)
+	charts = gen_most_played_charts(view, num_charts=limit)
 	i = 1
 	for (chart, num_plays) in charts:
 		if num_plays < app.app.prefs.msgbox_num_scores_threshold:
@@ -546,7 +391,7 @@ def gen_text_most_played_charts(xml, limit=5):
 			text.append(f"[{num_remaining} charts with less than {app.app.prefs.msgbox_num_scores_threshold} scores not shown]")
 			break
 		
-		pack, song = chart.get("Pack"), chart.get("Song")
+		pack, song = table.packs[chart], table.songs[chart]
 		text.append(f"{i}) \"{pack}\" -> \"{song}\" with {num_plays} scores")
 		i += 1
 	
@@ -555,29 +400,26 @@ def gen_text_most_played_charts(xml, limit=5):
 	
 	return "<br>".join(text)
 
-def gen_text_longest_sessions(xml, limit=5):
-	sessions = divide_into_sessions(xml)
-	new_sessions = [] # like `sessions`, but with total gameplay seconds annotated
-	for session in sessions:
-		total_gameplay_seconds = sum(float(score[0].findtext("SurviveSeconds")) for score in session)
-		new_sessions.append((session, total_gameplay_seconds))
-	sessions = new_sessions
-	sessions.sort(key=lambda pair: pair[1], reverse=True) # Sort by length
+@generator(*session_table.COLUMNS)
+def gen_text_longest_sessions(view, limit=5):
+	sessions = session_table_of(view)
+	by_length = np.argsort(-sessions.gameplay_seconds, kind="stable") # Sort by length
 	
 	num_not_shown = 0
 	num_shown = 0
 	text = ["Longest sessions:"]
 	i = 1
-	for (session, gameplay_seconds) in sessions:
-		num_plays = len(session)
+	for session in by_length.tolist():
+		num_plays = int(sessions.num_plays[session])
 		
 		if num_plays < app.app.prefs.msgbox_num_scores_threshold:
 			num_not_shown += 1
 			continue
 
-		total_seconds = (session[-1][1] - session[0][1]).total_seconds()
+		gameplay_seconds = sessions.gameplay_seconds[session]
+		total_seconds = sessions.wall_seconds[session]
 		
-		datetime = str(session[0][1])[:-3] # Cut off seconds
+		datetime = str(sessions.start_datetimes[session].tolist())[:-3] # Cut off seconds
 		text.append(f"{i}) {datetime}, {gameplay_seconds/60:.0f} min gameplay, "
 					f"{total_seconds/60:.0f} min total, {num_plays} scores")
 		i += 1
@@ -592,8 +434,9 @@ def gen_text_longest_sessions(xml, limit=5):
 	
 	return "<br>".join(text)
 
-def gen_text_skillset_hours(xml):
-	hours = gen_hours_per_skillset(xml)
+@generator(*activity_cube.COLUMNS)
+def gen_text_skillset_hours(view):
+	hours = gen_hours_per_skillset(view)
 	
 	text = ["Hours spent training each skillset:"]
 	for i in range(7):
@@ -603,21 +446,21 @@ def gen_text_skillset_hours(xml):
 	return "<br>".join(text)
 
 # Parameter r is the ReplaysAnalysis
-def gen_text_general_info(xml, r):
+@generator("survive_seconds", "datetimes", "wifescores", "ssrs")
+def gen_text_general_info(view, r):
 	from dateutil.relativedelta import relativedelta
 	
-	total_notes = 0
-	for tap_note_scores in xml.iter("TapNoteScores"):
-		total_notes += sum(int(e.text) for e in tap_note_scores)
+	table = view.table
+	total_notes = int(table.judgements.sum())
 	total_notes_string = util.abbreviate(total_notes, min_precision=3)
 
-	scores = list(iter_scores(xml))
-	num_charts = len(list(xml.iter("Chart")))
-	hours = sum(float(s.findtext("SurviveSeconds")) / 3600 for s in scores)
-	first_play_date = min([parsedate(s.findtext("DateTime")) for s in scores])
+	scores = view.scores
+	num_charts = table.num_charts
+	hours = view.survive_seconds.sum() / 3600
+	first_play_date = view.datetimes.min().tolist()
 	duration = relativedelta(datetime.now(), first_play_date)
 	
-	grades = count_nums_grades(xml)
+	grades = count_nums_grades(view)
 	# ~ grades_string_1 = ", ".join(f"{name}: {grades[name]}" for name in ("AAAA", "AAA", "AA"))
 	# ~ grades_string_2 = ", ".join(f"{name}: {grades[name]}" for name in ("A", "B", "C", "D"))
 	grades_string = ", ".join(f"{name}: {grades[name]}" for name in "AAAA AAA AA A B C D".split())
@@ -625,11 +468,9 @@ def gen_text_general_info(xml, r):
 	
 	best_aaa = (None, 0)
 	best_aaaa = (None, 0)
-	for score in iter_scores(xml):
-		wifescore = float(score.findtext("SSRNormPercent"))
-		skillset_ssrs = score.find("SkillsetSSRs")
-		if skillset_ssrs is None: continue
-		overall = float(skillset_ssrs.findtext("Overall"))
+	has_ssrs = ~np.isnan(view.ssrs[:, 0])
+	for (score, wifescore, overall) in zip(scores[has_ssrs].tolist(),
+			view.wifescores[has_ssrs].tolist(), view.ssrs[has_ssrs, 0].tolist()):
 
 		if wifescore < util.AAA_THRESHOLD:
 			pass # we don't care about sub-AAA scores
@@ -641,11 +482,9 @@ def gen_text_general_info(xml, r):
 				best_aaaa = (score, overall)
 	def get_score_desc(score, overall) -> str:
 		if score is None: return "[none]"
-		chart = util.find_parent_chart(xml, score)
-		dt = score.findtext("DateTime")
-		wifescore = float(score.findtext("SSRNormPercent"))
-		pack = chart.get("Pack")
-		song = chart.get("Song")
+		(_chart, _rate, pack, song, _steps) = table.score_metadata(score)
+		dt = str(table.datetimes[score])
+		wifescore = table.wifescores[score]
 		return f"{overall:.2f}, {wifescore*100:.2f}% - \"{song}\" ({pack}) - {dt[:10]}"
 
 	return "<br>".join([
@@ -662,17 +501,23 @@ def gen_text_general_info(xml, r):
 	])
 
 # a stands for ReplaysAnalysis
-def gen_text_general_analysis_info(xml, a):
+@generator("datetimes", "ssrs", "survive_seconds", "max_combos", "chart_indices", "judgements",
+		"wifescores", "rates")
+def gen_text_general_analysis_info(view, a):
+	table = view.table
 	if a: # If ReplaysAnalysis is avilable
 		chart = a.longest_mcombo[1]
-		long_mcombo_chart = f'"{chart.get("Song")}" ({chart.get("Pack")})'
+		long_mcombo_chart = f'"{table.songs[chart]}" ({table.packs[chart]})'
 		long_mcombo_str = f"{a.longest_mcombo[0]} on {long_mcombo_chart}"
 	else:
 		long_mcombo_str = "[please load replay data]"
 	
-	chart, combo = find_longest_combo(xml)
-	long_combo_chart = f'"{chart.get("Song")}" ({chart.get("Pack")})'
-	long_combo_str = f"{combo} on {long_combo_chart}"
+	chart, combo = find_longest_combo(view)
+	if chart is None: # e.g. every score in the selected date range has MaxCombo 0
+		long_combo_str = "[no combo]"
+	else:
+		long_combo_chart = f'"{table.songs[chart]}" ({table.packs[chart]})'
+		long_combo_str = f"{combo} on {long_combo_chart}"
 
 	if a:
 		cb_ratio_per_column = [cbs / total for (cbs, total)
@@ -692,7 +537,7 @@ def gen_text_general_analysis_info(xml, a):
 			weight = new_wifescore - old_wifescore
 
 			# prevent tiny files dominating the cb rush intensity leaderboard
-			if util.num_notes(score) < 500: continue
+			if util.num_notes(table, score) < 500: continue
 
 			# this is not technically needed, but it's not particularly pleasant if we have smth
 			# like "this score is only 55% but without cb rushes it would be 75%!! wooo!!!!" cuz
@@ -705,12 +550,10 @@ def gen_text_general_analysis_info(xml, a):
 				worst_cb_rush_index = i
 		def make_worst_cb_rush_string():
 			score = a.wifescore_scores[worst_cb_rush_index]
-			chart = util.find_parent_chart(xml, score)
-			pack = chart.get("Pack")
-			song = chart.get("Song")
+			(_chart, _rate, pack, song, _steps) = table.score_metadata(score)
 			old = a.current_wifescores[worst_cb_rush_index]
 			new = a.new_wifescores[worst_cb_rush_index]
-			dt = score.findtext("DateTime")[:10]
+			dt = str(table.datetimes[score])[:10]
 			return f"{old*100:.2f}%, {new*100:.2f}% without unfair cb rush - {song} ({pack}) {dt}"
 		worst_cb_rush_string = make_worst_cb_rush_string()
 	else:
@@ -719,23 +562,22 @@ def gen_text_general_analysis_info(xml, a):
 		sd_string = "[please load replay data]"
 		worst_cb_rush_string = "[please load replay data]"
 	
-	session_secs = int(xml.find("GeneralData").findtext("TotalSessionSeconds"))
-	play_secs = int(xml.find("GeneralData").findtext("TotalGameplaySeconds"))
+	session_secs = table.total_session_seconds
+	play_secs = table.total_gameplay_seconds
 	if session_secs == 0: # Happened for BanglesOtter, for whatever reason
 		play_percentage = 0
 	else:
 		play_percentage = round(100 * play_secs / session_secs)
 	
-	median_score_increase = round(calc_median_score_increase(xml), 1)
+	median_score_increase = round(calc_median_score_increase(view), 1)
 	
-	average_hours = calc_average_hours_per_day(xml)
+	average_hours = calc_average_hours_per_day(view)
 	average_hours_str = util.timespan_str(average_hours)
 	
-	session_date_threshold = datetime.now() - timedelta(days=7)
-	sessions = divide_into_sessions(xml)
-	num_sessions = len([s for s in sessions if s[0][1] > session_date_threshold])
+	session_date_threshold = np.datetime64(datetime.now() - timedelta(days=7), "s")
+	num_sessions = int((session_table_of(view).start_datetimes > session_date_threshold).sum())
 	
-	total_wifescore = calculate_total_wifescore(xml, months=6)
+	total_wifescore = calculate_total_wifescore(view, months=6)
 	total_wifescore_str = f"{round(total_wifescore * 100, 2)}%"
 	
 	def gen_fastest_combo_string(cmb):
@@ -743,11 +585,8 @@ def gen_text_general_analysis_info(xml, a):
 			return "[please load replay data]"
 		elif cmb.score is None:
 			return "[couldn't access cache.db]"
-		chart = util.find_parent_chart(xml, cmb.score)
-		pack = chart.get("Pack")
-		song = chart.get("Song")
-		wifescore = float(cmb.score.findtext("SSRNormPercent"))
-		dt = cmb.score.findtext("DateTime")
+		(_chart, _rate, pack, song, _steps) = table.score_metadata(cmb.score)
+		wifescore = table.wifescores[cmb.score]
 		
 		return (f"NPS={cmb.speed:.2f} ({cmb.length} notes, from "
 				f"{cmb.start_second:.1f}s to {cmb.end_second:.1f}s) on \"{song}\" "
@@ -770,8 +609,9 @@ def gen_text_general_analysis_info(xml, a):
 		f"Worst unfair cb rush ever: {worst_cb_rush_string}",
 	])
 
-def gen_text_most_played_packs(xml, limit=10, months: Optional[int]=None):
-	likings = generate_pack_likings(xml, months)
+@generator("datetimes", "chart_indices")
+def gen_text_most_played_packs(view, limit=10, months: Optional[int]=None):
+	likings = generate_pack_likings(view, months)
 	
 	sorted_packs = sorted(likings, key=likings.get, reverse=True)
 	best_packs = sorted_packs[:limit]
@@ -796,30 +636,14 @@ def gen_text_most_played_packs(xml, limit=10, months: Optional[int]=None):
 
 # Calculate the median score increase, when playing a chart twice
 # in direct succession
-def calc_median_score_increase(xml):
-	from statistics import median
-	
-	score_increases = []
+@generator(*attempt_pairs.COLUMNS)
+def calc_median_score_increase(view):
+	pairs = attempt_pairs_of(view)
 	
-	for chart in xml.iter("ScoresAt"):
-		# Chronologically sorted scores
-		scores = sorted(iter_scores(chart), key=lambda s: s.findtext("DateTime"))
-		
-		for i in range(0, len(scores) - 1):
-			datetime_1 = parsedate(scores[i].findtext("DateTime"))
-			datetime_2 = parsedate(scores[i + 1].findtext("DateTime"))
-			time_delta = datetime_2 - datetime_1
-			play_time = float(scores[i].findtext("SurviveSeconds"))
-			idle_time = time_delta.total_seconds() - play_time
-			
-			# If the same chart is played twice within 60 seconds
-			if idle_time < 60:
-				score_1 = float(scores[i].findtext("SSRNormPercent"))
-				score_2 = float(scores[i + 1].findtext("SSRNormPercent"))
-				score_increase = 100 * (score_2 - score_1)
-				score_increases.append(score_increase)
+	# If the same chart is played twice within 60 seconds
+	score_increases = 100 * pairs.wifescore_deltas[pairs.idle_seconds < 60]
 	
 	if len(score_increases) == 0:
 		return 0
 	else:
-		return median(score_increases)
+		return float(np.median(score_increases))
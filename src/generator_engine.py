@@ -0,0 +1,133 @@
+from typing import *
+
+from dataclasses import dataclass
+
+import numpy as np
+
+import app, util, tracing
+from memo import memo
+from score_table import ScoreTable
+
+
+"""
+Almost every data generator works on the same subset of scores (see util.iter_scores). Instead of
+every generator filtering the whole table on its own, prepare() filters the table once into a
+ScoreView. The generators are registered together with the score columns they read, so prepare()
+can gather all needed columns for the filtered scores in one go, before any generator runs. The
+generators then work on those gathered columns with vectorized numpy expressions. Datasets that
+are derived from the view and expensive to compute are memoized (see memo.py), keyed by the view's
+inputs
+"""
+
+# The inputs that decide which scores are in a view
+FILTER_INPUTS = ("table", "hide_invalidated", "blacklist", "time_range")
+
+@dataclass
+class Generator:
+	fn: Callable
+	columns: List[str] # names of ScoreTable columns the generator reads through the ScoreView
+
+# All registered generators, by function name
+generators: Dict[str, Generator] = {}
+
+# Decorator that registers a generator, together with the ScoreTable columns it reads
+def generator(*columns: str):
+	for column in columns:
+		assert column in ScoreTable.COLUMNS, f"Unknown column {column}"
+
+	def decorator(fn):
+		generators[fn.__name__] = Generator(fn, list(columns))
+		return fn
+	return decorator
+
+# The scores considered by the plots. Column attributes (e.g. `view.datetimes`) hold the values of
+# those scores only, in the same order as `scores`. Generators that need all scores can still use
+# `view.table`
+class ScoreView:
+	def __init__(self, table: ScoreTable, scores: np.ndarray, inputs: Dict[str, Hashable]):
+		self.table = table
+		self.scores = scores # score table indices
+		# Versions and values of everything the view and the datasets derived from it depend on,
+		# see memo.memoized
+		self.inputs = inputs
+		self._chronological_order: Optional[np.ndarray] = None
+		self._sorted_datetimes: Optional[np.ndarray] = None
+
+	def __len__(self) -> int:
+		return len(self.scores)
+
+	# Gathers a column on first access. prepare() gathers all declared columns up front already
+	def __getattr__(self, name: str) -> np.ndarray:
+		if name not in ScoreTable.COLUMNS:
+			raise AttributeError(name)
+		column = getattr(self.table, name)[self.scores]
+		setattr(self, name, column)
+		return column
+
+	# Indices into the view that sort it by datetime, oldest first
+	def chronological_order(self) -> np.ndarray:
+		if self._chronological_order is None:
+			self._chronological_order = np.argsort(self.datetimes, kind="stable")
+		return self._chronological_order
+
+	# The datetimes of the view, oldest first. Scores without a date come last
+	def sorted_datetimes(self) -> np.ndarray:
+		if self._sorted_datetimes is None:
+			self._sorted_datetimes = self.datetimes[self.chronological_order()]
+		return self._sorted_datetimes
+
+	# Indices into the view of all scores played in [start, end), oldest first. None means no
+	# limit on that side. This is a binary search over the sorted datetimes, so it costs
+	# O(log n + number of scores in the range)
+	def time_range(self, start: Optional[np.datetime64]=None, end: Optional[np.datetime64]=None
+			) -> np.ndarray:
+		if start is None and end is None:
+			return self.chronological_order()
+		
+		datetimes = self.sorted_datetimes()
+		# Scores without a date (sorted last) aren't in any time range
+		if end is None: end = np.datetime64("NaT")
+		lo = 0 if start is None else np.searchsorted(datetimes, start, side="left")
+		hi = np.searchsorted(datetimes, end, side="left")
+		return self.chronological_order()[lo:hi]
+
+	# Returns a view of only the scores played in [start, end), in the same order as in this view
+	def restrict(self, start: Optional[np.datetime64]=None, end: Optional[np.datetime64]=None
+			) -> "ScoreView":
+		subset = np.sort(self.time_range(start, end))
+		inputs = {**self.inputs, "time_range": (self.inputs["time_range"], start, end)}
+		view = ScoreView(self.table, self.scores[subset], inputs)
+		# Reuse the columns gathered already, instead of gathering them from the table again
+		for name in ScoreTable.COLUMNS:
+			if name in self.__dict__:
+				setattr(view, name, self.__dict__[name][subset])
+		return view
+
+# Returns the columns read by the given generators (all registered ones by default), in table
+# column order
+def plan(names: Optional[Iterable[str]]=None) -> List[str]:
+	if names is None: names = generators.keys()
+	needed = set()
+	for name in names:
+		needed.update(generators[name].columns)
+	return [column for column in ScoreTable.COLUMNS if column in needed]
+
+# Filters the table and gathers the columns needed by the given generators (all registered ones
+# by default)
+def prepare(table: ScoreTable, analysis=None, names: Optional[Iterable[str]]=None) -> ScoreView:
+	inputs = {
+		"table": table.version,
+		"hide_invalidated": app.app.prefs.hide_invalidated,
+		"blacklist": app.app.blacklisted_charts,
+		"session_gap": app.app.prefs.session_gap_minutes,
+		"analysis": None if analysis is None else analysis.version,
+		"time_range": None, # see ScoreView.restrict
+	}
+	filter_values = tuple(inputs[name] for name in FILTER_INPUTS)
+	with tracing.span("prepare"):
+		scores = memo.get("iter_scores", filter_values, lambda: util.iter_scores(table))
+		
+		view = ScoreView(table, scores, inputs)
+		for column in plan(names):
+			getattr(view, column)
+		return view
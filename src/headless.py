@@ -0,0 +1,311 @@
+from typing import *
+
+import os, json, csv, argparse, logging
+from datetime import datetime
+from dataclasses import dataclass
+
+import numpy as np
+
+import util
+import app
+import tracing
+import snapshot
+import unranked
+import replays_analysis
+import generator_engine
+import data_generators
+from score_table import ScoreTable
+from process_pool import GeneratorCall, run_generators
+from settings import Settings, SettingsType, SETTINGS_ENTRIES, SETTINGS_PATH
+
+
+"""
+This file computes the data behind all plots and text boxes without a GUI and writes it to JSON,
+CSV or NPZ files, e.g. for running on a server or comparing the output of two versions. It doesn't
+import PyQt5 or pyqtgraph (neither does anything it imports), so it works without a display and
+without Qt installed.
+
+	python src/headless.py --etterna-xml .../Etterna.xml --replays-dir .../ReplaysV2 \\
+			--songs-root .../Songs --format csv --output stats
+
+Every other setting can be given the same way (see --help), on top of the settings file
+"""
+
+FORMATS = ("json", "csv", "npz")
+
+# Ratings as returned by calc_ratings_for_sessions
+RATING_COLUMNS = ["overall", *(skillset.lower() for skillset in util.skillsets)]
+SKILLSET_COLUMNS = [skillset.lower() for skillset in util.skillsets]
+
+# Plots of scores return `((x, y), score indices)`. The indices are replaced with the scorekeys,
+# which still mean something outside of this program
+def _points(result, table: ScoreTable):
+	(x, y), scores = result
+	return (x, y, np.asarray(table.scorekeys)[scores].astype(str))
+
+def _session_rating_improvement(result, _table: ScoreTable):
+	(datetimes, lengths, _sizes), infos = result
+	previous_overalls = [info[0] for info in infos]
+	overalls = [info[1] for info in infos]
+	nums_plays = [info[2] for info in infos]
+	return (datetimes, previous_overalls, overalls, nums_plays, lengths)
+
+def _most_played_charts(result, table: ScoreTable):
+	charts = [chart for (chart, _) in result]
+	return ([table.packs[chart] for chart in charts], [table.songs[chart] for chart in charts],
+			[int(num_plays) for (_, num_plays) in result])
+
+def _hours_per_skillset(result, _table: ScoreTable):
+	return (util.skillsets, result)
+
+@dataclass
+class Output:
+	name: str
+	call: GeneratorCall
+	# Names of the columns of the resulting table, or empty if the generator returns a text box
+	columns: Sequence[str] = ()
+	# Turns the result into a tuple of columns, if it isn't one already. Called with the result
+	# and the score table
+	transform: Optional[Callable[[Any, ScoreTable], Any]] = None
+	# Whether the generator takes the replays analysis as the first argument after the view
+	takes_analysis: bool = False
+	# Whether the output is left out if there's no replays analysis
+	requires_analysis: bool = False
+
+# One entry for every text box and plot of the GUI, plus the generators that are only in the GUI
+# as part of a text box
+OUTPUTS = [
+	Output("text_most_played_charts", GeneratorCall("gen_text_most_played_charts")),
+	Output("text_most_played_packs", GeneratorCall("gen_text_most_played_packs")),
+	Output("text_most_played_packs_6_months",
+			GeneratorCall("gen_text_most_played_packs", kwargs={"months": 6})),
+	Output("text_skillset_hours", GeneratorCall("gen_text_skillset_hours")),
+	Output("text_longest_sessions", GeneratorCall("gen_text_longest_sessions")),
+	Output("text_general_analysis_info", GeneratorCall("gen_text_general_analysis_info"),
+			takes_analysis=True),
+	Output("text_general_info", GeneratorCall("gen_text_general_info"), takes_analysis=True),
+	Output("wifescore", GeneratorCall("gen_wifescore"), ["datetime", "wifescore", "scorekey"],
+			transform=_points),
+	Output("manip", GeneratorCall("gen_manip"), ["datetime", "log_manip", "scorekey"],
+			transform=_points, takes_analysis=True, requires_analysis=True),
+	Output("accuracy", GeneratorCall("gen_accuracy", (None,)),
+			["datetime", "log_accuracy", "scorekey"], transform=_points),
+	Output("ma", GeneratorCall("gen_ma"), ["datetime", "log_ma", "scorekey"], transform=_points),
+	Output("plays_by_hour", GeneratorCall("gen_plays_by_hour"), ["hour", "plays"]),
+	Output("session_rating_improvement", GeneratorCall("gen_session_rating_improvement"),
+			["datetime", "previous_overall", "overall", "plays", "length_minutes"],
+			transform=_session_rating_improvement),
+	Output("cmod_over_time", GeneratorCall("gen_cmod_over_time"), ["datetime", "effective_cmod"]),
+	Output("hours_per_week", GeneratorCall("gen_hours_per_week"), ["week_start", "hours"]),
+	Output("wifescore_frequencies", GeneratorCall("gen_wifescore_frequencies"),
+			["wifescore_percent", "scores"]),
+	Output("hit_distribution_sub_93", GeneratorCall("gen_hit_distribution_sub_93"),
+			["offset_ms", "hits"], takes_analysis=True, requires_analysis=True),
+	Output("idle_time_buckets", GeneratorCall("gen_idle_time_buckets"), ["idle_seconds", "plays"]),
+	Output("avg_score_per_hour", GeneratorCall("gen_avg_score_per_hour"), ["hour", "avg_overall"]),
+	Output("scores_per_hour", GeneratorCall("gen_scores_per_hour"),
+			["hour", "overall", "scorekey"], transform=_points),
+	Output("session_plays", GeneratorCall("gen_session_plays"), ["plays", "sessions"]),
+	Output("session_length", GeneratorCall("gen_session_length"), ["datetime", "length_minutes"]),
+	Output("plays_per_week", GeneratorCall("gen_plays_per_week"), ["week_start", "plays"]),
+	Output("skillset_development", GeneratorCall("gen_skillset_development"),
+			["datetime", *RATING_COLUMNS]),
+	Output("week_skillsets", GeneratorCall("gen_week_skillsets"),
+			["week_start", *SKILLSET_COLUMNS]),
+	Output("most_played_charts", GeneratorCall("gen_most_played_charts", (100,)),
+			["pack", "song", "plays"], transform=_most_played_charts),
+	Output("hours_per_skillset", GeneratorCall("gen_hours_per_skillset"), ["skillset", "hours"],
+			transform=_hours_per_skillset),
+]
+
+def _column(values) -> np.ndarray:
+	column = np.asarray(values)
+	if column.dtype == object and len(column) > 0 and isinstance(column[0], datetime):
+		column = column.astype("datetime64[s]")
+	return column
+
+# Turns the result of a generator into named columns. A column that holds a list per row (like
+# the ratings of all skillsets) is spread over several columns
+def _table(output: Output, result, table: ScoreTable) -> Dict[str, np.ndarray]:
+	if output.transform is not None:
+		result = (output.transform)(result, table)
+
+	columns = []
+	for values in result:
+		column = _column(values)
+		columns.extend(column.T if column.ndim == 2 else [column])
+
+	if len(columns) != len(output.columns):
+		# A column of per-row lists without any row is only one (empty) column
+		if all(len(column) == 0 for column in columns):
+			return {name: np.array([]) for name in output.columns}
+		raise ValueError(f"{output.name} has {len(columns)} columns, expected {len(output.columns)}")
+	return dict(zip(output.columns, columns))
+
+# Runs the generators of `outputs` on the view. Returns the text of every text box and the table of
+# every plot, by output name. With more than one process, the generators that don't take the
+# replays analysis run in a process pool
+def compute(view: generator_engine.ScoreView, analysis: Optional[replays_analysis.ReplaysAnalysis],
+		outputs: Sequence[Output]=OUTPUTS, processes: int=1) -> Dict[str, Union[str, Dict[str, np.ndarray]]]:
+	outputs = [output for output in outputs if analysis is not None or not output.requires_analysis]
+
+	results = {}
+	if processes > 1:
+		pooled = [output for output in outputs if not output.takes_analysis]
+		calls = [output.call for output in pooled]
+		for output, result in zip(pooled, run_generators(view, calls, processes)):
+			results[output.name] = result
+	for output in outputs:
+		if output.name in results: continue
+		fn = getattr(data_generators, output.call.name)
+		args = (analysis, *output.call.args) if output.takes_analysis else output.call.args
+		with tracing.span(f"generate: {output.name}"):
+			results[output.name] = (fn)(view, *args, **output.call.kwargs)
+
+	return {
+		output.name: results[output.name] if not output.columns
+				else _table(output, results[output.name], view.table)
+		for output in outputs
+	}
+
+# Plain Python values of a column, for JSON and CSV. Missing values (NaN, NaT) become None
+def column_values(column: np.ndarray) -> List[Any]:
+	if column.dtype.kind == "M":
+		strings = np.datetime_as_string(column, unit="s").tolist()
+		return [None if string == "NaT" else string for string in strings]
+	values = column.tolist()
+	if column.dtype.kind == "f":
+		return [None if value != value else value for value in values]
+	return values
+
+# The writers take the results of compute() (or any other text boxes and tables in that form).
+# `basename` is the name of the file that holds all of the results, if there is one
+def write_json(results, directory: str, basename: str="etterna-graph") -> None:
+	data = {
+		name: result if isinstance(result, str)
+				else {column: column_values(values) for column, values in result.items()}
+		for name, result in results.items()
+	}
+	with open(os.path.join(directory, f"{basename}.json"), "w") as f:
+		json.dump(data, f, indent="\t", allow_nan=False)
+
+def _write_texts(results, directory: str) -> None:
+	for name, result in results.items():
+		if isinstance(result, str):
+			with open(os.path.join(directory, f"{name}.html"), "w") as f:
+				f.write(result)
+
+def write_csv(results, directory: str, basename: str="etterna-graph") -> None:
+	_write_texts(results, directory)
+	for name, result in results.items():
+		if isinstance(result, str): continue
+		with open(os.path.join(directory, f"{name}.csv"), "w", newline="") as f:
+			writer = csv.writer(f)
+			writer.writerow(result.keys())
+			writer.writerows(zip(*(column_values(values) for values in result.values())))
+
+# All tables go into one .npz file, with the arrays named "<output>/<column>"
+def write_npz(results, directory: str, basename: str="etterna-graph") -> None:
+	_write_texts(results, directory)
+	np.savez(os.path.join(directory, f"{basename}.npz"), **{
+		f"{name}/{column}": values
+		for name, result in results.items() if not isinstance(result, str)
+		for column, values in result.items()
+	})
+
+WRITERS = {"json": write_json, "csv": write_csv, "npz": write_npz}
+
+UNRANKED_SOURCES = ("cache", "download", "none")
+
+# The cached unranked chart list, a freshly downloaded one, or none at all
+def load_blacklisted_charts(source: str) -> unranked.UnrankedCharts:
+	if source == "none":
+		return frozenset()
+
+	cache = unranked.load_cache()
+	if source == "download" or cache is None:
+		try:
+			charts = unranked.download()
+			unranked.save_cache(charts)
+			return charts
+		except Exception:
+			util.logger.exception("Couldn't download unranked chart list, using the cached one")
+	return frozenset() if cache is None else cache[0]
+
+# Adds --settings and a flag for every setting except the `exclude`d ones (by python_name). Their
+# defaults are None, so that only the given ones override the settings file
+def add_settings_arguments(parser: argparse.ArgumentParser, exclude: Collection[str]=()) -> None:
+	parser.add_argument("--settings", default=SETTINGS_PATH,
+			help="settings file to start from (default: %(default)s, if it exists)")
+	for entry in SETTINGS_ENTRIES:
+		if entry.python_name in exclude: continue
+		flag = f"--{entry.json_name}"
+		if entry.settings_type == SettingsType.Checkbox:
+			parser.add_argument(flag, dest=entry.python_name, action=argparse.BooleanOptionalAction,
+					help=entry.display_name)
+		elif entry.settings_type == SettingsType.Spinbox:
+			parser.add_argument(flag, dest=entry.python_name, type=int, help=entry.display_name)
+		else:
+			parser.add_argument(flag, dest=entry.python_name, help=entry.display_name)
+	parser.add_argument("--unranked", choices=UNRANKED_SOURCES, default="cache",
+			help="where the list of unranked charts (whose scores are left out) comes from. "
+			+ "'cache' only downloads it if there's no cached one (default: %(default)s)")
+
+# The settings file given by the arguments of add_settings_arguments, with the given flags applied
+def settings_from_args(args: argparse.Namespace) -> Settings:
+	prefs = Settings.load_from_json(args.settings)
+	for entry in SETTINGS_ENTRIES:
+		value = getattr(args, entry.python_name, None)
+		if value is not None:
+			setattr(prefs, entry.python_name, value)
+	return prefs
+
+def parse_args(argv: Optional[Sequence[str]]=None) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description="Computes the data of all etterna-graph plots "
+			+ "and text boxes without a GUI")
+	add_settings_arguments(parser)
+	parser.add_argument("--no-replays", action="store_true",
+			help="skip the replays analysis, and the outputs that need it")
+	parser.add_argument("--format", choices=FORMATS, default="json")
+	parser.add_argument("--output", default="etterna-graph-output", help="output directory")
+	parser.add_argument("--processes", type=int, default=1,
+			help="number of worker processes for the generators (default: %(default)s)")
+	return parser.parse_args(argv)
+
+def main(argv: Optional[Sequence[str]]=None) -> None:
+	logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+	args = parse_args(argv)
+
+	prefs = settings_from_args(args)
+	if prefs.xml_path is None:
+		raise SystemExit("No Etterna.xml given, use --etterna-xml")
+	use_replays = not args.no_replays
+	if use_replays and (prefs.replays_dir is None or prefs.songs_root is None):
+		raise SystemExit("The replays analysis needs --replays-dir and --songs-root "
+				+ "(or --no-replays to skip it)")
+
+	trace_path = tracing.path_from_env() or (tracing.TRACE_PATH if prefs.trace else None)
+	if trace_path is not None:
+		tracing.tracer.enable()
+
+	app.app = app.HeadlessApp(prefs, load_blacklisted_charts(args.unranked))
+
+	util.logger.info(f"Loading {prefs.xml_path}")
+	with tracing.span("load_score_table"):
+		table = snapshot.load_score_table(prefs.xml_path)
+	with tracing.span("replays_analysis"):
+		analysis = replays_analysis.analyze(table, prefs.replays_dir) if use_replays else None
+	view = generator_engine.prepare(table, analysis)
+
+	util.logger.info(f"Running the generators on {len(view.scores)} scores")
+	results = compute(view, analysis, processes=args.processes)
+
+	os.makedirs(args.output, exist_ok=True)
+	WRITERS[args.format](results, args.output)
+	util.logger.info(f"Wrote {len(results)} outputs to {args.output}")
+	if trace_path is not None:
+		tracing.tracer.write(trace_path)
+		util.logger.info(f"Wrote the trace to {trace_path}")
+
+if __name__ == "__main__":
+	main()
@@ -13,8 +13,16 @@ from PyQt5.QtCore import *
 import plotter
 import util
 import app
-from settings import SettingsDialog, Settings
-from settings import try_select_xml, try_choose_replays, try_choose_songs_root
+import snapshot
+import unranked
+import replays_analysis
+import memo
+import tracing
+from score_table import ScoreTable
+from worker import Worker
+from settings import Settings
+from settings_dialog import SettingsDialog
+from settings_dialog import try_select_xml, try_choose_replays, try_choose_songs_root
 
 
 """
@@ -29,13 +37,25 @@ notes that were hit out of order. This is not optimal, but I think it
 works well enough.
 
 For session time calculation a session is defined to end when one play
-is more than 1 hours apart from the next play.
+is more than {session_gap} apart from the next play (see the settings).
 
 Also, if you have any more plot ideas - scatter plot, bar chart,
 whatever - I would be thrilled if you sent them to me, over
 Discord/Reddit (kangalioo#9108 and u/kangalioo respectively)
 </p>""".strip()
 
+# ABOUT_TEXT with the current session gap, plus how long everything took so far if tracing is on
+def about_text() -> str:
+	minutes = app.app.prefs.session_gap_minutes
+	session_gap = util.timespan_str(minutes / 60) if minutes >= 60 else f"{minutes} minutes"
+	text = ABOUT_TEXT.format(session_gap=session_gap)
+	if not tracing.tracer.enabled:
+		return text
+	return (text + "<p>Time spent so far, by stage (the full trace is written on exit):</p>"
+			+ tracing.summary_html())
+
+INFOBAR_TEXT = "This is the infobox. Press on a scatter point to see information about the score"
+
 class UI:
 	def __init__(self):
 		# Construct app, root widget and layout
@@ -56,7 +76,7 @@ class UI:
 		
 		main_menu = window.menuBar().addMenu("File")
 		main_menu.addAction("Settings").triggered.connect(lambda: SettingsDialog().exec_())
-		main_menu.addAction("About").triggered.connect(lambda: QMessageBox.about(None, "About", ABOUT_TEXT))
+		main_menu.addAction("About").triggered.connect(lambda: QMessageBox.about(None, "About", about_text()))
 
 		# Put the widgets in
 		self.setup_widgets(layout, window)
@@ -65,13 +85,14 @@ class UI:
 		# simultaneous scrolling and panning when hovering a plot while scrolling
 		class ScrollArea(QScrollArea):
 			def eventFilter(self, _obj, event) -> bool:
-				if event.type() == QEvent.Wheel and any(w.underMouse() for w in app.app.get_pg_plots()):
+				if event.type() == QEvent.Wheel and any(w.underMouse() for w in app.app.get_pg_plots() or []):
 					return True
 				return False
 		scroll = ScrollArea(window)
 		scroll.setWidget(root)
 		scroll.setWidgetResizable(True)
 		window.setCentralWidget(scroll)
+		self.scroll_area = scroll
 		
 		# Start
 		w, h = 1600, 3100
@@ -86,13 +107,23 @@ class UI:
 		self.qapp.exec_()
 	
 	def setup_widgets(self, layout, window):
+		self.layout = layout
+		
 		# Add infobox
 		toolbar = QToolBar()
-		infobar = QLabel("This is the infobox. Press on a scatter point to see information about the score")
+		infobar = QLabel(INFOBAR_TEXT)
 		infobar.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
 		infobar.setAlignment(Qt.AlignCenter)
 		self.infobar = infobar
 		toolbar.addWidget(infobar)
+		
+		# Progress of the replays analysis, only shown while it runs
+		self.progress_bar = QProgressBar()
+		self.progress_bar.setMinimumWidth(400)
+		self.cancel_button = QPushButton("Cancel")
+		self.progress_actions = [toolbar.addWidget(self.progress_bar),
+				toolbar.addWidget(self.cancel_button)]
+		self.set_progress_visible(False)
 		window.addToolBar(Qt.BottomToolBarArea, toolbar)
 		
 		self.box_container = QWidget()
@@ -100,12 +131,37 @@ class UI:
 		self.plot_container = QWidget()
 		layout.addWidget(self.plot_container)
 	
+	def set_progress_visible(self, visible: bool) -> None:
+		for action in self.progress_actions:
+			action.setVisible(visible)
+	
 	def get_box_container_and_plot_container(self):
 		return self.box_container, self.plot_container
 	
+	# Replaces the box and plot containers with empty ones, so that everything can be drawn anew
+	def reset_containers(self):
+		for container in [self.box_container, self.plot_container]:
+			self.layout.removeWidget(container)
+			container.deleteLater()
+		
+		self.box_container = QWidget()
+		self.layout.addWidget(self.box_container)
+		self.plot_container = QWidget()
+		self.layout.addWidget(self.plot_container)
+	
 	def get_qapp(self):
 		return self.qapp
 
+# Carries the progress of the replays analysis over to the GUI thread. The callback is called
+# from a thread of the Rust side
+class _ProgressSignal(QObject):
+	# replays done, replays total, bytes read. object, because int would be 32 bit
+	changed = pyqtSignal(object, object, object)
+
+# Carries the unranked chart list from the download thread over to the GUI thread
+class _UnrankedChartsSignal(QObject):
+	arrived = pyqtSignal(object)
+
 # Handles general application state
 class Application:
 	def run(self):
@@ -113,7 +169,17 @@ class Application:
 		self._prefs = Settings.load_from_json()
 		self._ui = UI()
 		self._infobar_link_connection = None
-		self._blacklisted_charts: List[Tuple[str, str]] = None
+		self._blacklisted_charts: unranked.UnrankedCharts = frozenset()
+		self._unranked_signal = None
+		self._table = None
+		self._analysis = plotter.PendingAnalysis()
+		self._worker = Worker()
+		# The replays analysis gets a thread of its own, so that the plots that don't need it can
+		# be generated in the meantime
+		self._analysis_worker = Worker()
+		self._progress_signal = _ProgressSignal()
+		self._progress_signal.changed.connect(self._on_progress)
+		self._cancel_token = None
 		
 		if self._prefs.is_incomplete():
 			self.try_detect_etterna()
@@ -124,39 +190,113 @@ class Application:
 		
 		self._prefs.save_to_json()
 		
-		self._download_blacklisted_charts()
-
-		box_container, plot_container = self._ui.get_box_container_and_plot_container()
-		self._pg_plots = plotter.draw(self._ui.get_qapp(), box_container, plot_container, self._prefs)
+		trace_path = tracing.path_from_env() or (tracing.TRACE_PATH if self._prefs.trace else None)
+		if trace_path is not None:
+			tracing.tracer.enable()
+		
+		self._load_blacklisted_charts()
+		
+		# The window is usable while the scores are loaded. The plots are drawn once they're
+		# there, and the ones that need the replays analysis are filled in after that
+		self.set_infobar("Loading scores...")
+		self._cancel_token = replays_analysis.cancel_token()
+		self._ui.cancel_button.clicked.connect(self._cancel_analysis)
+		self._worker.submit(self._load, self._on_loaded, on_error=self._on_load_error)
 		
 		self._ui.run()
+		self._worker.cancel()
+		# Don't keep the process alive for an analysis whose results nobody will see
+		self._cancel_token.cancel()
+		self._analysis_worker.cancel()
+		if trace_path is not None:
+			tracing.tracer.write(trace_path)
 	
-	def process_events(self):
-		self._ui.qapp.processEvents()
+	# Runs in the worker thread
+	def _load(self) -> ScoreTable:
+		# Maps the snapshot from the last launch if Etterna.xml didn't change since then
+		with tracing.span("load_score_table"):
+			return snapshot.load_score_table(self._prefs.xml_path)
 	
-	def _download_blacklisted_charts(self):
-		import urllib.request, os
-
-		self._blacklisted_charts = []
-
-		cache_path = "etterna-graph-unranked-cache.html"
-		if os.path.exists(cache_path):
-			with open(cache_path, "r") as f:
-				content = f.read()
+	# Runs in the analysis worker thread
+	def _analyze(self) -> Optional[replays_analysis.ReplaysAnalysis]:
+		with tracing.span("replays_analysis"):
+			return replays_analysis.analyze(self._table, self._prefs.replays_dir,
+					progress=self._progress_signal.changed.emit, cancel=self._cancel_token)
+	
+	def _on_progress(self, done: int, total: int, bytes_read: int) -> None:
+		if self._analysis.done: return # arrived after the analysis finished
+		self._ui.progress_bar.setMaximum(total)
+		self._ui.progress_bar.setValue(done)
+		self._ui.progress_bar.setFormat(f"Analyzing replays: %v/%m ({bytes_read / 1e6:.0f} MB)")
+		self._ui.set_progress_visible(not self._cancel_token.cancelled)
+	
+	def _cancel_analysis(self) -> None:
+		self._cancel_token.cancel()
+		self._ui.set_progress_visible(False)
+		self.set_infobar("Cancelling the replays analysis...")
+	
+	def _on_loaded(self, table: ScoreTable) -> None:
+		self._table = table
+		self.set_infobar("Analyzing replays...")
+		self._draw()
+		self._analysis_worker.submit(self._analyze, self._on_analyzed,
+				on_error=self._on_analysis_error)
+	
+	def _on_load_error(self) -> None:
+		self.set_infobar("Error while loading the scores, see the log")
+	
+	def _on_analyzed(self, analysis: Optional[replays_analysis.ReplaysAnalysis]) -> None:
+		self._ui.set_progress_visible(False)
+		if self._cancel_token.cancelled:
+			self.set_infobar("Replays analysis cancelled, the plots that need it are left empty. "
+					+ "Check the ReplaysV2 folder in the settings and restart")
 		else:
-			try:
-				content = urllib.request.urlopen("https://etternaonline.com/unranked").read()
-				with open(cache_path, "w") as f:
-					f.write(content)
-			except Exception:
-				util.logger.exception("Couldn't download unranked chart list :(")
-				self._blacklisted_charts = []
+			self.set_infobar(INFOBAR_TEXT)
+		self._analysis.finish(analysis)
+	
+	def _on_analysis_error(self) -> None:
+		self._ui.set_progress_visible(False)
+		self.set_infobar("Error in the replays analysis, see the log")
+		self._analysis.finish(None)
+	
+	def _draw(self):
+		# Plots of an earlier draw that weren't generated yet aren't needed anymore
+		self._worker.cancel()
+		if self._pg_plots is not None:
+			self._ui.reset_containers()
+		box_container, plot_container = self._ui.get_box_container_and_plot_container()
+		with tracing.span("layout"):
+			self._pg_plots = plotter.draw(self._worker, self._ui.scroll_area, box_container,
+					plot_container, self._prefs, self._table, self._analysis)
+		# Runs after all the jobs of the draw
+		self._worker.submit(memo.memo.stats,
+				lambda stats: util.logger.debug(f"Derived dataset cache after drawing: {stats}"))
+	
+	# The cached unranked chart list is used right away. If there's none or it's expired, a new
+	# one is downloaded in the background and the plots are redrawn once it's there
+	def _load_blacklisted_charts(self):
+		cache = unranked.load_cache()
+		if cache is not None:
+			self._blacklisted_charts, is_expired = cache
+			if not is_expired:
 				return
 		
-		for row in util.extract_strs(content, "<tr>", "</tr>"):
-			name = util.extract_str(row, "\">", "<")
-			steps = util.extract_str(util.extract_str(row, "</td>", "</td>"), "<td>", "</td>")
-			self._blacklisted_charts.append((name, steps))
+		self._unranked_signal = _UnrankedChartsSignal()
+		self._unranked_signal.arrived.connect(self._on_blacklisted_charts_downloaded)
+		unranked.download_in_background(self._unranked_signal.arrived.emit)
+	
+	def _on_blacklisted_charts_downloaded(self, charts: unranked.UnrankedCharts):
+		if charts == self._blacklisted_charts:
+			return
+		
+		self._blacklisted_charts = charts
+		# If the scores are still loading, the plots are drawn with the new list anyway
+		if self._pg_plots is not None:
+			self._draw()
+	
+	@property
+	def blacklisted_charts(self) -> unranked.UnrankedCharts:
+		return self._blacklisted_charts
 	
 	def is_blacklisted(self, songname: str, stepstype: str) -> bool:
 		return (songname, stepstype) in self._blacklisted_charts
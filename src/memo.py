@@ -0,0 +1,92 @@
+from typing import *
+
+import functools, itertools, threading
+from collections import OrderedDict
+
+
+"""
+Memoization of derived datasets, like the session division or the session ratings. Each dataset
+declares the inputs it's derived from (the score table version, settings fields, the replays
+analysis version...) and the datasets it's computed from. A dataset is cached under the values
+of all those inputs, so it's recomputed exactly when one of them changes. The same dataset can be
+cached for several sets of inputs at once, e.g. for the full view and for a date-restricted view
+(see ScoreView.restrict). Entries for outdated inputs are never asked for again and fall out of the
+cache, which is bounded: least recently used entries are evicted first. To make the datasets of an
+object outdated, give it a new version (next_version())
+
+The cache can be used from multiple threads (the GUI thread and the worker, see worker.py). It's
+not locked while a dataset is computed, so two threads asking for the same missing dataset at the
+same time both compute it
+"""
+
+MAX_ENTRIES = 64
+
+# Source of version numbers for inputs that are objects, like the ScoreTable or the
+# ReplaysAnalysis. Every new object gets a new version
+_versions = itertools.count(1)
+
+def next_version() -> int:
+	return next(_versions)
+
+class Memo:
+	def __init__(self, max_entries: int=MAX_ENTRIES):
+		self.max_entries = max_entries
+		self.hits = 0
+		self.misses = 0
+		# (dataset name, input values, arguments) -> value, least recently used first
+		self._entries: "OrderedDict[Tuple[str, Hashable, Hashable], Any]" = OrderedDict()
+		self._lock = threading.RLock()
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	# Returns the dataset computed from the given input values and arguments, computing it if
+	# necessary
+	def get(self, name: str, inputs: Hashable, compute: Callable[[], Any], args: Hashable=()
+			) -> Any:
+		entry_key = (name, inputs, args)
+		with self._lock:
+			if entry_key in self._entries:
+				self.hits += 1
+				self._entries.move_to_end(entry_key)
+				return self._entries[entry_key]
+
+			self.misses += 1
+
+		value = (compute)()
+
+		with self._lock:
+			self._entries[entry_key] = value
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+		return value
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+
+	def stats(self) -> Dict[str, int]:
+		return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+memo = Memo()
+
+# Decorator for functions that take a ScoreView (plus hashable extra arguments) and return a
+# derived dataset. `inputs` names entries of `view.inputs` the dataset is derived from.
+# `depends` lists other memoized functions the dataset is computed from; their inputs are added to
+# this one's. Note that every dataset derived from the filtered scores depends on the inputs of
+# the filter (see generator_engine.FILTER_INPUTS)
+def memoized(*inputs: str, depends: Iterable[Callable]=()):
+	all_inputs = set(inputs)
+	for dependency in depends:
+		all_inputs.update(dependency.inputs)
+	all_inputs = sorted(all_inputs)
+
+	def decorator(fn):
+		@functools.wraps(fn)
+		def wrapper(view, *args, **kwargs):
+			input_values = tuple(view.inputs[name] for name in all_inputs)
+			return memo.get(fn.__qualname__, input_values, lambda: fn(view, *args, **kwargs),
+					args=(args, tuple(sorted(kwargs.items()))))
+		wrapper.inputs = all_inputs
+		return wrapper
+	return decorator
@@ -0,0 +1,105 @@
+from typing import *
+
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+"""
+This file parses the Modifiers strings of scores, like "C800, 50% Mini, 30% Distant, Overhead".
+The ScoreTable stores every distinct modifier string only once (scores reference them by
+`modifier_ids`), and there are usually only a few hundred of them, so every string is parsed
+once into a ModifierTable row. Plots index the ModifierTable columns with `modifier_ids` to get
+per-score values without parsing anything
+"""
+
+# These values were gathered through a quick-and-dirty screen recording based test. Overhead is
+# the default perspective
+PERSPECTIVE_MULTIPLIERS = {
+	"Overhead": 1,
+	"Incoming": 1 / 1.2931,
+	"Space": 1 / 1.2414,
+	"Hallway": 1 / 1.2931,
+	"Distant": 1 / 1.2759,
+}
+
+@dataclass
+class ParsedModifiers:
+	scroll_type: str = "" # "C" (CMod), "M" (MMod), "X" (XMod) or "" if there's no speed mod
+	speed: float = math.nan # the number of the speed mod
+	receptor_size: float = 1 # 1 without Mini, 0.5 with 100% Mini
+	perspective: str = "" # one of PERSPECTIVE_MULTIPLIERS, or "" if not given
+	perspective_strength: float = 1 # e.g. 0.3 for "30% Distant"
+	# Everything that's not one of the above, e.g. "Reverse", "NoMines" or the noteskin name.
+	# Noteskins can't be told apart from other mods without knowing the installed noteskins
+	other_mods: List[str] = field(default_factory=list)
+
+	# How much the perspective changes the apparent scroll speed
+	@property
+	def perspective_multiplier(self) -> float:
+		if self.perspective == "": return 1
+		return PERSPECTIVE_MULTIPLIERS[self.perspective] ** self.perspective_strength
+
+def _parse_float(string: str) -> Optional[float]:
+	try:
+		return float(string)
+	except ValueError:
+		return None
+
+# Parses something like "50%" into 0.5, or returns None if it's not a percentage
+def _parse_percentage(string: str) -> Optional[float]:
+	if not string.endswith("%"): return None
+	number = _parse_float(string[:-1])
+	return None if number is None else number / 100
+
+def parse_modifiers(string: str) -> ParsedModifiers:
+	parsed = ParsedModifiers()
+	for modifier in string.split(", "):
+		tokens = modifier.split(" ")
+		if parsed.scroll_type == "" and modifier[:1] in ("C", "M", "m") and modifier[1:].isdecimal():
+			parsed.scroll_type = modifier[0].upper()
+			parsed.speed = float(modifier[1:])
+		elif (parsed.scroll_type == "" and modifier.endswith("x")
+				and _parse_float(modifier[:-1]) is not None):
+			parsed.scroll_type = "X"
+			parsed.speed = float(modifier[:-1])
+		elif tokens[-1] == "Mini" and len(tokens) <= 2:
+			# modifier can either be "Mini" or something like "50% Mini"
+			mini = 1 if len(tokens) == 1 else _parse_percentage(tokens[0])
+			if mini is None:
+				parsed.other_mods.append(modifier)
+			elif parsed.receptor_size == 1:
+				parsed.receptor_size = 1 - mini / 2
+		elif tokens[-1] in PERSPECTIVE_MULTIPLIERS and len(tokens) <= 2:
+			# modifier can either be something like "Distant" or "50% Distant"
+			strength = 1 if len(tokens) == 1 else _parse_percentage(tokens[0])
+			if strength is None:
+				parsed.other_mods.append(modifier)
+			# Overhead is listed next to the actual perspective sometimes, e.g. "30% Distant, Overhead"
+			elif tokens[-1] != "Overhead" or parsed.perspective == "":
+				parsed.perspective = tokens[-1]
+				parsed.perspective_strength = strength
+		elif modifier != "":
+			parsed.other_mods.append(modifier)
+	return parsed
+
+# The parsed modifiers of every string in ScoreTable.modifiers. All columns have one entry per
+# modifier string and are indexed with ScoreTable.modifier_ids
+class ModifierTable:
+	def __init__(self, strings: List[str]):
+		self.rows = [parse_modifiers(string) for string in strings]
+
+		self.scroll_types = np.array([row.scroll_type for row in self.rows], dtype="U1")
+		self.speeds = np.array([row.speed for row in self.rows], dtype=np.float64)
+		self.receptor_sizes = np.array([row.receptor_size for row in self.rows], dtype=np.float64)
+		self.perspectives = np.array([row.perspective for row in self.rows], dtype=str)
+		self.perspective_multipliers = np.array([row.perspective_multiplier for row in self.rows],
+				dtype=np.float64)
+		# The CMod the notes actually appear to scroll with, after Mini and the perspective. NaN if
+		# there's no CMod
+		self.effective_cmods = np.where(self.scroll_types == "C",
+				self.speeds * self.receptor_sizes * self.perspective_multipliers, np.nan)
+
+	def __len__(self) -> int:
+		return len(self.rows)
@@ -1,16 +1,50 @@
 from typing import *
 
-import sys
-import xml.etree.ElementTree as ET
+import numpy as np
 
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 
 import data_generators as g
-import replays_analysis, util, chart_wrapper, app
+import util, chart_wrapper, app, generator_engine, tracing
+from worker import Worker
+from replays_analysis import ReplaysAnalysis
+from score_table import ScoreTable, JUDGEMENT_NAMES, HOLD_NAMES, SSR_NAMES
 
 
+# The replays analysis, which usually finishes only after the plots are drawn. draw() lays out the
+# boxes that need it right away, and fills them in once finish() is called
+class PendingAnalysis(QObject):
+	# The analysis, or None if it was cancelled or failed
+	finished = pyqtSignal(object)
+
+	def __init__(self):
+		super().__init__()
+		self.done = False
+		self.analysis: Optional[ReplaysAnalysis] = None
+
+	def finish(self, analysis: Optional[ReplaysAnalysis]) -> None:
+		self.done = True
+		self.analysis = analysis
+		self.finished.emit(analysis)
+
+# Calls `callback` with the analysis once `pending` finishes. Connecting the signal to a closure
+# directly would keep it connected to the widgets of an old draw. This way it's disconnected
+# together with `parent`
+class _AnalysisListener(QObject):
+	def __init__(self, pending: PendingAnalysis, callback: Callable[[Optional[ReplaysAnalysis]], None],
+			parent: QObject):
+		super().__init__(parent)
+		self.callback = callback
+		pending.finished.connect(self._on_finished)
+
+	def _on_finished(self, analysis: Optional[ReplaysAnalysis]) -> None:
+		(self.callback)(analysis)
+
+WAITING_FOR_ANALYSIS_TEXT = "Waiting for the replays analysis..."
+ANALYSIS_UNAVAILABLE_TEXT = "[Needs the replays analysis, which was cancelled or failed]"
+
 def show_scrollable_msgbox(text, title=None, word_wrap=False):
 	label = QLabel(text)
 	label.setWordWrap(word_wrap)
@@ -33,15 +67,14 @@ def show_scrollable_msgbox(text, title=None, word_wrap=False):
 	# for some reason if I do that
 	msgbox.exec_()
 
-def show_score_info(xml, score) -> None:
-	datetime = score.findtext("DateTime")
-	wifescore = float(score.findtext("SSRNormPercent"))
-	chart = util.find_parent_chart(xml, score)
-	pack, song = chart.get("Pack"), chart.get("Song")
+def show_score_info(table, score) -> None:
+	datetime = table.datetimes[score].tolist()
+	wifescore = table.wifescores[score]
+	(_chart, _rate, pack, song, _steps) = table.score_metadata(score)
 	
 	text = f"{datetime}    {100*wifescore:.2f}%    "
-	if len(score.findall("SkillsetSSRs")) == 1:
-		score_value = float(score.findtext(".//Overall"))
+	if table.has_ssrs_mask()[score]:
+		score_value = table.ssrs[score, 0]
 		text += f"Score rating: {score_value}    "
 	else:
 		util.logger.warning("Selected scatter point doesn't have SkillsetSSRs data")
@@ -52,26 +85,26 @@ def show_score_info(xml, score) -> None:
 		lines = [
 			f"<b>{song}</b> ({pack})",
 			f"- <b>{100*wifescore:.2f}%</b> ({util.wifescore_to_grade_string(wifescore)})",
-			f"- Max combo: <b>{score.findtext('MaxCombo')}x</b>",
-			f"- Modifiers: <b>\"{score.findtext('Modifiers')}\"</b>",
+			f"- Max combo: <b>{table.max_combos[score]}x</b>",
+			f"- Modifiers: <b>\"{table.modifier_string(score)}\"</b>",
 		]
 		
-		tap_note_scores = score.find("TapNoteScores")
+		tap_note_scores = dict(zip(JUDGEMENT_NAMES, table.judgements[score].tolist()))
 		names = ["W1", "W2", "W3", "W4", "W5", "Miss"]
-		lines.append("- <b>" + " / ".join(tap_note_scores.findtext(name) for name in names) + "</b>")
+		lines.append("- <b>" + " / ".join(str(tap_note_scores[name]) for name in names) + "</b>")
 		
-		hit_mine = int(tap_note_scores.findtext("HitMine"))
-		avoid_mine = int(tap_note_scores.findtext("AvoidMine"))
+		hit_mine = tap_note_scores["HitMine"]
+		avoid_mine = tap_note_scores["AvoidMine"]
 		try:
 			mine_avoided_ratio = avoid_mine / (hit_mine + avoid_mine)
 		except ZeroDivisionError:
 			mine_avoided_ratio = 1 # when there's no mines at all, just say the player has hit 100%
 		lines.append(f"- Avoided <b>{avoid_mine}/{hit_mine + avoid_mine}</b> mines (<b>{mine_avoided_ratio*100:.2f}%</b>)")
 		
-		hold_note_scores = score.find("HoldNoteScores")
-		let_go = int(hold_note_scores.findtext("LetGo"))
-		held = int(hold_note_scores.findtext("Held"))
-		missed_hold = int(hold_note_scores.findtext("MissedHold"))
+		hold_note_scores = dict(zip(HOLD_NAMES, table.holds[score].tolist()))
+		let_go = hold_note_scores["LetGo"]
+		held = hold_note_scores["Held"]
+		missed_hold = hold_note_scores["MissedHold"]
 		total_holds = let_go + held + missed_hold
 		try:
 			held_ratio = held / total_holds
@@ -79,14 +112,13 @@ def show_score_info(xml, score) -> None:
 			held_ratio = 1
 		lines.append(f"- Held <b>{held}/{total_holds}</b> holds (<b>{held_ratio*100:.2f}%</b>)")
 		
-		skillset_ssrs = score.find("SkillsetSSRs")
-		if skillset_ssrs:
-			lines.append(f"- Overall score rating: <b>{skillset_ssrs.findtext('Overall')}</b>")
-			for skillset_elem in skillset_ssrs:
-				if skillset_elem.tag == "Overall": continue # we already showed that
-				lines.append(f"=> {skillset_elem.tag}: <b>{skillset_elem.text}</b>")
+		if table.has_ssrs_mask()[score]:
+			skillset_ssrs = table.ssrs[score].tolist()
+			lines.append(f"- Overall score rating: <b>{skillset_ssrs[0]}</b>")
+			for name, ssr in zip(SSR_NAMES[1:], skillset_ssrs[1:]): # we already showed Overall
+				lines.append(f"=> {name}: <b>{ssr}</b>")
 		
-		lines.append("Scorekey: " + score.get("Key"))
+		lines.append("Scorekey: " + table.scorekeys[score])
 		
 		show_scrollable_msgbox("<br/>".join(lines), "Score info", word_wrap=True)
 	
@@ -103,33 +135,229 @@ def show_session_info(data) -> None:
 	
 	app.app.set_infobar(text)
 
+# A dropdown for selecting the bin width of a histogram out of `widths`. Whenever the selection
+# changes, `callback` is called with the selected width
+def bin_width_selector(widths: List[float], default: float, unit: str,
+		callback: Callable[[float], None]) -> QWidget:
+	combobox = QComboBox()
+	for width in widths:
+		combobox.addItem(f"Bin width: {width:g}{unit}")
+	combobox.setCurrentIndex(widths.index(default))
+	combobox.currentIndexChanged.connect(lambda i: callback(widths[i]))
+	return combobox
+
+# Two date inputs for selecting a range of days between `first` and `last` (datetime64). Whenever
+# the selection changes, `callback` is called with the selected range as [start, end) datetime64s.
+# "All time" calls it with (None, None) instead, which also includes scores without a date
+def date_range_selector(first: np.datetime64, last: np.datetime64,
+		callback: Callable[[Optional[np.datetime64], Optional[np.datetime64]], None]) -> QWidget:
+	def to_qdate(dt: np.datetime64) -> QDate:
+		return QDate.fromString(str(dt.astype("datetime64[D]")), Qt.ISODate)
+	def from_qdate(qdate: QDate) -> np.datetime64:
+		return np.datetime64(qdate.toString(Qt.ISODate), "s")
+	first, last = to_qdate(first), to_qdate(last)
+	
+	widget = QWidget()
+	layout = QHBoxLayout(widget)
+	layout.setContentsMargins(0, 0, 0, 0)
+	
+	date_edits = []
+	for date in (first, last):
+		date_edit = QDateEdit(date)
+		date_edit.setCalendarPopup(True)
+		date_edit.setDisplayFormat("yyyy-MM-dd")
+		date_edit.setDateRange(first, last)
+		date_edits.append(date_edit)
+	from_edit, to_edit = date_edits
+	
+	def on_change():
+		start, end = from_edit.date(), to_edit.date().addDays(1) # the last day is included
+		callback(from_qdate(start), from_qdate(end))
+	from_edit.dateChanged.connect(on_change)
+	to_edit.dateChanged.connect(on_change)
+	
+	reset_button = QPushButton("All time")
+	def reset():
+		# block the signals so that the callback is only called once
+		for date_edit, date in zip(date_edits, (first, last)):
+			date_edit.blockSignals(True)
+			date_edit.setDate(date)
+			date_edit.blockSignals(False)
+		callback(None, None)
+	reset_button.clicked.connect(reset)
+	
+	layout.addWidget(QLabel("Text boxes show scores from"))
+	layout.addWidget(from_edit)
+	layout.addWidget(QLabel("to"))
+	layout.addWidget(to_edit)
+	layout.addWidget(reset_button)
+	layout.addStretch()
+	return widget
+
+# A plot box whose plot is only generated and created when it's needed, see _LazyPlotBoxes
+class _LazyPlotBox:
+	# `generate` runs in the worker and returns the plot data, `render` turns that data into the
+	# plot widget in the GUI thread. `plots` is the list of currently existing plot widgets, which
+	# the box adds its plot to and removes it from again
+	def __init__(self, worker: Worker, widget: QWidget, layout: QVBoxLayout, placeholder: QLabel,
+			generate, render, expensive: bool, plots: List[QWidget], on_shown: Callable[[], None]):
+		self.worker = worker
+		self.widget = widget
+		self.layout = layout
+		self.placeholder = placeholder
+		self.generate = generate
+		self.render = render
+		self.expensive = expensive
+		self.plots = plots
+		self.on_shown = on_shown
+		self.plot: Optional[QWidget] = None
+		self.loading = False
+		self.failed = False # not retried until the box is evicted
+		# While this is set, the box isn't loaded and shows this text, see block()
+		self.blocked_text: Optional[str] = None
+
+	@property
+	def is_empty(self) -> bool:
+		return self.plot is None and not self.loading and not self.failed and self.blocked_text is None
+
+	# Keeps the box from loading, e.g. while the data it needs isn't there yet. `text` is shown
+	# instead of the plot. None lets it load again
+	def block(self, text: Optional[str]) -> None:
+		self.blocked_text = text
+		self.placeholder.setText(text or "")
+
+	# Distance in pixels between the box and the given vertical range of `root`, 0 if they overlap
+	def distance_to(self, root: QWidget, top: int, bottom: int) -> int:
+		box_top = self.widget.mapTo(root, QPoint(0, 0)).y()
+		box_bottom = box_top + self.widget.height()
+		return max(0, box_top - bottom, top - box_bottom)
+
+	def load(self) -> None:
+		if not self.is_empty: return
+		self.loading = True
+		self.placeholder.setText("Loading...")
+		self.worker.submit(self.generate, self._show, on_error=self._show_error)
+
+	# Drops the plot widget and shows the placeholder again
+	def evict(self) -> None:
+		if self.blocked_text is not None: return # there's nothing to drop
+		self.loading = False # the data of a running load is dropped too
+		self.failed = False
+		self.placeholder.setText("")
+		if self.plot is None: return
+		self.layout.replaceWidget(self.plot, self.placeholder)
+		self.placeholder.show()
+		self.plots.remove(self.plot)
+		self.plot.deleteLater()
+		self.plot = None
+
+	def _show(self, data) -> None:
+		if not self.loading: return # evicted in the meantime
+		self.loading = False
+		self.plot = (self.render)(data)
+		# we set transparent borders here to prevent cascading the border setting from the
+		# container widget
+		self.plot.setStyleSheet("border: 0px solid transparent")
+		self.layout.replaceWidget(self.placeholder, self.plot)
+		self.placeholder.hide()
+		self.plots.append(self.plot)
+		(self.on_shown)()
+
+	def _show_error(self) -> None:
+		if not self.loading: return
+		self.loading = False
+		self.failed = True
+		self.placeholder.setText("[Error while generating plot]")
+
+# Plots are only generated and created when their box is scrolled near the visible area. While
+# the worker has nothing else to do, boxes a bit further away are loaded ahead of time. Plots of
+# boxes that are scrolled far away are dropped again to free their memory, and created anew
+# when they come back
+class _LazyPlotBoxes(QObject):
+	# Margins around the visible area, in multiples of its height
+	LOAD_MARGIN = 0.5
+	IDLE_LOAD_MARGIN = 2
+	EVICT_MARGIN = 4 # larger than IDLE_LOAD_MARGIN so that boxes aren't loaded and evicted over and over
+	IDLE_INTERVAL_MS = 200
+
+	# The object belongs to `parent` (the plot container), so that it's disconnected from the scroll
+	# area and stops loading when the plots are thrown away for a redraw
+	def __init__(self, worker: Worker, scroll_area: QScrollArea, parent: QWidget):
+		super().__init__(parent)
+		self.worker = worker
+		self.scroll_area = scroll_area
+		self.boxes: List[_LazyPlotBox] = []
+
+		scrollbar = scroll_area.verticalScrollBar()
+		scrollbar.valueChanged.connect(self.update)
+		scrollbar.rangeChanged.connect(self.update) # the content or the window was resized
+
+		self.idle_timer = QTimer(self)
+		self.idle_timer.timeout.connect(self._load_while_idle)
+		self.idle_timer.start(self.IDLE_INTERVAL_MS)
+
+	# Returns the boxes with their distances to the visible area, in multiples of its height
+	def _distances(self) -> List[Tuple[float, _LazyPlotBox]]:
+		top = self.scroll_area.verticalScrollBar().value()
+		height = max(1, self.scroll_area.viewport().height())
+		root = self.scroll_area.widget()
+		return [(box.distance_to(root, top, top + height) / height, box) for box in self.boxes]
+
+	# Loads the boxes near the visible area, cheap ones first, and evicts the far away ones
+	def update(self) -> None:
+		distances = self._distances()
+		near = [box for (distance, box) in distances if distance <= self.LOAD_MARGIN]
+		for box in sorted(near, key=lambda box: box.expensive):
+			box.load()
+		for (distance, box) in distances:
+			if distance > self.EVICT_MARGIN:
+				box.evict()
+
+	def _load_while_idle(self) -> None:
+		if self.worker.is_busy(): return
+		candidates = [(distance, box) for (distance, box) in self._distances()
+				if box.is_empty and distance <= self.IDLE_LOAD_MARGIN]
+		if candidates:
+			min(candidates, key=lambda candidate: candidate[0])[1].load()
+
 cmap = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
 		'#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
 
-# returns a list of all the pyqtgraph widgets on which scrolling should be ignored
-def draw(qapp, textbox_container: QWidget, plot_container: QWidget, prefs) -> List[QWidget]:
-	try: # First try UTF-8
-		xmltree = ET.parse(prefs.xml_path, ET.XMLParser(encoding='UTF-8'))
-	except: # If that doesn't work, fall back to system encoding
-		os_encoding = sys.getdefaultencoding()
-		
-		# if the OS says it uses UTF-8, just use a naive 8 bit encoding anyway.
-		# we don't want to fail again
-		if os_encoding.lower() == "utf-8":
-			os_encoding = "ISO-8859-1"
-		
-		util.logger.exception(f"XML parsing with UTF-8 failed, falling back to {os_encoding}")
-		xmltree = ET.parse(prefs.xml_path, ET.XMLParser(encoding=os_encoding))
-	xml = xmltree.getroot()
+# Lays out all text boxes and plot boxes with placeholders and generates their contents in
+# `worker`. The text boxes are filled in right away, the plot boxes once they're scrolled into
+# view (see _LazyPlotBoxes). The boxes that need the replays analysis wait until `analysis` has
+# finished; if it turned out to be unavailable, they say so. If it's known to be unavailable
+# already, the plots that need it are left out.
+# returns a list of all the pyqtgraph widgets on which scrolling should be ignored. It's updated
+# as plots are created and dropped
+def draw(worker: Worker, scroll_area: QScrollArea, textbox_container: QWidget,
+		plot_container: QWidget, prefs, table: ScoreTable, analysis: PendingAnalysis
+		) -> List[QWidget]:
+	# Filter the scores and gather the columns for all generators once, instead of every generator
+	# doing it on its own. None of the filtering depends on the replays analysis
+	view = generator_engine.prepare(table, analysis.analysis)
+	
+	# Called with the analysis once it's finished
+	analysis_callbacks: List[Callable[[Optional[ReplaysAnalysis]], None]] = []
+	def on_analysis_finished(a):
+		for callback in analysis_callbacks:
+			(callback)(a)
+	if not analysis.done:
+		_AnalysisListener(analysis, on_analysis_finished, plot_container)
+	# Whether to draw the plots that need the replays analysis
+	with_analysis = not analysis.done or analysis.analysis is not None
 	
-	analysis = replays_analysis.analyze(xml, prefs.replays_dir)
+	# The text boxes show the scores within the date range selected below them
+	text_view = view
+	textbox_refreshers = {} # (row, col) -> function that fills the text box from `text_view`
 	
 	textbox_grid = QGridLayout(textbox_container)
+	# If `needs_analysis`, `fn` gets the replays analysis as the first argument after the view, and
+	# the text box waits until it's finished
 	def textbox(row: int, col: int, rowspan: int, colspan: int, fn, *args,
-			read_more_title=None, link_handler=lambda link: None, **kwargs):
+			read_more_title=None, link_handler=lambda link: None, needs_analysis=False, **kwargs):
 		
-		text = (fn)(*args, **kwargs)
-		label = QLabel(text)
+		label = QLabel()
 		label.setWordWrap(True)
 		label.setAlignment(Qt.AlignTop | Qt.AlignLeft)
 		label.setTextInteractionFlags(label.textInteractionFlags() | Qt.TextSelectableByMouse);
@@ -144,252 +372,310 @@ def draw(qapp, textbox_container: QWidget, plot_container: QWidget, prefs) -> Li
 			textbox_grid.removeItem(existing_item)
 		textbox_grid.addWidget(label, row, col, rowspan, colspan)
 		
+		def all_args():
+			return (analysis.analysis, *args) if needs_analysis else args
+		
+		def refresh():
+			current_view = text_view
+			if len(current_view) == 0:
+				label.setText("No scores in the selected date range")
+				return
+			if needs_analysis and not analysis.done:
+				label.setText(WAITING_FOR_ANALYSIS_TEXT)
+				return
+			label.setText("Loading...")
+			current_args = all_args()
+			generate = lambda: (fn)(current_view, *current_args, **kwargs)
+			worker.submit(tracing.traced(f"generate: {fn.__name__}", generate), label.setText,
+					on_error=lambda: label.setText("[Error while generating text]"))
+		refresh()
+		textbox_refreshers[(row, col)] = refresh
+		
 		def link_callback(link):
 			if link == "#read_more" and read_more_title:
-				show_scrollable_msgbox((fn)(*args, **kwargs, limit=None), read_more_title, word_wrap=True)
+				current_view, current_args = text_view, all_args()
+				worker.submit(lambda: (fn)(current_view, *current_args, **kwargs, limit=None),
+						lambda text: show_scrollable_msgbox(text, read_more_title, word_wrap=True))
 			else:
 				(link_handler)(link)
 		
 		label.setOpenExternalLinks(False)
 		label.linkActivated.connect(link_callback)
+		
+		if needs_analysis and not analysis.done:
+			analysis_callbacks.append(lambda a: textbox_refreshers[(row, col)]())
 	
-	textbox(0, 0, 4, 5, g.gen_text_most_played_charts, xml, read_more_title="Most played charts")
+	textbox(0, 0, 4, 5, g.gen_text_most_played_charts, read_more_title="Most played charts")
 	def most_played_packs_textbox(all_time=False): # spaghetti
 		read_more_title = "Most played packs (" + ("all time)" if all_time else "last 6 months)")
-		textbox(4, 0, 8, 3, g.gen_text_most_played_packs, xml, months=None if all_time else 6,
+		textbox(4, 0, 8, 3, g.gen_text_most_played_packs, months=None if all_time else 6,
 				read_more_title=read_more_title,
 				link_handler=lambda link: most_played_packs_textbox(all_time=not all_time))
 	most_played_packs_textbox(all_time=False)
-	textbox(0, 5, 4, 2, g.gen_text_skillset_hours, xml)
-	textbox(0, 7, 4, 5, g.gen_text_longest_sessions, xml, read_more_title="Longest sessions")
-	textbox(4, 3, 8, 5, g.gen_text_general_analysis_info, xml, analysis)
-	textbox(4, 8, 8, 4, g.gen_text_general_info, xml, analysis)
+	textbox(0, 5, 4, 2, g.gen_text_skillset_hours)
+	textbox(0, 7, 4, 5, g.gen_text_longest_sessions, read_more_title="Longest sessions")
+	textbox(4, 3, 8, 5, g.gen_text_general_analysis_info, needs_analysis=True)
+	textbox(4, 8, 8, 4, g.gen_text_general_info, needs_analysis=True)
 	
-	all_plots = [] # this will be filled in plotbox() and returned at the end
+	def set_text_date_range(start, end):
+		nonlocal text_view
+		if start is None and end is None:
+			text_view = view # not restricted, so the text boxes can reuse what's memoized already
+		else:
+			text_view = view.restrict(start, end)
+		for refresh in textbox_refreshers.values():
+			refresh()
+	
+	dated = view.sorted_datetimes()[~np.isnat(view.sorted_datetimes())]
+	if len(dated) > 0:
+		selector = date_range_selector(dated[0], dated[-1], set_text_date_range)
+		textbox_grid.addWidget(selector, 12, 0, 1, 12)
+	
+	all_plots = [] # this will be filled by the plot boxes and returned at the end
+	lazy_boxes = _LazyPlotBoxes(worker, scroll_area, plot_container)
 	
 	plotbox_grid = QGridLayout(plot_container)
 	plotbox_grid.setVerticalSpacing(10)
 	plotbox_grid.setHorizontalSpacing(10)
 	cur_row = 0
 	cur_col = 0
-	def plotbox(plot, title: str, colspan: int=1):
+	# Adds a plot box with a placeholder. Once the box is scrolled into view, `generate` is run in
+	# the worker, and `render` is called with the generated data in the GUI thread. The plot widget
+	# it returns replaces the placeholder. Plots whose generation takes long should be marked as
+	# `expensive`, so that the other ones are generated first. `controls` is an optional widget
+	# shown between the title and the plot. Plots that `need_analysis` are only generated once the
+	# replays analysis is there
+	def plotbox(title: str, generate, render, colspan: int=1, expensive: bool=False,
+			controls: Optional[QWidget]=None, needs_analysis: bool=False) -> _LazyPlotBox:
 		nonlocal cur_row, cur_col
 		
-		all_plots.append(plot)
-		
 		container_widget = QWidget()
 		container_widget.setStyleSheet(f"border: 1px solid {util.border_color()}")
 		plotbox_grid.addWidget(container_widget, cur_row, cur_col, 1, colspan)
 		container = QVBoxLayout(container_widget)
 		container.setSpacing(0)
 		
-		# we set transparent borders here to prevent cascading the border setting from the container
-		# widget. this css is in the label style sheet too, see below
-		plot.setStyleSheet("border: 0px solid transparent")
-		
 		label = QLabel(title)
 		label.setStyleSheet("font-size: 18px; font-weight: bold; border: 0px solid transparent")
 		label.setWordWrap(True)
 		label.setAlignment(Qt.AlignHCenter)
 		util.keep(label)
 		
+		placeholder = QLabel()
+		placeholder.setStyleSheet("border: 0px solid transparent")
+		placeholder.setAlignment(Qt.AlignCenter)
+		placeholder.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+		
 		container.addWidget(label)
-		container.addWidget(plot)
+		if controls is not None: container.addWidget(controls)
+		container.addWidget(placeholder)
 		cur_col += colspan
 		if cur_col >= 2:
 			cur_row += 1
 			cur_col = 0
+		
+		# Once a plot is there, the layout changes, so other boxes may have come into view
+		box = _LazyPlotBox(worker, container_widget, container, placeholder,
+				tracing.traced(f"generate: {title}", generate), tracing.traced(f"draw: {title}", render),
+				expensive, all_plots, on_shown=lazy_boxes.update)
+		lazy_boxes.boxes.append(box)
+		if needs_analysis and not analysis.done:
+			box.block(WAITING_FOR_ANALYSIS_TEXT)
+			def unblock(a):
+				box.block(None if a is not None else ANALYSIS_UNAVAILABLE_TEXT)
+			analysis_callbacks.append(unblock)
+		return box
+	
+	# Plot box for a plot drawn by chart_wrapper.draw, with the given draw() arguments
+	def chart(title: str, generate, colspan: int=1, expensive: bool=False,
+			needs_analysis: bool=False, **draw_kwargs):
+		plotbox(title, generate, lambda data: chart_wrapper.draw(data=data, **draw_kwargs),
+				colspan=colspan, expensive=expensive, needs_analysis=needs_analysis)
 	
-	score_info_callback = lambda score: show_score_info(xml, score)
+	score_info_callback = lambda score: show_score_info(table, score)
 	
-	qapp.processEvents()
-	plot = chart_wrapper.draw(
+	chart("Score rating over time", lambda: g.gen_wifescore(view),
 		flags="time_xaxis",
 		color=cmap[0],
 		click_callback=score_info_callback,
-		data=g.gen_wifescore(xml),
 	)
-	plotbox(plot, "Score rating over time")
 	
-	qapp.processEvents()
-	plot = chart_wrapper.draw(
-		flags="time_xaxis manip_yaxis",
-		log_axis_max_shown_value=99,
-		color=cmap[3],
-		click_callback=score_info_callback,
-		data=g.gen_manip(xml, analysis),
-	)
-	plotbox(plot, "Manipulation over time (log scale)")
-	
-	qapp.processEvents()
-	accuracy_data, brushes = g.gen_accuracy(xml, cmap[1])
-	plot = chart_wrapper.draw(
-		flags="time_xaxis accuracy_yaxis",
-		log_axis_min_shown_value=-99,
-		color=brushes,
-		click_callback=score_info_callback,
-		data=accuracy_data,
-	)
-	plotbox(plot, "Accuracy over time (log scale)")
+	if with_analysis:
+		chart("Manipulation over time (log scale)", lambda: g.gen_manip(view, analysis.analysis),
+			needs_analysis=True,
+			flags="time_xaxis manip_yaxis",
+			log_axis_max_shown_value=99,
+			color=cmap[3],
+			click_callback=score_info_callback,
+		)
 	
-	qapp.processEvents()
-	plot = chart_wrapper.draw(
+	def draw_accuracy(result):
+		accuracy_data, brushes = result
+		return chart_wrapper.draw(
+			flags="time_xaxis accuracy_yaxis",
+			log_axis_min_shown_value=-99,
+			color=brushes,
+			click_callback=score_info_callback,
+			data=accuracy_data,
+		)
+	plotbox("Accuracy over time (log scale)", lambda: g.gen_accuracy(view, cmap[1]), draw_accuracy)
+	
+	chart("MA over time (marvelouses÷perfects) (log scale)", lambda: g.gen_ma(view),
 		flags="time_xaxis ma_yaxis",
 		log_axis_max_shown_value=99,
 		color=cmap[6],
 		click_callback=score_info_callback,
-		data=g.gen_ma(xml),
 	)
-	plotbox(plot, "MA over time (marvelouses÷perfects) (log scale)")
 	
-	qapp.processEvents()
-	plot = chart_wrapper.draw(
+	chart("Number of plays per hour of day", lambda: g.gen_plays_by_hour(view),
 		type_="bar",
 		color=cmap[4],
-		data=g.gen_plays_by_hour(xml),
 	)
-	plotbox(plot, "Number of plays per hour of day")
 	
-	qapp.processEvents()
-	plot = chart_wrapper.draw(
+	chart("Rating improvement per session (x=date, y=session length, bubble size=rating improvement)",
+		lambda: g.gen_session_rating_improvement(view),
+		expensive=True,
 		type_="bubble",
 		flags="time_xaxis",
 		color=cmap[2],
 		click_callback=show_session_info,
-		data=g.gen_session_rating_improvement(xml),
 	)
-	plotbox(plot, "Rating improvement per session (x=date, y=session length, bubble size=rating improvement)")
 	
-	qapp.processEvents()
-	plot = chart_wrapper.draw(
+	chart("Effective CMod over time", lambda: g.gen_cmod_over_time(view),
 		type_="line",
 		flags="time_xaxis step thick_line",
 		color=cmap[1],
-		data=g.gen_cmod_over_time(xml),
 	)
-	plotbox(plot, "Effective CMod over time")
 	
-	qapp.processEvents()
-	plot = chart_wrapper.draw(
+	chart("Number of play-hours each week", lambda: g.gen_hours_per_week(view),
 		type_="bar",
 		flags="time_xaxis",
 		color=cmap[5],
 		width=604800*0.8,
-		data=g.gen_hours_per_week(xml),
 	)
-	plotbox(plot, "Number of play-hours each week")
 	
-	qapp.processEvents()
-	plot = chart_wrapper.draw(
-		type_="bar",
-		color=cmap[6],
-		flags="align_to_whole",
-		data=g.gen_wifescore_frequencies(xml),
-	)
-	plotbox(plot, "Number of scores per wifescore percent")
+	# Plots a histogram whose bin width can be changed with a dropdown. `generate` is called with
+	# the bin width and returns bins labeled with their lower bound. Changing the bin width only
+	# rebins the view's columns and redraws the same plot widget
+	def histogram_plotbox(generate, title: str, color, widths: List[float], default: float,
+			unit: str):
+		current_width = default
+		
+		def generate_with(bin_width):
+			return lambda: (bin_width, (generate)(bin_width))
+		def draw_histogram(data, plot_widget=None):
+			(bin_width, (x, y)) = data
+			return chart_wrapper.draw(
+				type_="bar",
+				color=color,
+				width=0.8 * bin_width,
+				data=([v + bin_width / 2 for v in x], y), # center the bars in their bins
+				plot_widget=plot_widget,
+			)
+		
+		def rebin(bin_width):
+			nonlocal current_width
+			current_width = bin_width
+			# Without a plot, there's nothing to redraw. It's generated with the current bin width
+			# once it's there
+			if box.plot is None: return
+			def redraw(data):
+				if box.plot is not None: draw_histogram(data, plot_widget=box.plot)
+			worker.submit(generate_with(bin_width), redraw)
+		selector = bin_width_selector(widths, default, unit, rebin)
+		
+		box = plotbox(title, lambda: generate_with(current_width)(), draw_histogram,
+				controls=selector)
+	
+	histogram_plotbox(lambda bin_width: g.gen_wifescore_frequencies(view, bin_width),
+			"Number of scores per wifescore percent", cmap[6],
+			widths=[0.1, 0.25, 0.5, 1, 2], default=1, unit="%")
 	
 	if prefs.enable_all_plots:
-		qapp.processEvents()
-		plot = chart_wrapper.draw(
-			type_="scatter",
-			flags="diagonal_line",
-			color=cmap[0],
-			data=((analysis.current_wifescores, analysis.new_wifescores), analysis.wifescore_scores),
-			click_callback=score_info_callback,
-		)
-		plotbox(plot, "My rescoring impl (for developer purposes)")
-
-		qapp.processEvents()
-		plot = chart_wrapper.draw(
-			type_="scatter",
-			flags="diagonal_line",
-			color=cmap[0],
-			data=((analysis.wife2_wifescores, [float(score.findtext("SSRNormPercent")) for score in analysis.scores]), analysis.scores),
-			click_callback=score_info_callback,
-		)
-		plotbox(plot, "Wife2 vs Wife3")
+		# Without the replays analysis (e.g. if it was cancelled) these can't be drawn
+		if with_analysis:
+			a = lambda: analysis.analysis
+			chart("My rescoring impl (for developer purposes)",
+				lambda: ((a().current_wifescores, a().new_wifescores), a().wifescore_scores),
+				needs_analysis=True,
+				type_="scatter",
+				flags="diagonal_line",
+				color=cmap[0],
+				click_callback=score_info_callback,
+			)
 		
-		qapp.processEvents()
-		plot = chart_wrapper.draw(
-			type_="bar",
-			color=cmap[3],
-			data=g.gen_hit_distribution_sub_93(xml, analysis),
-		)
-		plotbox(plot, "Hit distribution (only sub 93% scores)")
+			chart("Wife2 vs Wife3",
+				lambda: ((a().wife2_wifescores, table.wifescores[a().scores].tolist()), a().scores),
+				needs_analysis=True,
+				type_="scatter",
+				flags="diagonal_line",
+				color=cmap[0],
+				click_callback=score_info_callback,
+			)
 		
-		qapp.processEvents()
-		plot = chart_wrapper.draw(
-			type_="bar",
-			color=cmap[6],
-			data=g.gen_idle_time_buckets(xml),
-		)
-		plotbox(plot, "Idle time between plays (a bit broken)")
+			chart("Hit distribution (only sub 93% scores)",
+				lambda: g.gen_hit_distribution_sub_93(view, a()),
+				needs_analysis=True,
+				type_="bar",
+				color=cmap[3],
+			)
+		
+		histogram_plotbox(lambda bin_width: g.gen_idle_time_buckets(view, bin_width),
+				"Idle time between plays (a bit broken)", cmap[6],
+				widths=[1, 5, 15, 30, 60], default=5, unit=" s")
 		
 		# The following two were implemented based on an idea of snover. Unfortunately they didn't
 		# provide much insight, so yeah, now they're here.
 		
-		qapp.processEvents()
-		plot = chart_wrapper.draw(
+		chart("Average score rating per hour of day", lambda: g.gen_avg_score_per_hour(view),
 			type_="bar",
 			color=cmap[6],
-			data=g.gen_avg_score_per_hour(xml),
 		)
-		plotbox(plot, "Average score rating per hour of day")
 		
-		qapp.processEvents()
-		plot = chart_wrapper.draw(
+		chart("Score ratings per hour of day", lambda: g.gen_scores_per_hour(view),
 			type_="scatter",
 			color=cmap[6],
 			click_callback=score_info_callback,
-			data=g.gen_scores_per_hour(xml),
 		)
-		plotbox(plot, "Score ratings per hour of day")
 		
-		qapp.processEvents()
-		plot = chart_wrapper.draw(
+		chart("Number of sessions with specific score amount", lambda: g.gen_session_plays(view),
 			type_="bar",
 			color=cmap[6],
-			data=g.gen_session_plays(xml),
 		)
-		plotbox(plot, "Number of sessions with specific score amount")
 		
-		qapp.processEvents()
-		plot = chart_wrapper.draw(
+		chart("Session length over time", lambda: g.gen_session_length(view),
 			flags="time_xaxis",
 			color=cmap[6],
-			data=g.gen_session_length(xml),
 		)
-		plotbox(plot, "Session length over time")
 		
-		qapp.processEvents()
-		plot = chart_wrapper.draw(
+		chart("Number of scores each week", lambda: g.gen_plays_per_week(view),
 			type_="bar",
 			flags="time_xaxis",
 			color=cmap[6],
 			width=604800*0.8,
-			data=g.gen_plays_per_week(xml),
 		)
-		plotbox(plot, "Number of scores each week")
 	
-	qapp.processEvents()
-	plot = chart_wrapper.draw(
+	chart("Skillsets over time", lambda: g.gen_skillset_development(view),
+		colspan=2,
+		expensive=True,
 		type_="stacked line",
 		flags="time_xaxis step",
 		color=["ffffff", *util.skillset_colors], # Include overall
 		legend=["Overall", *util.skillsets], # Include overall
-		data=g.gen_skillset_development(xml),
 	)
-	plotbox(plot, "Skillsets over time", colspan=2)
-
-	qapp.processEvents()
-	plot = chart_wrapper.draw(
+	
+	chart("Skillsets trained per week", lambda: g.gen_week_skillsets(view),
+		colspan=2,
 		type_="stacked bar",
 		flags="time_xaxis",
 		width=(60*60*24*7)*0.8,
 		color=util.skillset_colors,
 		legend=util.skillsets,
-		data=g.gen_week_skillsets(xml),
 	)
-	plotbox(plot, "Skillsets trained per week", colspan=2)
+	
+	# The boxes only have their positions once the layout was processed
+	QTimer.singleShot(0, lazy_boxes.update)
+	# The boxes that waited for the analysis are loaded if they're in view
+	analysis_callbacks.append(lambda a: lazy_boxes.update())
 	
 	return all_plots
@@ -0,0 +1,140 @@
+from typing import *
+
+import os
+from datetime import datetime
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import app
+import data_generators
+from generator_engine import ScoreView
+from score_table import ScoreTable
+
+
+"""
+This file runs data generators in a pool of worker processes, for building many plots at once.
+The generators are pure Python and hold the GIL, so threads can't run them in parallel. The score
+table columns and the scores of the view are copied into one shared memory block once, and every
+worker process maps that block and builds its ScoreView on top of it without copying anything.
+Results are sent back with lists of plain numbers or datetimes packed into numpy arrays, which
+pickle into one buffer instead of one object per element.
+
+Generators are called by name, and their arguments must be picklable. Generators that take the
+replays analysis are better run in the main process, since the analysis would be pickled for
+every call
+"""
+
+DEFAULT_PROCESSES = os.cpu_count() or 1
+
+# A call of a function in data_generators, with the ScoreView as the first argument
+@dataclass
+class GeneratorCall:
+	name: str
+	args: tuple = ()
+	kwargs: Dict[str, Any] = field(default_factory=dict)
+
+# Offsets are aligned like this, so that no array starts in the middle of a cache line
+_ALIGNMENT = 64
+
+# A shared memory block holding a set of numpy arrays. The block is freed by close()
+class SharedColumns:
+	def __init__(self, arrays: Dict[str, np.ndarray]):
+		# array name -> (offset, dtype, shape)
+		self.layout: Dict[str, Tuple[int, str, Tuple[int, ...]]] = {}
+		size = 0
+		for name, array in arrays.items():
+			self.layout[name] = (size, array.dtype.str, array.shape)
+			size += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+
+		self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+		for name, array in attach_arrays(self.shm, self.layout).items():
+			array[...] = arrays[name]
+
+	@property
+	def name(self) -> str:
+		return self.shm.name
+
+	def close(self) -> None:
+		self.shm.close()
+		self.shm.unlink()
+
+# Returns the arrays of the given layout (see SharedColumns) as views into the shared memory block
+def attach_arrays(shm: shared_memory.SharedMemory, layout: Dict[str, Tuple[int, str, Tuple[int, ...]]]
+		) -> Dict[str, np.ndarray]:
+	return {
+		name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+		for name, (offset, dtype, shape) in layout.items()
+	}
+
+class _PackedList:
+	def __init__(self, array: np.ndarray):
+		self.array = array
+
+def _pack(value: Any) -> Any:
+	if isinstance(value, tuple):
+		return tuple(_pack(element) for element in value)
+	if isinstance(value, list) and len(value) > 0:
+		kind = type(value[0])
+		if kind in (int, float, datetime) and all(type(element) is kind for element in value):
+			dtype = "datetime64[us]" if kind is datetime else None
+			return _PackedList(np.array(value, dtype=dtype))
+		return [_pack(element) for element in value]
+	return value
+
+def _unpack(value: Any) -> Any:
+	if isinstance(value, _PackedList):
+		return value.array.tolist()
+	if isinstance(value, tuple):
+		return tuple(_unpack(element) for element in value)
+	if isinstance(value, list):
+		return [_unpack(element) for element in value]
+	return value
+
+# State of a worker process, set up by _init_process
+_shm: Optional[shared_memory.SharedMemory] = None
+_view: Optional[ScoreView] = None
+
+def _init_process(shm_name, layout, lists, scalars, inputs, prefs, blacklisted_charts) -> None:
+	global _shm, _view
+	# The worker processes share the resource tracker of the main process, so the block stays
+	# registered once and is only freed by SharedColumns.close()
+	_shm = shared_memory.SharedMemory(name=shm_name)
+	arrays = attach_arrays(_shm, layout)
+
+	table = ScoreTable()
+	for name in ScoreTable.COLUMNS:
+		setattr(table, name, arrays[name])
+	for name, value in {**lists, **scalars}.items():
+		setattr(table, name, value)
+	table.version = inputs["table"]
+
+	app.app = app.HeadlessApp(prefs, blacklisted_charts)
+	_view = ScoreView(table, arrays["view_scores"], inputs)
+
+def _run(call: GeneratorCall) -> Any:
+	fn = getattr(data_generators, call.name)
+	return _pack((fn)(_view, *call.args, **call.kwargs))
+
+# Runs the given generators on the view in `processes` worker processes, and returns their
+# results in the same order. Put the slowest calls first, they're started first
+def run_generators(view: ScoreView, calls: Sequence[GeneratorCall],
+		processes: int=DEFAULT_PROCESSES) -> List[Any]:
+	table = view.table
+	arrays = {name: np.asarray(getattr(table, name)) for name in ScoreTable.COLUMNS}
+	arrays["view_scores"] = view.scores
+	lists = {name: list(getattr(table, name)) for name in ScoreTable.LISTS}
+	scalars = {name: getattr(table, name) for name in ScoreTable.SCALARS}
+
+	columns = SharedColumns(arrays)
+	try:
+		initargs = (columns.name, columns.layout, lists, scalars, view.inputs, app.app.prefs,
+				app.app.blacklisted_charts)
+		with ProcessPoolExecutor(max_workers=min(processes, max(len(calls), 1)),
+				initializer=_init_process, initargs=initargs) as executor:
+			futures = [executor.submit(_run, call) for call in calls]
+			return [_unpack(future.result()) for future in futures]
+	finally:
+		columns.close()
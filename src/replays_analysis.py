@@ -3,9 +3,16 @@ from typing import *
 import os
 from dataclasses import dataclass
 
+import numpy as np
+
 import util
-from util import parsedate
 import app
+import memo
+import tracing
+
+# Where analyze() keeps the analysis results of every replay between runs, so that only new
+# replays have to be read on the next launch
+CACHE_PATH = "etterna-graph-replays-cache.bin"
 
 @dataclass
 class FastestCombo:
@@ -17,8 +24,8 @@ class FastestCombo:
 
 class ReplaysAnalysis:
 	def __init__(self):
-		self.scores = []
-		self.datetimes = []
+		self.scores = [] # score table indices
+		self.datetimes: np.ndarray = None # datetime64[s]
 		self.manipulations: List[float] = []
 		self.wife2_wifescores: List[float] = None # this one doesn't need timingdata
 		self.offset_mean = 0
@@ -33,60 +40,85 @@ class ReplaysAnalysis:
 		# these three do
 		self.current_wifescores: List[float] = None
 		self.new_wifescores: List[float] = None
-		self.wifescore_scores: List[Any] = None
+		self.wifescore_scores: np.ndarray = None # score table indices
+		# Identifies this analysis in the memoization keys of derived datasets
+		self.version = memo.next_version()
+
+# The timing info of every song in the Songs folder, which the analysis needs for everything that
+# depends on note timing. Building it reads every .sm file, so it's memoized per folder
+def songs_timing_index(songs_root: str):
+	import savegame_analysis
+	def build():
+		with tracing.span("build_timing_info_index"):
+			return savegame_analysis.SongsTimingIndex(songs_root)
+	return memo.memo.get("songs_timing_index", songs_root, build)
+
+# Token for cancelling a running analyze() from another thread, see its `cancel` argument
+def cancel_token():
+	import savegame_analysis
+	return savegame_analysis.CancelToken()
 
 # This function is responsible for replay analysis. Every chart that uses replay data has it from
 # here.
 # It works by:
-# 1) Collecting all chartkeys into a list
-# 2) Passing the list to savegame_analysis library (written in Rust, so it's blazingly fast :tm:)
+# 1) Collecting the indices of all scores to analyze
+# 2) Passing them, together with the natively parsed score table, to savegame_analysis library
+#    (written in Rust, so it's blazingly fast :tm:)
 # 3) Transfer the data from Rusts's ReplaysAnalaysis object to an instance of our ReplaysAnalysis
 #    class written in Python
-# 3.1) This involves traversing the xml once again, to collect score datetimes and score xml objects
-def analyze(xml, replays) -> Optional[ReplaysAnalysis]:
+# `songs_index` is the songs_timing_index of the Songs folder, which is looked up from the settings
+# if not given.
+# The Rust side releases the GIL while it reads the replays. It calls `progress` with
+# (replays_done, replays_total, bytes_read) a few times per second, from another thread. Once
+# `cancel` (see cancel_token()) is cancelled, it stops and None is returned.
+# The results of every replay are cached in `cache_path`, keyed by scorekey, replay file size and
+# modification time, rate and the chart's bpms. Replays that match their cache entry aren't read
+# again. Pass None to analyze every replay from scratch
+def analyze(table, replays, songs_index=None, progress: Optional[Callable[[int, int, int], None]]=None,
+		cancel=None, cache_path: Optional[str]=CACHE_PATH) -> Optional[ReplaysAnalysis]:
 	import savegame_analysis
 	
 	"""
-	create(prefix: &str, scorekeys: Vec<&str>, wifescores: Vec<f32>,
-			packs: Vec<&str>, songs: Vec<&str>,
-			songs_root: &str
+	create(prefix: &str, table: PyRef<ScoreTable>, score_indices: Vec<usize>,
+			songs: PyRef<SongsTimingIndex>, progress: Option<PyObject>,
+			cancel: Option<PyRef<CancelToken>>, cache_path: Option<&str>)
 	"""
 	
+	if songs_index is None:
+		songs_index = songs_timing_index(app.app.prefs.songs_root)
+	
 	r = ReplaysAnalysis()
 	
-	chartkeys: List[str] = []
-	wifescores: List[float] = []
-	packs: List[str] = []
-	songs: List[str] = []
-	rates: List[float] = []
-	all_scores: List[Any] = []
-	for chart in xml.iter("Chart"):
-		pack = chart.get("Pack")
-		song = chart.get("Song")
-		
-		if "Generation Rock" in song and "German Dump Mini Pack" in pack: continue # this file is borked
-		
-		for scoresat in chart:
-			rate = float(scoresat.get("Rate"))
-			for score in scoresat:
-				# We exclude failed scores because those exhibit some.. weird behavior in the replay
-				# file. not sure what exactly it is, but somehow the wifescore in the xml doesn't
-				# match the wifescore we get when recalculating it manually using the replay file
-				# We don't want such outliers in our graphs, so - be gone, failed scores
-				if score.findtext("Grade") == "Failed": continue
-
-				chartkeys.append(score.get("Key"))
-				wifescores.append(float(score.findtext("SSRNormPercent")))
-				packs.append(pack)
-				songs.append(song)
-				rates.append(rate)
-				all_scores.append(score)
+	is_borked_chart = np.array([
+		song is not None and pack is not None
+		and "Generation Rock" in song and "German Dump Mini Pack" in pack # this file is borked
+		for (pack, song) in zip(table.packs, table.songs)
+	], dtype=bool)
+	
+	# We exclude failed scores because those exhibit some.. weird behavior in the replay
+	# file. not sure what exactly it is, but somehow the wifescore in the xml doesn't
+	# match the wifescore we get when recalculating it manually using the replay file
+	# We don't want such outliers in our graphs, so - be gone, failed scores
+	all_scores = np.flatnonzero(~is_borked_chart[table.chart_indices] & ~table.failed_mask())
+	
+	# The Rust side reads scorekeys, wifescores, packs, songs and rates straight from its own
+	# score table. If our table came from the snapshot, there is none, so hand over those columns
+	native = table.native
+	if native is None:
+		with tracing.span("native_score_table_from_columns"):
+			native = savegame_analysis.ScoreTable.from_replays_columns(table.scorekeys.tolist(),
+					table.chart_indices.tolist(), table.rates.tolist(), table.wifescores.tolist(),
+					list(table.packs), list(table.songs))
 	
 	prefix = os.path.join(replays, "a")[:-1]
 	print("Starting replays analysis...")
-	rustr = savegame_analysis.ReplaysAnalysis(prefix,
-			chartkeys, wifescores, packs, songs, rates,
-			app.app.prefs.songs_root)
+	try:
+		with tracing.span("ReplaysAnalysis::create", scores=len(all_scores)):
+			rustr = savegame_analysis.ReplaysAnalysis(prefix, native, all_scores.tolist(),
+					songs_index, progress, cancel, cache_path)
+	except savegame_analysis.Cancelled:
+		print("Replays analysis cancelled")
+		return None
 	print("Done with replays analysis")
 	
 	def convert_combo_info(rust_combo_info):
@@ -95,7 +127,7 @@ def analyze(xml, replays) -> Optional[ReplaysAnalysis]:
 				speed=rust_combo_info.speed,
 				start_second=rust_combo_info.start_second,
 				end_second=rust_combo_info.end_second,
-				score=None) # this field is set below, in the score xml iteration
+				score=None) # this field is set below, when iterating the analyzed scores
 	r.fastest_combo = convert_combo_info(rustr.fastest_combo)
 	r.fastest_jack = convert_combo_info(rustr.fastest_jack)
 	r.fastest_acc = convert_combo_info(rustr.fastest_acc)
@@ -110,12 +142,8 @@ def analyze(xml, replays) -> Optional[ReplaysAnalysis]:
 		return None
 	
 	# this is NOT part of replays analysis. this is xml analysis. this is in here anyway because
-	# it's easier. this should really be moved into a separate xml analysis module (in case I'll
-	# ever get around implementing that...?)
-	r.total_notes = 0
-	for tap_note_scores in xml.iter("TapNoteScores"):
-		judgements = ["Miss", "W1", "W2", "W3", "W4", "W5"]
-		r.total_notes += sum(int(tap_note_scores.findtext(x)) for x in judgements)
+	# it's easier
+	r.total_notes = int(table.judgements[:, :6].sum()) # Miss, W1, W2, W3, W4, W5
 	
 	r.wife2_wifescores = rustr.wife2_wifescores
 	r.offset_mean = rustr.deviation_mean
@@ -130,21 +158,17 @@ def analyze(xml, replays) -> Optional[ReplaysAnalysis]:
 	r.current_wifescores = rustr.current_wifescores
 	r.new_wifescores = rustr.new_wifescores
 	
-	r.wifescore_scores = [all_scores[i] for i in rustr.timing_info_dependant_score_indices]
-	r.scores = [all_scores[score_index] for score_index in rustr.score_indices]
-	r.datetimes = [parsedate(score.findtext("DateTime")) for score in r.scores]
-	
-	# replace the scorekeys returned from Rust replays analysis with the actual score elements
-	for score in r.scores:
-		scorekey = score.get("Key")
-		if scorekey == rustr.longest_mcombo[1]:
-			r.longest_mcombo = (rustr.longest_mcombo[0], util.find_parent_chart(xml, score))
-		if scorekey == rustr.fastest_combo_scorekey:
-			r.fastest_combo.score = score
-		if scorekey == rustr.fastest_jack_scorekey:
-			r.fastest_jack.score = score
-		if scorekey == rustr.fastest_acc_scorekey:
-			r.fastest_acc.score = score
+	r.wifescore_scores = np.array(rustr.timing_info_dependant_score_indices, dtype=int)
+	r.scores = np.array(rustr.score_indices, dtype=int)
+	r.datetimes = table.datetimes[r.scores]
+	
+	# replace the scorekeys returned from Rust replays analysis with score table indices
+	longest_mcombo_score = table.find_score(rustr.longest_mcombo[1])
+	if longest_mcombo_score is not None:
+		r.longest_mcombo = (rustr.longest_mcombo[0], util.find_parent_chart(table, longest_mcombo_score))
+	r.fastest_combo.score = table.find_score(rustr.fastest_combo_scorekey)
+	r.fastest_jack.score = table.find_score(rustr.fastest_jack_scorekey)
+	r.fastest_acc.score = table.find_score(rustr.fastest_acc_scorekey)
 	
 	print(r.fastest_acc)
 	print(rustr.fastest_acc_scorekey)
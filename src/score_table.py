@@ -0,0 +1,484 @@
+from typing import *
+
+import math, mmap, hashlib, itertools
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+import util, memo, tracing
+from modifiers import ModifierTable
+
+
+"""
+This file turns Etterna.xml into a ScoreTable: a columnar table with one row per score. Etterna.xml
+is read incrementally, and every element is thrown away as soon as its data is copied into the
+table, so we never have the whole document in memory at once. The data generators operate on the
+numpy columns of the table instead of walking the xml over and over again
+
+The file is memory-mapped and split into the byte ranges of the individual <Chart> elements. Each
+chart is hashed, so that a reload only needs to parse the charts that changed
+"""
+
+# Column order of ScoreTable.ssrs. Same order as the children of <SkillsetSSRs>
+SSR_NAMES = ["Overall", "Stream", "Jumpstream", "Handstream", "Stamina", "JackSpeed",
+		"Chordjack", "Technical"]
+# Column order of ScoreTable.judgements (children of <TapNoteScores>)
+JUDGEMENT_NAMES = ["W1", "W2", "W3", "W4", "W5", "Miss", "HitMine", "AvoidMine"]
+# Column order of ScoreTable.holds (children of <HoldNoteScores>)
+HOLD_NAMES = ["LetGo", "Held", "MissedHold"]
+
+# The encodings a ScoreTable can be decoded with, see _charts_encoding
+UTF_8 = "UTF-8"
+LATIN_1 = "ISO-8859-1"
+
+_JUDGEMENT_INDICES = {name: i for i, name in enumerate(JUDGEMENT_NAMES)}
+_HOLD_INDICES = {name: i for i, name in enumerate(HOLD_NAMES)}
+
+class ScoreTable:
+	# Names of all per-score numpy columns
+	COLUMNS = ["scorekeys", "chart_indices", "rates", "datetimes", "wifescores", "ssrs",
+			"survive_seconds", "max_combos", "judgements", "holds", "valid", "grades",
+			"modifier_ids"]
+	# Names of all plain Python list attributes (chart metadata and string lookup tables)
+	LISTS = ["chart_keys", "packs", "songs", "steps", "chart_hashes", "grade_names", "modifiers"]
+	# Names of all scalar attributes
+	SCALARS = ["total_session_seconds", "total_gameplay_seconds", "encoding"]
+	
+	def __init__(self):
+		# Chart metadata. Every score points into these lists via `chart_indices`
+		self.chart_keys: List[str] = []
+		self.packs: List[str] = []
+		self.songs: List[str] = []
+		self.steps: List[str] = []
+		# Hash of the raw bytes of every <Chart> element, used to find changed charts on reload
+		self.chart_hashes: List[str] = []
+
+		# Score columns. All of these have one entry per score, in the order the scores appear in
+		# Etterna.xml
+		self.scorekeys: np.ndarray = None # str
+		self.chart_indices: np.ndarray = None # int32, index into the chart lists above
+		self.rates: np.ndarray = None # float64, the Rate of the parent ScoresAt
+		self.datetimes: np.ndarray = None # datetime64[s]
+		self.wifescores: np.ndarray = None # float64, SSRNormPercent
+		self.ssrs: np.ndarray = None # float64, shape (n, 8), see SSR_NAMES. NaN if not available
+		self.survive_seconds: np.ndarray = None # float64
+		self.max_combos: np.ndarray = None # int32
+		self.judgements: np.ndarray = None # int32, shape (n, 8), see JUDGEMENT_NAMES
+		self.holds: np.ndarray = None # int32, shape (n, 3), see HOLD_NAMES
+		self.valid: np.ndarray = None # bool, EtternaValid
+		self.grades: np.ndarray = None # int8, index into `grade_names`
+		self.modifier_ids: np.ndarray = None # int32, index into `modifiers`
+
+		# Lookup tables for the interned string columns
+		self.grade_names: List[str] = []
+		self.modifiers: List[str] = []
+
+		# The savegame_analysis.ScoreTable this table was created from, if it was parsed natively
+		# in one go. The Rust replays analysis operates on it directly. Not part of the snapshot
+		self.native = None
+
+		# Maps scorekey to row. Built on first use by find_score()
+		self._scorekey_index: Optional[Dict[str, int]] = None
+		# Parsed `modifiers`. Built on first use by modifier_table()
+		self._modifier_table: Optional[ModifierTable] = None
+
+		# Selected values from <GeneralData>
+		self.total_session_seconds = 0
+		self.total_gameplay_seconds = 0
+
+		# The encoding all charts were decoded with, UTF_8 or LATIN_1
+		self.encoding = UTF_8
+
+		# Identifies this table in the memoization keys of derived datasets. Not part of the
+		# snapshot
+		self.version = memo.next_version()
+
+	def __len__(self) -> int:
+		return len(self.scorekeys)
+
+	@property
+	def num_charts(self) -> int:
+		return len(self.chart_keys)
+
+	def failed_mask(self) -> np.ndarray:
+		if "Failed" not in self.grade_names:
+			return np.zeros(len(self), dtype=bool)
+		return self.grades == self.grade_names.index("Failed")
+
+	def has_ssrs_mask(self) -> np.ndarray:
+		return ~np.isnan(self.ssrs[:, 0])
+
+	# Returns the row of the score with the given scorekey, or None if there's no such score
+	def find_score(self, scorekey: str) -> Optional[int]:
+		if self._scorekey_index is None:
+			self._scorekey_index = {key: i for (i, key) in enumerate(self.scorekeys.tolist())}
+		return self._scorekey_index.get(scorekey)
+
+	# Returns (chart index, rate, pack, song, steps) of the given score
+	def score_metadata(self, score) -> Tuple[int, float, str, str, str]:
+		chart = int(self.chart_indices[score])
+		rate = float(self.rates[score])
+		return (chart, rate, self.packs[chart], self.songs[chart], self.steps[chart])
+
+	def modifier_string(self, score) -> str:
+		return self.modifiers[self.modifier_ids[score]]
+
+	# Returns the parsed modifier strings. Index its columns with `modifier_ids` to get the values
+	# of scores
+	def modifier_table(self) -> ModifierTable:
+		if self._modifier_table is None:
+			self._modifier_table = ModifierTable(self.modifiers)
+		return self._modifier_table
+
+	def grade_name(self, score) -> str:
+		return self.grade_names[self.grades[score]]
+
+# Maps strings to small integer ids, so that a column with lots of repeating strings can be stored
+# as an integer array plus a list of the unique strings
+class _Interner:
+	def __init__(self):
+		self.strings: List[str] = []
+		self._ids: Dict[str, int] = {}
+
+	def intern(self, string: str) -> int:
+		string_id = self._ids.get(string)
+		if string_id is None:
+			string_id = len(self.strings)
+			self._ids[string] = string_id
+			self.strings.append(string)
+		return string_id
+
+class _ColumnBuilder:
+	def __init__(self):
+		self.table = ScoreTable()
+		self.grades = _Interner()
+		self.modifiers = _Interner()
+
+		self.scorekeys = []
+		self.chart_indices = []
+		self.rates = []
+		self.datetimes = []
+		self.wifescores = []
+		self.ssrs = []
+		self.survive_seconds = []
+		self.max_combos = []
+		self.judgements = []
+		self.holds = []
+		self.valid = []
+		self.grade_ids = []
+		self.modifier_ids = []
+
+	def add_chart(self, elem) -> None:
+		self.table.chart_keys.append(elem.get("Key"))
+		self.table.packs.append(elem.get("Pack"))
+		self.table.songs.append(elem.get("Song"))
+		self.table.steps.append(elem.get("Steps"))
+
+	def add_score(self, elem, rate: float) -> None:
+		wifescore = math.nan
+		ssrs = [math.nan] * len(SSR_NAMES)
+		judgements = [0] * len(JUDGEMENT_NAMES)
+		holds = [0] * len(HOLD_NAMES)
+		datetime = None # parsed all at once in finish()
+		survive_seconds = 0.0
+		max_combo = 0
+		valid = True
+		grade = ""
+		modifiers = ""
+
+		# A single pass over the children is a lot faster than calling findtext for every field
+		for child in elem:
+			tag = child.tag
+			if tag == "SSRNormPercent":
+				wifescore = float(child.text)
+			elif tag == "DateTime":
+				datetime = child.text
+			elif tag == "SkillsetSSRs":
+				for i, ssr_elem in enumerate(child):
+					if i < len(ssrs): ssrs[i] = float(ssr_elem.text)
+			elif tag == "TapNoteScores":
+				for judgement_elem in child:
+					i = _JUDGEMENT_INDICES.get(judgement_elem.tag)
+					if i is not None: judgements[i] = int(judgement_elem.text)
+			elif tag == "HoldNoteScores":
+				for hold_elem in child:
+					i = _HOLD_INDICES.get(hold_elem.tag)
+					if i is not None: holds[i] = int(hold_elem.text)
+			elif tag == "SurviveSeconds":
+				survive_seconds = float(child.text)
+			elif tag == "MaxCombo":
+				max_combo = int(child.text)
+			elif tag == "EtternaValid":
+				valid = child.text != "0"
+			elif tag == "Grade":
+				grade = child.text
+			elif tag == "Modifiers":
+				modifiers = child.text or ""
+
+		self.scorekeys.append(elem.get("Key"))
+		self.chart_indices.append(len(self.table.chart_keys) - 1)
+		self.rates.append(rate)
+		self.datetimes.append(datetime)
+		self.wifescores.append(wifescore)
+		self.ssrs.append(ssrs)
+		self.survive_seconds.append(survive_seconds)
+		self.max_combos.append(max_combo)
+		self.judgements.append(judgements)
+		self.holds.append(holds)
+		self.valid.append(valid)
+		self.grade_ids.append(self.grades.intern(grade))
+		self.modifier_ids.append(self.modifiers.intern(modifiers))
+
+	def finish(self) -> ScoreTable:
+		t = self.table
+		t.scorekeys = np.array(self.scorekeys, dtype=str)
+		t.chart_indices = np.array(self.chart_indices, dtype=np.int32)
+		t.rates = np.array(self.rates, dtype=np.float64)
+		t.datetimes = util.parse_datetimes(self.datetimes)
+		t.wifescores = np.array(self.wifescores, dtype=np.float64)
+		t.ssrs = np.array(self.ssrs, dtype=np.float64).reshape(-1, len(SSR_NAMES))
+		t.survive_seconds = np.array(self.survive_seconds, dtype=np.float64)
+		t.max_combos = np.array(self.max_combos, dtype=np.int32)
+		t.judgements = np.array(self.judgements, dtype=np.int32).reshape(-1, len(JUDGEMENT_NAMES))
+		t.holds = np.array(self.holds, dtype=np.int32).reshape(-1, len(HOLD_NAMES))
+		t.valid = np.array(self.valid, dtype=bool)
+		t.grades = np.array(self.grade_ids, dtype=np.int8)
+		t.modifier_ids = np.array(self.modifier_ids, dtype=np.int32)
+		t.grade_names = self.grades.strings
+		t.modifiers = self.modifiers.strings
+		return t
+
+# Returns the byte ranges of all <Chart> elements in <PlayerScores>. Each range covers exactly one
+# chart, from the opening tag to the end of the closing tag
+def _find_chart_ranges(data) -> List[Tuple[int, int]]:
+	ranges = []
+	begin = data.find(b"<PlayerScores>")
+	if begin == -1: return ranges
+	end = data.find(b"</PlayerScores>", begin)
+	if end == -1: return ranges
+
+	pos = begin
+	while True:
+		chart_start = data.find(b"<Chart ", pos, end)
+		if chart_start == -1: break
+
+		# A truncated chart ends the scan, like in find_chart_ranges in savegame_analysis
+		tag_end = data.find(b">", chart_start, end)
+		if tag_end == -1: break
+		if data[tag_end - 1:tag_end] == b"/": # <Chart .../> without any scores
+			chart_end = tag_end + 1
+		else:
+			close_tag = data.find(b"</Chart>", tag_end, end)
+			if close_tag == -1: break
+			chart_end = close_tag + len(b"</Chart>")
+		ranges.append((chart_start, chart_end))
+		pos = chart_end
+	return ranges
+
+# Etterna writes UTF-8, but some old save games contain text in the 8 bit system encoding. The
+# encoding is decided once for the whole file: if every chart is valid UTF-8, all of them are
+# decoded as UTF-8, otherwise all of them as ISO-8859-1 (which accepts any bytes). That's the same
+# rule as in savegame_analysis, so that both parsers agree on every chart
+def _charts_encoding(data, ranges: List[Tuple[int, int]]) -> str:
+	for (start, end) in ranges:
+		try:
+			data[start:end].decode("utf-8")
+		except UnicodeDecodeError:
+			return LATIN_1
+	return UTF_8
+
+def _chart_hash(chunk: bytes) -> str:
+	return hashlib.blake2b(chunk, digest_size=16).hexdigest()
+
+# Reads an integer element from <GeneralData>, which comes before <PlayerScores>
+def _find_general_data_int(data, tag: str, search_end: int) -> int:
+	open_tag, close_tag = f"<{tag}>".encode(), f"</{tag}>".encode()
+	start = data.find(open_tag, 0, search_end)
+	if start == -1: return 0
+	start += len(open_tag)
+	end = data.find(close_tag, start, search_end)
+	if end == -1: return 0
+	return int(data[start:end])
+
+# File-like object that serves the given byte ranges of `data`, wrapped in a <PlayerScores>
+# element. That way iterparse can parse just the selected charts, as if they were a document on
+# their own
+class _ChartChunkReader:
+	def __init__(self, data, ranges: List[Tuple[int, int]]):
+		self._chunks = itertools.chain(
+			[b"<PlayerScores>"],
+			(data[start:end] for (start, end) in ranges),
+			[b"</PlayerScores>"],
+		)
+
+	def read(self, size: int=-1) -> bytes:
+		return next(self._chunks, b"")
+
+def _parse(data, ranges: List[Tuple[int, int]], encoding: str) -> ScoreTable:
+	builder = _ColumnBuilder()
+
+	# Stack of the currently open elements. We need it to know the parent of an element, which
+	# ElementTree doesn't tell us
+	open_elems = []
+	rate = 1.0
+	parser = ET.XMLParser(encoding=encoding)
+	source = _ChartChunkReader(data, ranges)
+	with tracing.span("parse_charts_python", charts=len(ranges), encoding=encoding):
+		for event, elem in ET.iterparse(source, events=("start", "end"), parser=parser):
+			if event == "start":
+				if elem.tag == "Chart" and len(open_elems) == 1:
+					builder.add_chart(elem)
+				elif elem.tag == "ScoresAt":
+					rate = float(elem.get("Rate"))
+				open_elems.append(elem)
+				continue
+
+			open_elems.pop()
+			if elem.tag == "Score":
+				builder.add_score(elem, rate)
+				elem.clear()
+			elif elem.tag == "Chart" and len(open_elems) == 1:
+				# Throw away finished charts
+				open_elems[0].remove(elem)
+
+		return builder.finish()
+
+# Wraps the columns of a savegame_analysis.ScoreTable into a ScoreTable
+def _from_native(native) -> ScoreTable:
+	t = ScoreTable()
+	t.chart_keys = native.chart_keys
+	t.packs = native.packs
+	t.songs = native.songs
+	t.steps = native.steps
+	t.scorekeys = np.array(native.scorekeys, dtype=str)
+	t.chart_indices = np.array(native.chart_indices, dtype=np.int32)
+	t.rates = np.array(native.rates, dtype=np.float64)
+	t.datetimes = np.array(native.datetimes, dtype=np.int64).astype("datetime64[s]")
+	t.wifescores = np.array(native.wifescores, dtype=np.float64)
+	t.ssrs = np.array(native.ssrs, dtype=np.float64).reshape(-1, len(SSR_NAMES))
+	t.survive_seconds = np.array(native.survive_seconds, dtype=np.float64)
+	t.max_combos = np.array(native.max_combos, dtype=np.int32)
+	t.judgements = np.array(native.judgements, dtype=np.int32).reshape(-1, len(JUDGEMENT_NAMES))
+	t.holds = np.array(native.holds, dtype=np.int32).reshape(-1, len(HOLD_NAMES))
+	t.valid = np.array(native.valid, dtype=bool)
+	t.grades = np.array(native.grades, dtype=np.int8)
+	t.modifier_ids = np.array(native.modifier_ids, dtype=np.int32)
+	t.grade_names = native.grade_names
+	t.modifiers = native.modifiers
+	t.encoding = native.encoding
+	t.native = native
+	return t
+
+# Parses the given chart byte ranges with the given encoding. The Rust parser in savegame_analysis
+# parses the charts in parallel; if the module isn't there (or is too old to have the parser), the
+# Python one is used
+def _parse_charts(path: str, data, ranges: List[Tuple[int, int]], encoding: str) -> ScoreTable:
+	try:
+		from savegame_analysis import parse_etterna_xml
+	except ImportError:
+		return _parse(data, ranges, encoding)
+
+	try:
+		with tracing.span("parse_charts_native", charts=len(ranges)):
+			return _from_native(parse_etterna_xml(path, ranges, encoding))
+	except Exception:
+		util.logger.exception("Native Etterna.xml parsing failed, falling back to Python")
+		return _parse(data, ranges, encoding)
+
+# Builds a table out of rows of other tables. `parts` is a list of (table, rows, chart_map), where
+# `rows` are the row indices to take from `table` and `chart_map` maps the chart indices of `table`
+# to chart indices of the new table. The chart lists of the result are left empty
+def _combine(parts: List[Tuple[ScoreTable, np.ndarray, np.ndarray]]) -> ScoreTable:
+	grades = _Interner()
+	modifiers = _Interner()
+	columns: Dict[str, List[np.ndarray]] = {name: [] for name in ScoreTable.COLUMNS}
+	for (table, rows, chart_map) in parts:
+		# The interned strings have different ids in every table
+		grade_map = np.array([grades.intern(s) for s in table.grade_names] or [0], dtype=np.int8)
+		modifier_map = np.array([modifiers.intern(s) for s in table.modifiers] or [0], dtype=np.int32)
+
+		for name in ScoreTable.COLUMNS:
+			column = getattr(table, name)[rows]
+			if name == "chart_indices": column = chart_map[column]
+			elif name == "grades": column = grade_map[column]
+			elif name == "modifier_ids": column = modifier_map[column]
+			columns[name].append(column)
+
+	# Put the rows into file order, i.e. sort them by chart. Within a chart the rows are already in
+	# order
+	order = np.argsort(np.concatenate(columns["chart_indices"]), kind="stable")
+
+	result = ScoreTable()
+	for name in ScoreTable.COLUMNS:
+		setattr(result, name, np.concatenate(columns[name])[order])
+	result.grade_names = grades.strings
+	result.modifiers = modifiers.strings
+	return result
+
+# Parses Etterna.xml into a ScoreTable. If a `previous` table of the same file is given, only the
+# charts whose content changed since then are parsed, the rest is copied over from `previous`.
+# Etterna rewrites the whole file after every session, but usually only a few charts got new scores
+def load(path: str, previous: Optional[ScoreTable]=None) -> ScoreTable:
+	with tracing.span("parse_xml"):
+		return _load(path, previous)
+
+def _load(path: str, previous: Optional[ScoreTable]) -> ScoreTable:
+	with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+		with tracing.span("hash_charts"):
+			ranges = _find_chart_ranges(data)
+			chart_hashes = [_chart_hash(data[start:end]) for (start, end) in ranges]
+
+		previous_charts = {}
+		if previous is not None:
+			previous_charts = {h: i for i, h in enumerate(previous.chart_hashes)}
+		changed = [i for i, h in enumerate(chart_hashes) if h not in previous_charts]
+
+		with tracing.span("detect_encoding"):
+			if previous is not None and previous.encoding == UTF_8:
+				# The unchanged charts are still valid UTF-8
+				encoding = _charts_encoding(data, [ranges[i] for i in changed])
+			else:
+				encoding = _charts_encoding(data, ranges)
+		if previous is not None and previous.encoding != encoding:
+			# The unchanged charts would be decoded differently now
+			changed = list(range(len(ranges)))
+		if encoding == LATIN_1:
+			util.logger.warning(f"Etterna.xml isn't valid UTF-8, reading it as {LATIN_1}")
+		if previous is not None:
+			util.logger.info(f"Re-parsing {len(changed)} of {len(ranges)} charts")
+
+		parsed = _parse_charts(path, data, [ranges[i] for i in changed], encoding)
+
+		general_data_end = ranges[0][0] if ranges else len(data)
+		total_session_seconds = _find_general_data_int(data, "TotalSessionSeconds", general_data_end)
+		total_gameplay_seconds = _find_general_data_int(data, "TotalGameplaySeconds", general_data_end)
+
+	if len(changed) == len(ranges):
+		table = parsed
+	else:
+		# Copy the rows of unchanged charts from the previous table
+		reused = [(i, previous_charts[h]) for i, h in enumerate(chart_hashes) if h in previous_charts]
+		previous_chart_map = np.full(previous.num_charts, -1, dtype=np.int32)
+		for (i, previous_i) in reused:
+			previous_chart_map[previous_i] = i
+		previous_rows = np.flatnonzero(previous_chart_map[previous.chart_indices] != -1)
+
+		parsed_chart_map = np.array(changed, dtype=np.int32)
+		table = _combine([
+			(previous, previous_rows, previous_chart_map),
+			(parsed, np.arange(len(parsed)), parsed_chart_map),
+		])
+
+		chart_sources = [None] * len(ranges)
+		for (i, previous_i) in reused:
+			chart_sources[i] = (previous, previous_i)
+		for (parsed_i, i) in enumerate(changed):
+			chart_sources[i] = (parsed, parsed_i)
+		for name in ["chart_keys", "packs", "songs", "steps"]:
+			setattr(table, name, [getattr(source, name)[j] for (source, j) in chart_sources])
+
+	table.chart_hashes = chart_hashes
+	table.encoding = encoding
+	table.total_session_seconds = total_session_seconds
+	table.total_gameplay_seconds = total_gameplay_seconds
+	return table
@@ -0,0 +1,76 @@
+from typing import *
+
+from datetime import timedelta
+
+import numpy as np
+
+import activity_cube
+
+
+"""
+This file holds the SessionTable. A session is a run of scores where no two consecutive scores are
+further apart than a gap threshold (one hour by default, see the session_gap_minutes setting). The
+sessions are found with a single diff over the sorted datetimes and stored as offsets into the
+chronologically sorted scores, together with a few per-session aggregates
+"""
+
+# The ScoreTable columns the session table is built from
+COLUMNS = ("datetimes", "survive_seconds", "ssrs")
+
+DEFAULT_GAP = timedelta(hours=1)
+
+class SessionTable:
+	# `scores` are score table indices, and the other arrays hold the respective values of those
+	# scores. They don't need to be sorted
+	def __init__(self, scores: np.ndarray, datetimes: np.ndarray, survive_seconds: np.ndarray,
+			ssrs: np.ndarray, gap: timedelta=DEFAULT_GAP):
+		# Scores without a date can't be put into any session
+		has_date = ~np.isnat(datetimes)
+		order = np.flatnonzero(has_date)
+		order = order[np.argsort(datetimes[order], kind="stable")]
+
+		# The scores, chronologically sorted. Session i consists of the scores from starts[i]
+		# (inclusive) to ends[i] (exclusive)
+		self.scores = scores[order] # score table indices
+		self.datetimes = datetimes[order] # datetime64[s]
+
+		# A new session starts after every gap longer than the threshold
+		new_session_starts = np.flatnonzero(np.diff(self.datetimes) > np.timedelta64(gap)) + 1
+		if len(order) == 0:
+			self.starts = self.ends = np.zeros(0, dtype=int)
+		else:
+			self.starts = np.concatenate([[0], new_session_starts])
+			self.ends = np.append(new_session_starts, len(order))
+
+		# Per-session aggregates
+		self.num_plays = self.ends - self.starts
+		self.start_datetimes = self.datetimes[self.starts] # datetime64[s]
+		self.end_datetimes = self.datetimes[self.ends - 1] # datetime64[s], start of the last score
+		self.wall_seconds = (self.end_datetimes - self.start_datetimes) / np.timedelta64(1, "s")
+		self.gameplay_seconds = self.sum(survive_seconds[order])
+		# The skillset most scores of the session were mainly in, or activity_cube.NO_SKILLSET if
+		# no score of the session has SkillsetSSRs
+		self.main_skillsets = self._most_common_skillsets(activity_cube.main_skillsets(ssrs[order]))
+
+	def __len__(self) -> int:
+		return len(self.starts)
+
+	# Session index of every score in `self.scores`
+	def session_indices(self) -> np.ndarray:
+		return np.repeat(np.arange(len(self)), self.num_plays)
+
+	# Sums the given per-score values (in the order of `self.scores`) per session
+	def sum(self, values: np.ndarray) -> np.ndarray:
+		if len(self) == 0:
+			return np.zeros(0, dtype=values.dtype)
+		return np.add.reduceat(values, self.starts)
+
+	def _most_common_skillsets(self, skillsets: np.ndarray) -> np.ndarray:
+		num_skillsets = activity_cube.NUM_SKILLSETS
+		counts = np.bincount(self.session_indices() * num_skillsets + skillsets,
+				minlength=len(self) * num_skillsets).reshape(len(self), num_skillsets)
+		counts = counts[:, :activity_cube.NO_SKILLSET]
+
+		main = np.argmax(counts, axis=1)
+		main[counts.sum(axis=1) == 0] = activity_cube.NO_SKILLSET
+		return main
@@ -5,45 +5,15 @@ import os, json
 from enum import Enum
 from dataclasses import dataclass
 
-from PyQt5.QtGui import *
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import *
 
-import util
-import app
 
+"""
+This file holds the settings, their defaults and how they're stored. It doesn't use Qt, so that the
+settings can be used without a GUI; the settings dialog is in settings_dialog.py
+"""
 
 SETTINGS_PATH = "etterna-graph-settings.json"
 
-REPLAYS_CHOOSER_INFO_MSG = """<p>
-In the following dialog you need to select the ReplaysV2 directory in
-your 'Save' directory and click OK. Important: don't try to select
-individual files within and don't choose a different directory. This
-program requires you to select the ReplaysV2 folder as a whole.
-</p>"""
-
-SONGS_ROOT_CHOOSER_INFO_MSG = """<p>
-In the following dialog you need to select the Songs directory and click OK. Important: don't try to
-select individual files within and don't choose a different directory. This
-program requires you to select the Songs folder as a whole.
-</p>"""
-
-def try_select_xml() -> Optional[str]:
-	result = QFileDialog.getOpenFileName(
-			caption="Select your Etterna.xml",
-			filter="Etterna XML files(Etterna.xml)")
-	return result[0] if result else None
-
-def try_choose_replays() -> Optional[str]:
-	QMessageBox.information(None, "How to use", REPLAYS_CHOOSER_INFO_MSG)
-	return QFileDialog.getExistingDirectory(
-			caption="Select the ReplaysV2 directory")
-
-def try_choose_songs_root() -> Optional[str]:
-	QMessageBox.information(None, "How to use", SONGS_ROOT_CHOOSER_INFO_MSG)
-	return QFileDialog.getExistingDirectory(
-			caption="Select the root songs folder")
-
 # when adding a new settings type, keep care to update the code at "# setting here"
 SettingsType = Enum("SettingsType", ["File", "Folder", "Color", "Checkbox", "Spinbox"])
 
@@ -58,7 +28,6 @@ class SettingsEntry:
 	settings_type: SettingsType
 	write_if_default: bool = True
 	tooltip: Optional[str] = None
-	chooser_fn: Optional[Any] = None # only applies to file/folder settings types
 	min_max_values: Optional[Tuple[int, int]] = None # only applies to spinbox
 
 SETTINGS_ENTRIES = [
@@ -70,7 +39,6 @@ SETTINGS_ENTRIES = [
 		write_if_default = True,
 		is_necessary = True,
 		settings_type = SettingsType.File,
-		chooser_fn = try_select_xml,
 	),
 	SettingsEntry(
 		python_name = "replays_dir",
@@ -80,7 +48,6 @@ SETTINGS_ENTRIES = [
 		write_if_default = True,
 		is_necessary = True,
 		settings_type = SettingsType.Folder,
-		chooser_fn = try_choose_replays,
 	),
 	SettingsEntry(
 		python_name = "songs_root",
@@ -90,7 +57,6 @@ SETTINGS_ENTRIES = [
 		write_if_default = True,
 		is_necessary = True,
 		settings_type = SettingsType.File,
-		chooser_fn = try_choose_songs_root,
 	),
 	SettingsEntry(
 		python_name = "enable_all_plots",
@@ -168,20 +134,31 @@ SETTINGS_ENTRIES = [
 		settings_type = SettingsType.Spinbox,
 		min_max_values = (1, 99),
 	),
+	SettingsEntry(
+		python_name = "session_gap_minutes",
+		json_name = "session-gap-minutes",
+		display_name = "Minutes without a play after which a session ends",
+		default_value = 60,
+		write_if_default = True,
+		is_necessary = False,
+		settings_type = SettingsType.Spinbox,
+		min_max_values = (1, 24 * 60),
+	),
+	SettingsEntry(
+		python_name = "trace",
+		json_name = "trace",
+		display_name = "Record how long loading takes (after a restart, see About)",
+		default_value = False,
+		write_if_default = True,
+		is_necessary = False,
+		settings_type = SettingsType.Checkbox,
+	),
 ]
 
-# validate settings entries format
-for entry in SETTINGS_ENTRIES:
-	is_file_selector = entry.settings_type in (SettingsType.File, SettingsType.Folder)
-	if is_file_selector and entry.chooser_fn is None:
-		raise Exception(f"Setting {entry.python_name} has no chooser_fn!")
-	elif not is_file_selector and entry.chooser_fn is not None:
-		raise Exception(f"Setting {entry.python_name} has an unexpected chooser_fn!")
-
 # When adding a new setting, keep care to update all placed marked with "# setting here"
 class Settings:
 	@staticmethod
-	def load_from_json() -> Settings:
+	def load_from_json(path: str=SETTINGS_PATH) -> Settings:
 		settings = Settings()
 
 		# Initialize defaults
@@ -189,8 +166,8 @@ class Settings:
 			setattr(settings, entry.python_name, entry.default_value)
 		
 		# Load the values from the json
-		if os.path.exists(SETTINGS_PATH):
-			with open(SETTINGS_PATH) as f:
+		if os.path.exists(path):
+			with open(path) as f:
 				for key, value in json.load(f).items(): # setting here
 					# find the settings entry corresponding to this json key-value pair
 					for entry in SETTINGS_ENTRIES:
@@ -228,160 +205,3 @@ class Settings:
 			if entry.is_necessary and getattr(self, entry.python_name) is None:
 				return True
 		return False
-
-class ColorPickerButton(QPushButton):
-	def __init__(self, initial_color):
-		super().__init__()
-		self._qcolordialog = QColorDialog()
-		
-		self._initial_color = initial_color
-		self.set_color(initial_color)
-		self._qcolordialog.currentColorChanged.connect(self._update_self_color)
-		self.pressed.connect(lambda: self._qcolordialog.open())
-	
-	def _update_self_color(self):
-		self.setStyleSheet(f"background-color: {self._qcolordialog.currentColor().name()}")
-	
-	def get_qcolor(self) -> QColor:
-		return self._qcolordialog.currentColor()
-	
-	def set_color(self, color) -> None:
-		self._qcolordialog.setCurrentColor(QColor(color))
-		self._update_self_color()
-	
-	# reset to initial color (note: initial color = the color that was set when entering the
-	# settings, NOT the overall program default)
-	def reset(self) -> None:
-		self.set_color(self._initial_color)
-
-class SettingsDialog(QDialog):
-	def __init__(self):
-		super().__init__()
-		self.setWindowTitle("Settings")
-
-		# maps the SettingsEntry.python_name to the QWidget in the settings dialog
-		self.input_widgets: Dict[str, QWidget] = {}
-		
-		vbox = QVBoxLayout(self)
-		
-		layout_widget = QWidget(self)
-		vbox.addWidget(layout_widget)
-		layout = QGridLayout(layout_widget)
-		
-		buttons = QDialogButtonBox()
-		save_btn = buttons.addButton("Save", QDialogButtonBox.ButtonRole.AcceptRole)
-		save_btn.pressed.connect(self.try_save)
-		cancel_btn = buttons.addButton("Cancel", QDialogButtonBox.ButtonRole.RejectRole)
-		cancel_btn.pressed.connect(self.reject)
-		vbox.addWidget(buttons)
-		
-		restart_info = QLabel("<i>Restart for changes to take place</i>")
-		restart_info.setAlignment(Qt.AlignCenter | Qt.AlignRight)
-		vbox.addWidget(restart_info)
-
-		row = 0
-
-		for entry in SETTINGS_ENTRIES:
-			current_value = getattr(app.app.prefs, entry.python_name)
-
-			input_widget = None
-			btn = None
-
-			# setting here
-			if entry.settings_type in (SettingsType.File, SettingsType.Folder):
-				is_file = entry.settings_type == SettingsType.File
-
-				theme_icon_name = "document-open" if is_file else "folder-open"
-				standard_icon = QStyle.SP_FileIcon if is_file else QStyle.SP_DirIcon
-
-				input_widget = QLineEdit(current_value)
-				def chooser_handler():
-					result = (entry.chooser_fn)()
-					if result: self.input_widget.setText(result)
-				
-				btn = QPushButton()
-				btn.setIcon(QIcon.fromTheme(theme_icon_name,
-						QApplication.style().standardIcon(standard_icon))) # fallback icon
-				btn.pressed.connect(chooser_handler)
-			elif entry.settings_type == SettingsType.Color:
-				color_picker_button = ColorPickerButton(current_value)
-				color_picker_button.setToolTip("Press this button to select a color")
-
-				def reset_color(color_picker_button=color_picker_button,
-						default_value=entry.default_value):
-					color_picker_button.set_color(default_value)
-
-				reset_button = QPushButton()
-				reset_button.setIcon(QIcon.fromTheme("view-refresh",
-						QApplication.style().standardIcon(QStyle.SP_BrowserReload))) # fallback icon
-				reset_button.pressed.connect(reset_color)
-				reset_button.setToolTip("Reset color to default")
-				
-				input_widget = color_picker_button
-				btn = reset_button
-			elif entry.settings_type == SettingsType.Checkbox:
-				input_widget = QCheckBox()
-				input_widget.setChecked(current_value)
-			elif entry.settings_type == SettingsType.Spinbox:
-				input_widget = QSpinBox()
-				input_widget.setMinimum(entry.min_max_values[0])
-				input_widget.setMaximum(entry.min_max_values[1])
-				input_widget.setValue(current_value)
-			else:
-				raise Exception(f"Unexpected settings type {entry.settings_type}")
-
-			self.input_widgets[entry.python_name] = input_widget
-			layout.addWidget(QLabel(entry.display_name), row, 0)
-			if btn is None:
-				# when there's no button, use the free space on column 2 to make the input widget
-				# span across two columns
-				layout.addWidget(input_widget, row, 1, 1, 2)
-			else:
-				layout.addWidget(input_widget, row, 1)
-				layout.addWidget(btn, row, 2)
-			
-			row += 1
-		
-		self.setMinimumWidth(600)
-	
-	def try_save(self):
-		# setting here
-		missing_inputs = []
-		for entry in SETTINGS_ENTRIES:
-			if entry.is_necessary:
-				if not entry.settings_type in (SettingsType.File, SettingsType.Folder):
-					print("WARNING: uh oh, unimplemented")
-					continue
-
-				selected_path = self.input_widgets[entry.python_name].text()
-				if not os.path.exists(selected_path): # includes blank input
-					missing_inputs.append(entry.display_name)
-		
-		if len(missing_inputs) >= 1:
-			QMessageBox.information(None, "Missing or invalid fields",
-					"Please fill in valid values for: " + ", ".join(missing_inputs))
-			return
-		
-		# setting here
-		for entry in SETTINGS_ENTRIES:
-			input_widget = self.input_widgets[entry.python_name]
-
-			selected_value = None
-			if isinstance(input_widget, QLineEdit):
-				selected_value = input_widget.text()
-			elif isinstance(input_widget, QCheckBox):
-				selected_value = input_widget.isChecked()
-			elif isinstance(input_widget, ColorPickerButton):
-				selected_value = input_widget.get_qcolor().name()
-			elif isinstance(input_widget, QSpinBox):
-				selected_value = input_widget.value()
-			else:
-				print(f"WARNING: unexpected input widget type {type(input_widget)}")
-				continue
-			
-			setattr(app.app.prefs, entry.python_name, selected_value)
-		
-		print("Saving prefs to json...")
-		app.app.prefs.save_to_json()
-		
-		self.accept()
\ No newline at end of file
@@ -0,0 +1,146 @@
+from typing import *
+
+import os, json, shutil, hashlib
+
+import numpy as np
+
+import util
+import tracing
+import score_table
+from score_table import ScoreTable
+
+
+"""
+This file handles the on-disk snapshot of the parsed ScoreTable. Parsing a big Etterna.xml takes a
+while, and usually nothing has changed since the last launch. So after parsing, the table columns
+are written into a directory as .npy files, which can be memory-mapped on the next launch instead
+of parsing the xml again.
+
+The snapshot is keyed by a fingerprint of the xml (path, size, mtime and a hash over some sampled
+parts of the content). If the fingerprint doesn't match, the xml is parsed again, but only the
+charts whose content hash differs from the one stored in the snapshot. Afterwards the snapshot is
+overwritten
+"""
+
+SNAPSHOT_DIR = "etterna-graph-snapshot"
+
+# Increase this when the layout of the ScoreTable changes, to invalidate old snapshots
+SNAPSHOT_VERSION = 3
+
+# The content hash only looks at this many evenly spaced blocks of the file (plus the first and
+# last block), so that it's fast even for 150 MB files. Combined with size and mtime that's more
+# than enough to notice a changed file
+NUM_HASH_SAMPLES = 32
+HASH_SAMPLE_SIZE = 64 * 1024
+
+def _sampled_hash(path: str, size: int) -> str:
+	offsets = {0, max(0, size - HASH_SAMPLE_SIZE)}
+	for i in range(NUM_HASH_SAMPLES):
+		offsets.add(size * i // NUM_HASH_SAMPLES)
+
+	h = hashlib.blake2b(digest_size=16)
+	with open(path, "rb") as f:
+		for offset in sorted(offsets):
+			f.seek(offset)
+			h.update(f.read(HASH_SAMPLE_SIZE))
+	return h.hexdigest()
+
+def fingerprint(xml_path: str) -> Dict[str, Any]:
+	stat = os.stat(xml_path)
+	return {
+		"path": os.path.abspath(xml_path),
+		"size": stat.st_size,
+		"mtime_ns": stat.st_mtime_ns,
+		"hash": _sampled_hash(xml_path, stat.st_size),
+	}
+
+def save(table: ScoreTable, xml_fingerprint: Dict[str, Any], directory: str=SNAPSHOT_DIR) -> None:
+	# Write into a temporary directory first, so that a crash halfway through doesn't leave a
+	# broken snapshot behind
+	tmp_directory = directory + ".tmp"
+	shutil.rmtree(tmp_directory, ignore_errors=True)
+	os.makedirs(tmp_directory)
+
+	for name in ScoreTable.COLUMNS:
+		np.save(os.path.join(tmp_directory, name + ".npy"), getattr(table, name))
+
+	manifest = {
+		"version": SNAPSHOT_VERSION,
+		"fingerprint": xml_fingerprint,
+		"lists": {name: getattr(table, name) for name in ScoreTable.LISTS},
+		"scalars": {name: getattr(table, name) for name in ScoreTable.SCALARS},
+	}
+	# The manifest is written last; a snapshot without manifest is never loaded
+	with open(os.path.join(tmp_directory, "manifest.json"), "w") as f:
+		json.dump(manifest, f)
+
+	shutil.rmtree(directory, ignore_errors=True)
+	os.rename(tmp_directory, directory)
+
+def _read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+	manifest_path = os.path.join(directory, "manifest.json")
+	if not os.path.exists(manifest_path):
+		return None
+
+	try:
+		with open(manifest_path) as f:
+			manifest = json.load(f)
+	except Exception:
+		util.logger.exception("Couldn't read the score table snapshot manifest, ignoring it")
+		return None
+
+	if manifest.get("version") != SNAPSHOT_VERSION:
+		return None
+	return manifest
+
+# With mmap_mode=None the columns are read into memory, which is needed if the snapshot directory
+# is going to be replaced while the table is still in use
+def _read_table(manifest: Dict[str, Any], directory: str, mmap_mode: Optional[str]
+		) -> Optional[ScoreTable]:
+	try:
+		table = ScoreTable()
+		for name in ScoreTable.COLUMNS:
+			column = np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode)
+			setattr(table, name, column)
+		for name in ScoreTable.LISTS:
+			setattr(table, name, manifest["lists"][name])
+		for name in ScoreTable.SCALARS:
+			setattr(table, name, manifest["scalars"][name])
+	except Exception:
+		util.logger.exception("Couldn't load the score table snapshot, ignoring it")
+		return None
+
+	return table
+
+# Returns None if there's no snapshot for the given fingerprint
+def load(xml_fingerprint: Dict[str, Any], directory: str=SNAPSHOT_DIR) -> Optional[ScoreTable]:
+	manifest = _read_manifest(directory)
+	if manifest is None or manifest["fingerprint"] != xml_fingerprint:
+		return None
+	return _read_table(manifest, directory, mmap_mode="r")
+
+# Loads the ScoreTable from the snapshot if it's up to date. Otherwise the xml is parsed again,
+# reusing all charts from an outdated snapshot of the same file that didn't change, and a new
+# snapshot is written
+def load_score_table(xml_path: str) -> ScoreTable:
+	xml_fingerprint = fingerprint(xml_path)
+
+	manifest = _read_manifest(SNAPSHOT_DIR)
+	if manifest is not None and manifest["fingerprint"] == xml_fingerprint:
+		with tracing.span("snapshot_load"):
+			table = _read_table(manifest, SNAPSHOT_DIR, mmap_mode="r")
+		if table is not None:
+			return table
+
+	previous = None
+	if manifest is not None and manifest["fingerprint"]["path"] == xml_fingerprint["path"]:
+		with tracing.span("snapshot_load_previous"):
+			previous = _read_table(manifest, SNAPSHOT_DIR, mmap_mode=None)
+
+	table = score_table.load(xml_path, previous)
+	try:
+		with tracing.span("snapshot_save"):
+			save(table, xml_fingerprint, SNAPSHOT_DIR)
+	except Exception:
+		util.logger.exception("Couldn't write the score table snapshot")
+	return table
@@ -0,0 +1,311 @@
+from typing import *
+
+import os, math, argparse
+from datetime import datetime, timedelta
+from dataclasses import dataclass
+
+import numpy as np
+
+from score_table import SSR_NAMES
+
+
+"""
+This file generates synthetic save games, for benchmarks and for trying things out without a real
+profile. A corpus is laid out like an Etterna installation:
+
+	<directory>/Save/LocalProfiles/00000000/Etterna.xml
+	<directory>/Save/ReplaysV2/<scorekey>
+	<directory>/Songs/<pack>/<song>/<song>.sm
+
+Scores are played in sessions spread over a few years, and the player's skill (and with it the
+difficulty of the played charts and the score ratings) goes up over time. Charts are often retried
+right away. Only the most recent scores have replays, like in real profiles, and their hit offsets
+match the judgements in Etterna.xml. The .sm files only hold the title and the BPMs, which is all
+that the replays analysis reads from them.
+
+Everything is derived from the seed, so the same arguments always give the same corpus
+
+	python src/synthetic.py corpus --scores 100000 --replay-fraction 0.2
+"""
+
+PROFILE_DIR = os.path.join("Save", "LocalProfiles", "00000000")
+REPLAYS_DIR = os.path.join("Save", "ReplaysV2")
+SONGS_DIR = "Songs"
+
+START_DATE = datetime(2018, 1, 1)
+
+# Judge 4 timing windows in seconds, W1 to W5. Hits outside of W5 are misses
+TIMING_WINDOWS = np.array([0.0225, 0.045, 0.09, 0.135, 0.18])
+# Etterna's grade tiers with their lowest wifescores, best first
+GRADE_TIERS = [("Tier01", 0.99996), ("Tier02", 0.99955), ("Tier03", 0.997), ("Tier04", 0.93),
+		("Tier05", 0.8), ("Tier06", 0.7), ("Tier07", 0.6), ("Tier08", -math.inf)]
+RATES = np.round(np.arange(0.7, 1.55, 0.05), 2)
+# Rates around 1.0 are played the most
+_RATE_WEIGHTS = np.exp(-((RATES - 1) / 0.15) ** 2)
+_RATE_WEIGHTS /= _RATE_WEIGHTS.sum()
+
+STEPS = ["Beginner", "Easy", "Medium", "Hard", "Challenge", "Edit"]
+SPEED_MODS = ["C500", "C600", "C700", "C750", "C800", "C900", "C1000", "M650", "2x", "2.5x"]
+EXTRA_MODS = ["Overhead", "50% Mini, Overhead", "Mini, Overhead", "30% Distant, Overhead",
+		"Overhead, Reverse", "25% Mini, Overhead, NoMines", "Incoming"]
+NOTESKINS = ["default", "lambda", "bar", "Arrow"]
+WORDS = ["Night", "Star", "Crystal", "Rush", "Dream", "Burn", "Echo", "Frozen", "Neon", "Ghost",
+		"Storm", "Velvet", "Silent", "Hyper", "Lunar", "Paper", "Zero", "Chaos", "Glass", "Wild"]
+
+@dataclass
+class Corpus:
+	directory: str
+	xml_path: str
+	replays_dir: str
+	songs_root: str
+
+def corpus_paths(directory: str) -> Corpus:
+	return Corpus(directory, os.path.join(directory, PROFILE_DIR, "Etterna.xml"),
+			os.path.join(directory, REPLAYS_DIR), os.path.join(directory, SONGS_DIR))
+
+def _hex_keys(rng: np.random.Generator, prefix: str, n: int) -> List[str]:
+	raw = rng.bytes(20 * n)
+	return [prefix + raw[i * 20:(i + 1) * 20].hex() for i in range(n)]
+
+def _rate_string(rate: float) -> str:
+	string = f"{rate:g}"
+	return string if "." in string else string + ".0"
+
+def _grade(wifescore: float, failed: bool) -> str:
+	if failed: return "Failed"
+	return next(tier for (tier, threshold) in GRADE_TIERS if wifescore >= threshold)
+
+class _Charts:
+	def __init__(self, rng: np.random.Generator, num_charts: int):
+		num_packs = max(1, num_charts // 40)
+		self.keys = _hex_keys(rng, "X", num_charts)
+		self.packs = [f"{WORDS[i % len(WORDS)]} Pack {i + 1}" for i in range(num_packs)]
+		self.pack_ids = rng.integers(0, num_packs, num_charts)
+		words = rng.integers(0, len(WORDS), (num_charts, 2))
+		self.songs = [f"{WORDS[a]} {WORDS[b]} {i}" for i, (a, b) in enumerate(words.tolist())]
+		self.steps = rng.choice(STEPS, num_charts, p=[0.02, 0.05, 0.13, 0.3, 0.4, 0.1])
+		# Difficulty at rate 1.0, in MSD
+		self.difficulties = np.clip(rng.lognormal(math.log(17), 0.3, num_charts), 4, 38)
+		self.num_notes = rng.integers(250, 2200, num_charts)
+		# Length at rate 1.0 in seconds
+		self.lengths = self.num_notes / (self.difficulties * 0.55)
+		self.bpms = np.round(rng.uniform(100, 220, num_charts))
+		self.has_bpm_change = rng.random(num_charts) < 0.15
+		# How much each skillset counts for the chart, the main skillset is 1
+		self.skillset_weights = rng.uniform(0.55, 0.95, (num_charts, len(SSR_NAMES) - 1))
+		self.skillset_weights[np.arange(num_charts), rng.integers(0, len(SSR_NAMES) - 1, num_charts)] = 1
+
+	def __len__(self) -> int:
+		return len(self.keys)
+
+class _Scores:
+	def __init__(self, rng: np.random.Generator, charts: _Charts, num_scores: int, years: float):
+		span_seconds = years * 365 * 86400
+		# Sessions of 1 to 60 plays, starting at random times (mostly in the evening)
+		session_sizes = np.minimum(60, 1 + rng.poisson(14, num_scores // 8 + 1))
+		num_sessions = np.searchsorted(np.cumsum(session_sizes), num_scores) + 1
+		session_sizes = session_sizes[:num_sessions]
+		session_sizes[-1] -= session_sizes.sum() - num_scores
+		session_starts = np.sort(rng.uniform(0, span_seconds, num_sessions))
+		session_starts -= session_starts % 86400
+		session_starts += rng.normal(19.5, 3, num_sessions).clip(0, 23.5) * 3600
+		session_ids = np.repeat(np.arange(num_sessions), session_sizes)
+		is_session_start = np.r_[True, session_ids[1:] != session_ids[:-1]]
+
+		# The skill goes up over the years. It's taken as constant within a session
+		self.skills = 10 + 16 * (session_starts[session_ids] / span_seconds) ** 0.6
+
+		# Pick a chart near the skill level, or retry the previous one
+		chart_order = np.argsort(charts.difficulties)
+		rates = rng.choice(RATES, num_scores, p=_RATE_WEIGHTS)
+		targets = (self.skills + rng.normal(0, 2.5, num_scores)) / rates
+		positions = np.searchsorted(charts.difficulties[chart_order], targets) \
+				+ np.round(rng.normal(0, 3, num_scores)).astype(int)
+		charts_picked = chart_order[positions.clip(0, len(charts) - 1)]
+		is_retry = (rng.random(num_scores) < 0.3) & ~is_session_start
+		last_pick = np.maximum.accumulate(np.where(is_retry, 0, np.arange(num_scores)))
+		self.charts = charts_picked[last_pick]
+		self.rates = rates[last_pick]
+
+		# Plays follow each other with some idle time in between
+		durations = charts.lengths[self.charts] / self.rates + rng.exponential(40, num_scores)
+		self.total_session_seconds = int(durations.sum())
+		elapsed = np.cumsum(durations) - durations
+		elapsed -= (elapsed * is_session_start)[np.maximum.accumulate(
+				np.where(is_session_start, np.arange(num_scores), 0))]
+		self.seconds = session_starts[session_ids] + elapsed
+
+		difficulties = charts.difficulties[self.charts] * self.rates
+		# Some plays go badly, and some of those end in a fail
+		bad_attempts = (rng.random(num_scores) < 0.06) * rng.exponential(0.12, num_scores)
+		self.wifescores = np.clip(0.93 + 0.065 * np.tanh((self.skills - difficulties) / 4)
+				+ rng.normal(0, 0.015, num_scores) - bad_attempts, 0.2, 0.9999)
+		self.failed = (self.wifescores < 0.7) & (rng.random(num_scores) < 0.6)
+		self.ssrs = (difficulties * (self.wifescores / 0.93) ** 4)[:, None] \
+				* charts.skillset_weights[self.charts]
+		self.has_ssrs = rng.random(num_scores) > 0.03
+		self.valid = rng.random(num_scores) > 0.02
+		self.keys = _hex_keys(rng, "S", num_scores)
+		self.speed_mods = rng.integers(0, len(SPEED_MODS), num_scores)
+		self.extra_mods = rng.integers(0, len(EXTRA_MODS), num_scores)
+		self.noteskins = rng.integers(0, len(NOTESKINS), num_scores)
+
+# Standard deviation of the hit offsets that gives roughly the given wifescore
+def _offset_sigma(wifescore: float) -> float:
+	return 0.006 + 0.3 * (1 - wifescore)
+
+# Hit offsets of every note of a score. Misses are 1.0, like in replay files
+def _offsets(rng: np.random.Generator, num_notes: int, wifescore: float) -> np.ndarray:
+	offsets = rng.normal(-0.002, _offset_sigma(wifescore), num_notes)
+	offsets[np.abs(offsets) > TIMING_WINDOWS[-1]] = 1.0
+	offsets[rng.random(num_notes) < max(0, 0.95 - wifescore) * 0.05] = 1.0
+	return offsets
+
+# W1, W2, W3, W4, W5, Miss counts of the offsets
+def _judgements(offsets: np.ndarray) -> List[int]:
+	is_miss = offsets == 1.0
+	windows = np.searchsorted(TIMING_WINDOWS, np.abs(offsets[~is_miss]))
+	return np.bincount(windows, minlength=5)[:5].tolist() + [int(is_miss.sum())]
+
+def _max_combo(offsets: np.ndarray) -> int:
+	breaks = np.flatnonzero(np.abs(offsets) > TIMING_WINDOWS[2])
+	bounds = np.concatenate([[-1], breaks, [len(offsets)]])
+	return int((np.diff(bounds) - 1).max())
+
+def _replay(rng: np.random.Generator, offsets: np.ndarray, num_mine_hits: int,
+		num_hold_drops: int) -> str:
+	num_notes = len(offsets)
+	# Rows are 48 per beat. Notes are on 16ths, 8ths or quarters, sometimes as jumps
+	ticks = np.cumsum(rng.choice([0, 12, 12, 24, 48], num_notes, p=[0.15, 0.35, 0.2, 0.2, 0.1]))
+	columns = rng.integers(0, 4, num_notes)
+	order = np.arange(num_notes)
+	if rng.random() < 0.2:
+		# Manipulated notes are hit out of order
+		swapped = np.flatnonzero(rng.random(num_notes - 1) < rng.uniform(0.005, 0.05))
+		order[swapped], order[swapped + 1] = order[swapped + 1], order[swapped]
+	lines = [f"{tick} {offset:.6f} {column} 1"
+			for tick, offset, column in zip(ticks[order].tolist(), offsets[order].tolist(),
+				columns[order].tolist())]
+	for tick in rng.choice(ticks, num_mine_hits).tolist():
+		lines.append(f"{tick} {rng.uniform(-0.09, 0.09):.6f} {rng.integers(0, 4)} 4")
+	for tick in rng.choice(ticks, num_hold_drops).tolist():
+		lines.append(f"H {tick} {rng.integers(0, 4)} 2")
+	return "\n".join(lines) + "\n"
+
+def _sm_file(charts: _Charts, chart: int) -> str:
+	bpms = f"0.000000={charts.bpms[chart]:.6f}"
+	if charts.has_bpm_change[chart]:
+		bpms += f",{64 + 32 * (chart % 5):.6f}={charts.bpms[chart] * 1.5:.6f}"
+	return (f"#TITLE:{charts.songs[chart]};\n#ARTIST:Synthetic;\n#OFFSET:-0.010000;\n#BPMS:{bpms};\n"
+			+ f"#NOTES:\n     dance-single:\n     :\n     {charts.steps[chart]}:\n"
+			+ f"     {int(charts.difficulties[chart])}:\n     0,0,0,0,0:\n0000\n;\n")
+
+def _score_xml(scores: _Scores, i: int, key: str, judgements: List[int], max_combo: int,
+		mines: Tuple[int, int], holds: Tuple[int, int, int], survive_seconds: float) -> str:
+	wifescore = scores.wifescores[i]
+	when = START_DATE + timedelta(seconds=scores.seconds[i])
+	modifiers = f"{SPEED_MODS[scores.speed_mods[i]]}, {EXTRA_MODS[scores.extra_mods[i]]}, " \
+			+ NOTESKINS[scores.noteskins[i]]
+	taps = "".join(f"<{name}>{count}</{name}>"
+			for name, count in zip(["W1", "W2", "W3", "W4", "W5", "Miss"], judgements))
+	ssrs = ""
+	if scores.has_ssrs[i]:
+		skillsets = scores.ssrs[i].tolist()
+		values = [max(skillsets)] + skillsets
+		ssrs = "<SkillsetSSRs>" + "".join(f"<{name}>{value:.6f}</{name}>"
+				for name, value in zip(SSR_NAMES, values)) + "</SkillsetSSRs>"
+	return (f'<Score Key="{key}"><SSRCalcVersion>263</SSRCalcVersion>'
+			+ f'<Grade>{_grade(wifescore, scores.failed[i])}</Grade><WifeScore>{wifescore:.6f}</WifeScore>'
+			+ f'<SSRNormPercent>{wifescore:.6f}</SSRNormPercent><JudgeScale>1</JudgeScale>'
+			+ f'<NoChordCohesion>0</NoChordCohesion><EtternaValid>{int(scores.valid[i])}</EtternaValid>'
+			+ f'<SurviveSeconds>{survive_seconds:.6f}</SurviveSeconds><MaxCombo>{max_combo}</MaxCombo>'
+			+ f'<Modifiers>{modifiers}</Modifiers><MachineGuid>0</MachineGuid>'
+			+ f'<DateTime>{when:%Y-%m-%d %H:%M:%S}</DateTime><TopScore>0</TopScore>'
+			+ f'<TapNoteScores><HitMine>{mines[0]}</HitMine><AvoidMine>{mines[1]}</AvoidMine>{taps}'
+			+ f'</TapNoteScores><HoldNoteScores><LetGo>{holds[0]}</LetGo><Held>{holds[1]}</Held>'
+			+ f'<MissedHold>{holds[2]}</MissedHold></HoldNoteScores>{ssrs}'
+			+ '<ValidationKeys><Brittle>0</Brittle><Weak>0</Weak></ValidationKeys></Score>')
+
+# Writes a corpus with `num_scores` scores into `directory`. Replays are written for the most
+# recent `replay_fraction` of the scores. Returns the paths of the corpus
+def generate(directory: str, num_scores: int, seed: int=0, num_charts: Optional[int]=None,
+		years: float=3, replay_fraction: float=1) -> Corpus:
+	rng = np.random.default_rng(seed)
+	paths = corpus_paths(directory)
+	charts = _Charts(rng, num_charts or max(1, num_scores // 6))
+	scores = _Scores(rng, charts, num_scores, years)
+
+	os.makedirs(os.path.dirname(paths.xml_path), exist_ok=True)
+	os.makedirs(paths.replays_dir, exist_ok=True)
+
+	played_charts = np.unique(scores.charts)
+	for chart in played_charts.tolist():
+		song_dir = os.path.join(paths.songs_root, charts.packs[charts.pack_ids[chart]],
+				charts.songs[chart])
+		os.makedirs(song_dir, exist_ok=True)
+		with open(os.path.join(song_dir, f"{charts.songs[chart]}.sm"), "w") as f:
+			f.write(_sm_file(charts, chart))
+
+	replay_cutoff = np.quantile(scores.seconds, 1 - replay_fraction) if replay_fraction > 0 \
+			else math.inf
+	# Scores grouped by chart, then by rate, like in Etterna.xml
+	order = np.lexsort((scores.seconds, scores.rates, scores.charts))
+	lines = ['<?xml version="1.0" encoding="UTF-8"?>', "<Stats>", "<GeneralData>",
+			"<DisplayName>Synthetic</DisplayName>", "<Guid>0</Guid>",
+			f"<TotalSessionSeconds>{scores.total_session_seconds}</TotalSessionSeconds>",
+			f"<TotalGameplaySeconds>0</TotalGameplaySeconds>", "</GeneralData>", "<Favorites/>",
+			"<PermaMirror/>", "<Playlists/>", "<PlayerScores>"]
+	current_chart, current_rate = None, None
+	for i in order.tolist():
+		chart, rate = scores.charts[i], scores.rates[i]
+		if chart != current_chart:
+			if current_chart is not None:
+				lines.append("</ScoresAt></Chart>")
+			lines.append(f'<Chart Key="{charts.keys[chart]}" Pack="{charts.packs[charts.pack_ids[chart]]}" '
+					+ f'Song="{charts.songs[chart]}" Steps="{charts.steps[chart]}">')
+			current_chart, current_rate = chart, None
+		if rate != current_rate:
+			if current_rate is not None:
+				lines.append("</ScoresAt>")
+			lines.append(f'<ScoresAt Grade="Tier04" Key="{charts.keys[chart]}" '
+					+ f'PBKey="{scores.keys[i]}" Rate="{_rate_string(rate)}">')
+			current_rate = rate
+
+		num_notes = int(charts.num_notes[chart])
+		survive_seconds = charts.lengths[chart] / rate
+		if scores.failed[i]:
+			num_notes = int(num_notes * rng.uniform(0.2, 0.9))
+			survive_seconds *= num_notes / charts.num_notes[chart]
+		offsets = _offsets(rng, num_notes, scores.wifescores[i])
+		mines = (int(rng.poisson(0.5)), int(rng.integers(0, 40)))
+		held = int(num_notes * 0.04)
+		holds = (int(rng.poisson(0.3)), held, int(rng.poisson(0.2)))
+		lines.append(_score_xml(scores, i, scores.keys[i], _judgements(offsets), _max_combo(offsets),
+				mines, holds, survive_seconds))
+		if scores.seconds[i] >= replay_cutoff:
+			with open(os.path.join(paths.replays_dir, scores.keys[i]), "w") as f:
+				f.write(_replay(rng, offsets, mines[0], holds[0]))
+	if current_chart is not None:
+		lines.append("</ScoresAt></Chart>")
+	lines += ["</PlayerScores>", "<ScoreGoals/>", "</Stats>"]
+
+	with open(paths.xml_path, "w") as f:
+		f.write("\n".join(lines) + "\n")
+	return paths
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Generates a synthetic Etterna save game")
+	parser.add_argument("directory")
+	parser.add_argument("--scores", type=int, default=10000)
+	parser.add_argument("--charts", type=int, help="default: a sixth of the number of scores")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--years", type=float, default=3, help="time span of the scores")
+	parser.add_argument("--replay-fraction", type=float, default=1,
+			help="fraction of the scores (the most recent ones) that get a replay")
+	args = parser.parse_args()
+	paths = generate(args.directory, args.scores, args.seed, args.charts, args.years,
+			args.replay_fraction)
+	print(f"Etterna.xml: {paths.xml_path}\nReplays: {paths.replays_dir}\nSongs: {paths.songs_root}")
+
+if __name__ == "__main__":
+	main()
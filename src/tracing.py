@@ -0,0 +1,155 @@
+from typing import *
+
+import os, html, json, time, threading
+from dataclasses import dataclass
+
+
+"""
+This file records how long the stages of loading and drawing take (parsing Etterna.xml, the
+unranked chart download, the replays analysis, every generator and every plot...), to find out
+where the time goes when loading is slow on someone's machine. Stages are wrapped in spans:
+
+	with tracing.span("parse_xml"):
+		...
+
+Tracing is off unless it's turned on with the "trace" setting or the ETTERNA_GRAPH_TRACE
+environment variable (1, or the path of the trace file). While it's off, a span costs one
+attribute lookup. The recorded spans are written as a Chrome trace (open it in chrome://tracing or
+https://ui.perfetto.dev), and summed up per stage in the About dialog
+"""
+
+ENV_VAR = "ETTERNA_GRAPH_TRACE"
+TRACE_PATH = "etterna-graph-trace.json"
+
+# The trace file requested through the environment variable, or None if it's not set
+def path_from_env() -> Optional[str]:
+	value = os.environ.get(ENV_VAR, "")
+	if value in ("", "0"):
+		return None
+	return TRACE_PATH if value == "1" else value
+
+@dataclass
+class SpanSummary:
+	name: str
+	count: int
+	total_seconds: float
+	max_seconds: float
+
+class _NoSpan:
+	def __enter__(self) -> None:
+		return None
+
+	def __exit__(self, *exc_info) -> None:
+		return None
+
+_NO_SPAN = _NoSpan()
+
+class _Span:
+	def __init__(self, tracer: "Tracer", name: str, category: str, args: Dict[str, Any]):
+		self.tracer = tracer
+		self.name = name
+		self.category = category
+		self.args = args
+
+	def __enter__(self) -> None:
+		self.start = time.perf_counter()
+
+	def __exit__(self, exc_type, _exc_value, _traceback) -> None:
+		end = time.perf_counter()
+		if exc_type is not None:
+			self.args["error"] = exc_type.__name__
+		self.tracer._record(self.name, self.category, self.start, end, self.args)
+
+class Tracer:
+	def __init__(self):
+		self.enabled = False
+		self._origin = time.perf_counter()
+		self._events: List[Dict[str, Any]] = []
+		self._thread_names: Dict[int, str] = {}
+		self._lock = threading.Lock()
+
+	def enable(self) -> None:
+		self.enabled = True
+
+	# Context manager that records the time spent in it under `name`. `args` are shown with the
+	# span in the trace viewer
+	def span(self, name: str, category: str="stage", **args) -> ContextManager[None]:
+		if not self.enabled:
+			return _NO_SPAN
+		return _Span(self, name, category, args)
+
+	def _record(self, name: str, category: str, start: float, end: float, args: Dict[str, Any]
+			) -> None:
+		thread = threading.current_thread()
+		event = {
+			"name": name,
+			"cat": category,
+			"ph": "X", # complete event, i.e. with a duration
+			"ts": (start - self._origin) * 1e6, # microseconds
+			"dur": (end - start) * 1e6,
+			"pid": os.getpid(),
+			"tid": thread.ident,
+			"args": {key: value if isinstance(value, (int, float, bool)) else str(value)
+					for key, value in args.items()},
+		}
+		with self._lock:
+			self._events.append(event)
+			self._thread_names[thread.ident] = thread.name
+
+	def clear(self) -> None:
+		with self._lock:
+			self._events.clear()
+			self._thread_names.clear()
+
+	# Count, total and maximum duration of the spans of every name, longest total first. Note that
+	# the totals of nested spans include each other
+	def summary(self) -> List[SpanSummary]:
+		with self._lock:
+			events = list(self._events)
+
+		summaries: Dict[str, SpanSummary] = {}
+		for event in events:
+			seconds = event["dur"] / 1e6
+			summary = summaries.setdefault(event["name"], SpanSummary(event["name"], 0, 0.0, 0.0))
+			summary.count += 1
+			summary.total_seconds += seconds
+			summary.max_seconds = max(summary.max_seconds, seconds)
+		return sorted(summaries.values(), key=lambda summary: summary.total_seconds, reverse=True)
+
+	# Writes the recorded spans as a Chrome trace event file
+	def write(self, path: str) -> None:
+		with self._lock:
+			events = list(self._events)
+			thread_names = dict(self._thread_names)
+
+		metadata = [
+			{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+			for tid, name in thread_names.items()
+		]
+		with open(path, "w") as f:
+			json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+
+tracer = Tracer()
+
+def span(name: str, category: str="stage", **args) -> ContextManager[None]:
+	return tracer.span(name, category, **args)
+
+# Returns a function that calls `fn` in a span
+def traced(name: str, fn: Callable[..., Any], category: str="stage") -> Callable[..., Any]:
+	def traced_fn(*args, **kwargs):
+		with tracer.span(name, category):
+			return (fn)(*args, **kwargs)
+	return traced_fn
+
+# The summary as an HTML table, for the About dialog
+def summary_html(max_rows: int=30) -> str:
+	summaries = tracer.summary()
+	rows = "".join(
+		f"<tr><td>{html.escape(summary.name)}</td><td align='right'>{summary.count}</td>"
+		+ f"<td align='right'>{summary.total_seconds * 1000:.0f}</td>"
+		+ f"<td align='right'>{summary.max_seconds * 1000:.0f}</td></tr>"
+		for summary in summaries[:max_rows]
+	)
+	more = f"<p>...and {len(summaries) - max_rows} more</p>" if len(summaries) > max_rows else ""
+	return ("<table cellspacing='4'><tr><th align='left'>Stage</th><th>Count</th>"
+			+ f"<th>Total ms</th><th>Max ms</th></tr>{rows}</table>{more}")
@@ -0,0 +1,83 @@
+from typing import *
+
+import json, time, threading, urllib.request
+
+import util
+import tracing
+
+
+"""
+This file handles the list of unranked charts from EtternaOnline. Scores on those charts are left
+out of the plots. The download can take a while (or hang), so it runs in a background thread. The
+parsed list is cached on disk and only downloaded again when the cache is older than
+CACHE_MAX_AGE
+"""
+
+URL = "https://etternaonline.com/unranked"
+CACHE_PATH = "etterna-graph-unranked-cache.json"
+CACHE_MAX_AGE = 7 * 24 * 60 * 60 # seconds
+DOWNLOAD_TIMEOUT = 15 # seconds
+
+# Set of (song name, steps type) pairs
+UnrankedCharts = FrozenSet[Tuple[str, str]]
+
+def parse(content: str) -> UnrankedCharts:
+	charts = set()
+	for row in util.extract_strs(content, "<tr>", "</tr>"):
+		name = util.extract_str(row, "\">", "<")
+		steps = util.extract_str(util.extract_str(row, "</td>", "</td>"), "<td>", "</td>")
+		charts.add((name, steps))
+	return frozenset(charts)
+
+# Returns the cached list and whether it's expired, or None if there's no (readable) cache
+def load_cache(path: str=CACHE_PATH) -> Optional[Tuple[UnrankedCharts, bool]]:
+	try:
+		with open(path) as f:
+			cache = json.load(f)
+		charts = frozenset((song, steps) for (song, steps) in cache["charts"])
+		is_expired = time.time() - cache["downloaded"] > CACHE_MAX_AGE
+	except FileNotFoundError:
+		return None
+	except Exception:
+		util.logger.exception("Couldn't read the unranked chart list cache")
+		return None
+
+	return (charts, is_expired)
+
+def save_cache(charts: UnrankedCharts, path: str=CACHE_PATH) -> None:
+	cache = {
+		"downloaded": time.time(),
+		"charts": sorted(charts, key=lambda chart: (chart[0] or "", chart[1] or "")),
+	}
+	with open(path, "w") as f:
+		json.dump(cache, f, separators=(",", ":"))
+
+def download(url: str=URL, timeout: float=DOWNLOAD_TIMEOUT) -> UnrankedCharts:
+	with tracing.span("unranked_download"):
+		with urllib.request.urlopen(url, timeout=timeout) as response:
+			content = response.read().decode("utf-8", errors="replace")
+		return parse(content)
+
+# Downloads and caches the list in a background thread. `callback` is called with the list from
+# that thread, so it must not touch any widgets itself. If the download fails, `callback` isn't
+# called at all
+def download_in_background(callback: Callable[[UnrankedCharts], None], url: str=URL,
+		cache_path: str=CACHE_PATH, timeout: float=DOWNLOAD_TIMEOUT) -> threading.Thread:
+
+	def run():
+		try:
+			charts = download(url, timeout)
+		except Exception:
+			util.logger.exception("Couldn't download unranked chart list :(")
+			return
+
+		try:
+			save_cache(charts, cache_path)
+		except Exception:
+			util.logger.exception("Couldn't write the unranked chart list cache")
+
+		callback(charts)
+
+	thread = threading.Thread(target=run, name="unranked-download", daemon=True)
+	thread.start()
+	return thread
@@ -3,6 +3,8 @@ from typing import *
 import os, logging, json, math
 from datetime import datetime, timedelta
 
+import numpy as np
+
 import app
 
 
@@ -44,8 +46,8 @@ def wifescore_to_grade_string(wifescore: float) -> str:
 	logger.exception("this shouldn't happen")
 	return "aaaaaaaaaaaaaaaa"
 
-def num_notes(score: Any) -> int:
-	return sum([int(e.text) for e in score.find("TapNoteScores")])
+def num_notes(table, score) -> int:
+	return int(table.judgements[score].sum())
 
 def extract_strs(string: str, before: str, after: str) -> Generator[str, None, None]:
 	start_index = 0
@@ -56,7 +58,7 @@ def extract_strs(string: str, before: str, after: str) -> Generator[str, None, N
 		
 		after_index = string.find(after, before_index)
 		if after_index == -1:
-			start_index = after_index + 1 # the next occurence that's not this one
+			start_index = before_index + 1 # the next occurence that's not this one
 			continue
 		
 		yield string[before_index+len(before)+1:after_index]
@@ -65,41 +67,75 @@ def extract_strs(string: str, before: str, after: str) -> Generator[str, None, N
 def extract_str(string: str, before: str, after: str) -> str:
 	return next(extract_strs(string, before, after), None)
 
-# Parses date in Etterna.xml format
-def parsedate(s):
+# Parses all DateTime strings from Etterna.xml at once into a datetime64[s] array. The format is
+# fixed, "YYYY-MM-DD HH:MM:SS", except on midnight, where Etterna omits the time part of the
+# datetime ("YYYY-MM-DD"). Weird behavior, but true. Found by snover
+# None (score without DateTime) becomes NaT
+def parse_datetimes(strings: Sequence[Optional[str]]) -> np.ndarray:
+	strings = ["" if s is None else s for s in strings]
+	lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+	if not np.isin(lengths, [0, 10, 19]).all():
+		raise ValueError("Malformed DateTime in Etterna.xml")
+	
+	# One row of ASCII codes per string, zero-padded to 19
 	try:
-		return datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
-	except ValueError:
-		# in this case this datetime is on midnight, in which case Etterna omits the time part
-		# of the datetime. Weird behavior, but true. Found by snover
-		return datetime.strptime(s, "%Y-%m-%d")
-
-def score_within_n_months(score, months: Optional[int]) -> bool:
-	if months is None: return True
+		chars = np.array(strings, dtype="S19").view(np.uint8).reshape(len(strings), 19)
+	except UnicodeEncodeError:
+		raise ValueError("Malformed DateTime in Etterna.xml")
+	digits = chars.astype(np.int64) - ord("0")
 	
-	time_delta = datetime.now() - parsedate(score.findtext("DateTime"))
-	return time_delta <= timedelta(365 / 12 * months)
-
-def iter_scores(xml) -> Generator[Any, None, None]:
-	for chart in xml.iter("Chart"):	
-		if app.app.is_blacklisted(chart.get("Song"), chart.get("Steps")):
-			print("hit a blacklisted chart :D", chart.get("Song"))
-			continue
-
-		for score in chart.iter("Score"):
-			# is the score rating unreasonably high?
-			skillset_ssrs = score.find("SkillsetSSRs")
-			if skillset_ssrs is not None:
-				overall_ssr = float(skillset_ssrs.findtext("Overall"))
-				if overall_ssr > 40:
-					continue
-			
-			# is the score invalid (only if invalidated scores aren't shown)
-			if score.findtext("EtternaValid") == "0" and app.app.prefs.hide_invalidated:
-				continue
-			
-			# this score looks legit
-			yield score
+	has_date = lengths > 0
+	has_time = lengths == 19
+	date_digits = digits[has_date][:, [0, 1, 2, 3, 5, 6, 8, 9]]
+	time_digits = digits[has_time][:, [11, 12, 14, 15, 17, 18]]
+	if (((date_digits < 0) | (date_digits > 9)).any() or ((time_digits < 0) | (time_digits > 9)).any()
+			or (chars[has_date][:, [4, 7]] != ord("-")).any()
+			or (chars[has_time][:, 10] != ord(" ")).any()
+			or (chars[has_time][:, [13, 16]] != ord(":")).any()):
+		raise ValueError("Malformed DateTime in Etterna.xml")
+	
+	def number(start: int, end: int) -> np.ndarray:
+		result = np.zeros(len(strings), dtype=np.int64)
+		for i in range(start, end):
+			result = result * 10 + digits[:, i]
+		return result
+	
+	# Years and months are calendar units, so they are added in datetime64[M] resolution. The rest
+	# is plain seconds
+	months = (number(0, 4) - 1970) * 12 + number(5, 7) - 1
+	days = months.astype("datetime64[M]").astype("datetime64[D]") + (number(8, 10) - 1)
+	seconds = number(11, 13) * 3600 + number(14, 16) * 60 + number(17, 19)
+	
+	result = days.astype("datetime64[s]") + np.where(has_time, seconds, 0)
+	result[~has_date] = np.datetime64("NaT")
+	return result
+
+# Returns the (fractional) hour of day of each datetime64 in the array, e.g. 13.5 for 1:30 pm
+def hour_of_day(datetimes: np.ndarray) -> np.ndarray:
+	seconds_since_midnight = (datetimes - datetimes.astype("datetime64[D]")) / np.timedelta64(1, "s")
+	return seconds_since_midnight / 3600
+
+# Returns the point in time `months` months ago, or None if `months` is None
+def months_ago(months: Optional[int]) -> Optional[np.datetime64]:
+	if months is None: return None
+	return np.datetime64(datetime.now() - timedelta(365 / 12 * months), "s")
+
+# Returns the indices of all scores in the ScoreTable that should be considered by the plots
+def iter_scores(table) -> np.ndarray:
+	blacklisted_charts = np.array([app.app.is_blacklisted(song, steps)
+			for (song, steps) in zip(table.songs, table.steps)], dtype=bool)
+	
+	mask = ~blacklisted_charts[table.chart_indices]
+	
+	# is the score rating unreasonably high? (scores without SkillsetSSRs are NaN here and pass)
+	mask &= ~(table.ssrs[:, 0] > 40)
+	
+	# is the score invalid (only if invalidated scores aren't shown)
+	if app.app.prefs.hide_invalidated:
+		mask &= table.valid
+	
+	# those scores look legit
+	return np.flatnonzero(mask)
 
 # Convert a float of hours to a string, e.g. "5h 35min"
 def timespan_str(hours):
@@ -108,17 +144,9 @@ def timespan_str(hours):
 	minutes = minutes_total - 60 * hours
 	return f"{hours}h {minutes}min"
 
-cache_data = {}
-def cache(key, data=None):
-	global cache_data
-	
-	if data is not None: # If data was given, update cache
-		cache_data[key] = data
-	return cache_data.get(key) # Return cached data
-
-def find_parent_chart(xml, score):
-	score_key = score.get("Key")
-	return xml.find(f".//Score[@Key=\"{score_key}\"]/../..")
+# Returns the index of the chart that the score was played on
+def find_parent_chart(table, score) -> int:
+	return table.chart_indices[score]
 
 # Abbreviates a number, e.g. (with default `min_precision`):
 #  1367897 -> 1367k
@@ -129,18 +157,3 @@ def abbreviate(n, min_precision=2):
 	postfix_index = int((num_digits - min_precision) / 3)
 	postfix = ["", "k", "M", "B", "T", "Q"][postfix_index]
 	return str(round(n / 1000**postfix_index)) + postfix
-
-def groupby(iterator, keyfunc):
-	prev_key = None
-	group = []
-	for value in iterator:
-		key = (keyfunc)(value)
-
-		if key == prev_key:
-			group.append(value)
-		else:
-			yield prev_key, group
-			prev_key = key
-			group = []
-	
-	yield prev_key, group
\ No newline at end of file
@@ -0,0 +1,65 @@
+from typing import *
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import util
+
+
+"""
+This file holds the Worker, which runs slow jobs (loading Etterna.xml, the replays analysis, the
+data generators) in a background thread so that the window stays responsive. Results are carried
+back to the GUI thread through a Qt signal, so the callbacks that build widgets out of them run
+in the GUI thread
+"""
+
+# Carries results from the worker thread over to the GUI thread
+class _ResultSignal(QObject):
+	# generation, callback, result
+	arrived = pyqtSignal(int, object, object)
+
+class Worker:
+	# Must be created in the GUI thread
+	def __init__(self):
+		self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="worker")
+		self._signal = _ResultSignal()
+		self._signal.arrived.connect(self._deliver)
+		self._jobs: List[Future] = []
+		# Incremented by cancel(). Results of jobs submitted before that are dropped
+		self._generation = 0
+
+	# Runs `fn` in the worker thread and then calls `callback` with its return value in the GUI
+	# thread. Jobs run one at a time, in the order they were submitted. If `fn` raises, the
+	# exception is logged and `on_error` is called instead, if given
+	def submit(self, fn: Callable[[], Any], callback: Callable[[Any], None],
+			on_error: Optional[Callable[[], None]]=None) -> None:
+		generation = self._generation
+		def run():
+			try:
+				result = (fn)()
+			except Exception:
+				util.logger.exception("Background job")
+				if on_error is not None:
+					self._signal.arrived.emit(generation, lambda _: (on_error)(), None)
+				return
+			self._signal.arrived.emit(generation, callback, result)
+
+		self._jobs = [job for job in self._jobs if not job.done()]
+		self._jobs.append(self._executor.submit(run))
+
+	# Whether there are jobs that didn't finish yet
+	def is_busy(self) -> bool:
+		return any(not job.done() for job in self._jobs)
+
+	# Drops all jobs that didn't start yet. The job that's running right now can't be interrupted,
+	# but its result is dropped
+	def cancel(self) -> None:
+		self._generation += 1
+		for job in self._jobs:
+			job.cancel()
+		self._jobs = []
+
+	def _deliver(self, generation: int, callback: Callable[[Any], None], result: Any) -> None:
+		if generation == self._generation:
+			(callback)(result)
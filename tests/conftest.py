@@ -0,0 +1,90 @@
+from typing import *
+
+import os, sys
+from datetime import datetime
+from types import SimpleNamespace
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from score_table import ScoreTable # needs src/ on the path
+import app
+import score_table
+import headless
+import generator_engine
+from settings import Settings
+
+
+"""
+The tests run the Python kernels on tests/data/Etterna.xml, a tiny save game with a few charts,
+rates, sessions and retries, and compare them against straightforward reimplementations of the code
+they replaced
+"""
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+@pytest.fixture
+def xml_path() -> str:
+	return os.path.join(DATA_DIR, "Etterna.xml")
+
+# How DateTimes were parsed before the score table (util.parsedate)
+def _parsedate(s: str) -> datetime:
+	try:
+		return datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
+	except ValueError:
+		# Etterna omits the time part on midnight
+		return datetime.strptime(s, "%Y-%m-%d")
+
+# Every <Score> in <PlayerScores> in file order, read with ElementTree like before the score table:
+# the element, its <Chart>, the chart index, the rate of its <ScoresAt> and its parsed DateTime
+@pytest.fixture
+def reference_scores(xml_path) -> List[SimpleNamespace]:
+	scores = []
+	charts = ET.parse(xml_path).getroot().find("PlayerScores").findall("Chart")
+	for (chart_index, chart) in enumerate(charts):
+		for scores_at in chart.iter("ScoresAt"):
+			for score in scores_at.iter("Score"):
+				scores.append(SimpleNamespace(elem=score, chart=chart, chart_index=chart_index,
+						rate=float(scores_at.get("Rate")), scores_at=scores_at,
+						datetime=_parsedate(score.findtext("DateTime"))))
+	return scores
+
+def _assert_tables_equal(a, b) -> None:
+	# The interned ids depend on the order the strings were seen in, so compare the strings
+	for name in ScoreTable.COLUMNS:
+		if name in ("grades", "modifier_ids"): continue
+		np.testing.assert_array_equal(getattr(a, name), getattr(b, name), err_msg=name)
+	assert [a.grade_name(i) for i in range(len(a))] == [b.grade_name(i) for i in range(len(b))]
+	assert [a.modifier_string(i) for i in range(len(a))] == [b.modifier_string(i) for i in range(len(b))]
+	for name in ScoreTable.LISTS:
+		if name in ("grade_names", "modifiers"): continue
+		assert getattr(a, name) == getattr(b, name), name
+	for name in ScoreTable.SCALARS:
+		assert getattr(a, name) == getattr(b, name), name
+
+# Asserts that two ScoreTables hold the same scores, even if they were built differently (e.g. one
+# of them incrementally)
+@pytest.fixture
+def assert_tables_equal() -> Callable[[Any, Any], None]:
+	return _assert_tables_equal
+
+# A HeadlessApp with the default settings and no unranked charts, for everything that reads app.app
+@pytest.fixture
+def headless_app(tmp_path, monkeypatch):
+	prefs = Settings.load_from_json(str(tmp_path / "settings.json")) # doesn't exist, so the defaults
+	monkeypatch.setattr(app, "app", app.HeadlessApp(prefs, frozenset()))
+	return app.app
+
+# The view over all scores of tests/data/Etterna.xml, like the GUI and headless.py prepare it
+@pytest.fixture
+def prepared_view(xml_path, headless_app) -> generator_engine.ScoreView:
+	return generator_engine.prepare(score_table.load(xml_path))
+
+# headless.OUTPUTS without the ones whose generators need the savegame_analysis module, which isn't
+# built when the Python tests run
+@pytest.fixture
+def non_native_outputs() -> List[headless.Output]:
+	native = {"session_rating_improvement", "skillset_development"} # calc_ratings_for_sessions
+	return [output for output in headless.OUTPUTS if output.name not in native]
@@ -0,0 +1,74 @@
+from typing import *
+
+from statistics import median
+
+import numpy as np
+import pytest
+
+import score_table
+import data_generators
+from attempt_pairs import AttemptPairs
+from generator_engine import ScoreView
+
+
+# The consecutive attempts of every <ScoresAt>, as calc_median_score_increase used to find them:
+# (first score, second score, attempt number, idle seconds, wifescore delta, Overall SSR delta)
+def _reference_pairs(reference_scores) -> List[Tuple[str, str, int, float, float, float]]:
+	by_scores_at = {}
+	for ref in reference_scores:
+		by_scores_at.setdefault(id(ref.scores_at), []).append(ref)
+
+	ssr = lambda score: float(score.findtext("SkillsetSSRs/Overall") or "nan")
+	pairs = []
+	for refs in by_scores_at.values():
+		# Chronologically sorted scores
+		refs = sorted(refs, key=lambda ref: ref.elem.findtext("DateTime"))
+		for i in range(len(refs) - 1):
+			first, second = refs[i].elem, refs[i + 1].elem
+			time_delta = refs[i + 1].datetime - refs[i].datetime
+			idle_time = time_delta.total_seconds() - float(first.findtext("SurviveSeconds"))
+			wifescore_delta = float(second.findtext("SSRNormPercent")) - float(first.findtext("SSRNormPercent"))
+			pairs.append((first.get("Key"), second.get("Key"), i + 1, idle_time, wifescore_delta,
+					ssr(second) - ssr(first)))
+	return sorted(pairs)
+
+def _attempt_pairs(table, scores: np.ndarray) -> AttemptPairs:
+	return AttemptPairs(scores, table.chart_indices[scores], table.rates[scores],
+			table.datetimes[scores], table.survive_seconds[scores], table.wifescores[scores],
+			table.ssrs[scores])
+
+def test_attempt_pairs_match_per_scores_at_loop(xml_path, reference_scores):
+	table = score_table.load(xml_path)
+	pairs = _attempt_pairs(table, np.arange(len(table)))
+
+	actual = sorted(zip(table.scorekeys[pairs.first_scores].tolist(),
+			table.scorekeys[pairs.second_scores].tolist(), pairs.attempt_numbers.tolist(),
+			pairs.idle_seconds.tolist(), pairs.wifescore_deltas.tolist(), pairs.ssr_deltas.tolist()))
+	expected = _reference_pairs(reference_scores)
+	assert len(actual) == len(expected) == 5
+	for (a, e) in zip(actual, expected):
+		assert a[:3] == e[:3]
+		assert a[3:] == pytest.approx(e[3:], nan_ok=True)
+
+def test_attempt_pairs_of_subset(xml_path):
+	table = score_table.load(xml_path)
+	# Without S08, S07 and S09 become consecutive attempts
+	scores = np.flatnonzero(table.scorekeys != "S08")
+	pairs = _attempt_pairs(table, scores)
+	keys = set(zip(table.scorekeys[pairs.first_scores], table.scorekeys[pairs.second_scores]))
+	assert ("S07", "S09") in keys and len(keys) == 4
+
+def test_median_score_increase(xml_path, reference_scores):
+	table = score_table.load(xml_path)
+	scores = np.flatnonzero(table.valid)
+	inputs = {"table": table.version, "hide_invalidated": True, "blacklist": frozenset(),
+			"time_range": None}
+	view = ScoreView(table, scores, inputs)
+
+	# The old implementation looked for charts inside of every <ScoresAt>, found none and always
+	# returned 0. This is what it meant to compute
+	valid = [ref for ref in reference_scores if ref.elem.findtext("EtternaValid") != "0"]
+	increases = [100 * delta for (_, _, _, idle, delta, _) in _reference_pairs(valid) if idle < 60]
+	assert len(increases) == 2 # the Sóng C retries
+	assert data_generators.calc_median_score_increase(view) == pytest.approx(median(increases))
+	assert data_generators.calc_median_score_increase(view) > 0
@@ -0,0 +1,104 @@
+from typing import *
+
+import os, json, shutil
+
+import numpy as np
+import pytest
+
+import batch
+import snapshot
+from batch import Profile
+
+
+@pytest.fixture
+def profiles(xml_path, tmp_path) -> List[Profile]:
+	profiles = []
+	for name in ("a", "b"):
+		os.makedirs(tmp_path / "profiles" / name)
+		profile_xml_path = str(tmp_path / "profiles" / name / "Etterna.xml")
+		shutil.copyfile(xml_path, profile_xml_path)
+		profiles.append(Profile(name, profile_xml_path, None))
+	return profiles
+
+def write_summary(output: str, profile: Profile, totals: Dict[str, Any],
+		tables: Dict[str, Dict[str, List[Any]]]) -> None:
+	os.makedirs(os.path.join(output, batch.PROFILES_DIR), exist_ok=True)
+	batch._write_json_atomically(batch._summary_path(output, profile), {
+		"profile": {"name": profile.name, "xml_path": profile.xml_path, "replays_dir": None},
+		"fingerprint": snapshot.fingerprint(profile.xml_path),
+		"totals": totals,
+		"tables": tables,
+	})
+
+def test_find_profiles(profiles, tmp_path):
+	assert batch.find_profiles(str(tmp_path / "profiles")) == profiles
+
+def test_is_done(profiles, tmp_path):
+	output = str(tmp_path / "output")
+	profile = profiles[0]
+	assert not batch.is_done(output, profile)
+	
+	write_summary(output, profile, {}, {})
+	assert batch.is_done(output, profile)
+	
+	# Etterna.xml changed since the summary was written
+	with open(profile.xml_path, "a") as f:
+		f.write("\n")
+	assert not batch.is_done(output, profile)
+	
+	with open(batch._summary_path(output, profile), "w") as f:
+		f.write("{ half-written")
+	assert not batch.is_done(output, profile)
+
+# Profiles with an up to date summary are skipped, and a profile that fails gets an error file
+# instead of a summary
+def test_analyze_profiles_resumes(profiles, tmp_path, headless_app):
+	output = str(tmp_path / "output")
+	done, broken = profiles
+	write_summary(output, done, {"scores": 1}, {})
+	with open(batch._summary_path(output, done)) as f:
+		done_summary = f.read()
+	with open(broken.xml_path, "w") as f:
+		f.write("<Stats><PlayerScores><Chart")
+	
+	assert batch.analyze_profiles(profiles, output, processes=1) == 1
+	with open(batch._summary_path(output, done)) as f:
+		assert f.read() == done_summary
+	assert os.path.exists(batch._error_path(output, broken))
+	assert not os.path.exists(batch._summary_path(output, broken))
+
+def test_merge(profiles, tmp_path):
+	output = str(tmp_path / "output")
+	a, b = profiles
+	totals = {"scores": 10, "first_play": "2020-01-01T12:00:00", "cb_ratio": None}
+	write_summary(output, a, totals, {
+		"rating_timelines": {"datetime": ["2020-01-01T12:00:00", "2020-01-02T00:00:00"],
+				"overall": [20.5, 21.0]},
+	})
+	write_summary(output, b, {**totals, "first_play": None, "cb_ratio": 0.01}, {
+		"rating_timelines": {"datetime": ["2020-02-01T10:00:00"], "overall": [18]},
+		"cb_ratios": {"column": [1, 2], "cb_ratio": [0.02, None]},
+	})
+	missing = Profile("c", str(tmp_path / "c" / "Etterna.xml"), None) # never analyzed
+	
+	tables = batch.merge([a, b, missing], output)
+	assert sorted(tables) == ["cb_ratios", "profiles", "rating_timelines"]
+	
+	profiles_table = tables["profiles"]
+	assert profiles_table["profile"].tolist() == ["a", "b"]
+	assert profiles_table["scores"].tolist() == [10, 10]
+	np.testing.assert_array_equal(profiles_table["first_play"],
+			np.array(["2020-01-01T12:00:00", "NaT"], dtype="datetime64[s]"))
+	np.testing.assert_array_equal(profiles_table["cb_ratio"], [np.nan, 0.01])
+	
+	timelines = tables["rating_timelines"]
+	assert timelines["profile"].tolist() == ["a", "a", "b"]
+	assert timelines["datetime"].dtype == np.dtype("datetime64[s]")
+	# a mix of ints and floats becomes floats
+	assert timelines["overall"].dtype == np.float64
+	assert timelines["overall"].tolist() == [20.5, 21.0, 18.0]
+	
+	cb_ratios = tables["cb_ratios"]
+	assert cb_ratios["profile"].tolist() == ["b", "b"]
+	assert cb_ratios["column"].tolist() == [1, 2]
+	np.testing.assert_array_equal(cb_ratios["cb_ratio"], [0.02, np.nan])
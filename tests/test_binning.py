@@ -0,0 +1,103 @@
+from typing import *
+
+from collections import Counter
+from datetime import timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import util
+import binning
+import score_table
+import data_generators
+from generator_engine import ScoreView
+
+
+def _view(table, scores: Optional[np.ndarray]=None) -> ScoreView:
+	if scores is None: scores = np.arange(len(table))
+	inputs = {"table": table.version, "hide_invalidated": False, "blacklist": frozenset(),
+			"time_range": None}
+	return ScoreView(table, scores, inputs)
+
+@pytest.mark.parametrize("reducer", binning.REDUCERS)
+def test_histogram_matches_loop(reducer):
+	rng = np.random.default_rng(0)
+	values = rng.uniform(-5, 105, 1000)
+	values[::50] = np.nan
+	values[1::50] = 50 # on an edge
+	weights = rng.normal(size=len(values))
+	edges = np.array([0, 10, 25, 50, 50.5, 99, 100])
+
+	members = [[] for _ in range(len(edges) - 1)]
+	for (value, weight) in zip(values, weights):
+		for i in range(len(edges) - 1):
+			if edges[i] <= value < edges[i + 1]:
+				members[i].append(weight)
+	reduce = {"count": len, "sum": sum, "mean": lambda w: sum(w) / len(w), "min": min, "max": max}
+	expected = [reduce[reducer](w) if w or reducer == "count" else -1 for w in members]
+
+	result = binning.histogram(values, edges, weights, reducer=reducer, empty=-1)
+	assert result.tolist() == pytest.approx(expected)
+
+def test_reduce_groups_skips_negative_groups():
+	groups = np.array([0, 2, -1, 2, 0])
+	weights = np.array([1.0, 2.0, 100.0, 4.0, 3.0])
+	assert binning.reduce_groups(groups, 4).tolist() == [2, 0, 2, 0]
+	assert binning.reduce_groups(groups, 4, weights, "mean", empty=np.nan).tolist() \
+			== pytest.approx([2, np.nan, 3, np.nan], nan_ok=True)
+	assert binning.reduce_groups(groups, 4, weights, "max").tolist() == [3, 0, 4, 0]
+
+def test_count_nums_grades_matches_loop(xml_path, reference_scores):
+	table = score_table.load(xml_path)
+	grades = []
+	for ref in reference_scores:
+		percent = float(ref.elem.findtext("SSRNormPercent"))
+		grade = sum(percent >= t for t in util.grade_thresholds) - 1
+		grades.append(util.grade_names[grade])
+	assert data_generators.count_nums_grades(_view(table)) == Counter(grades)
+
+def test_avg_score_per_hour_matches_loop(xml_path, reference_scores):
+	table = score_table.load(xml_path)
+	nums_scores, score_sums = [0] * 24, [0] * 24
+	for ref in reference_scores:
+		skillset_ssrs = ref.elem.find("SkillsetSSRs")
+		if not skillset_ssrs: continue
+		nums_scores[ref.datetime.hour] += 1
+		score_sums[ref.datetime.hour] += float(skillset_ssrs.findtext("Overall"))
+	expected = [s / n if n else 0 for (s, n) in zip(score_sums, nums_scores)]
+
+	x, y = data_generators.gen_avg_score_per_hour(_view(table))
+	assert x == list(range(24))
+	assert y == pytest.approx(expected)
+
+def test_idle_time_buckets_match_loop(xml_path, reference_scores):
+	table = score_table.load(xml_path)
+	buckets = [0] * 600
+	last_play_end = None
+	for ref in sorted(reference_scores, key=lambda ref: ref.elem.findtext("DateTime")):
+		length = timedelta(seconds=float(ref.elem.findtext("SurviveSeconds")) * ref.rate)
+		if last_play_end is not None:
+			idle_time = ref.datetime - last_play_end
+			if idle_time >= timedelta():
+				bucket_index = int(idle_time.total_seconds() // 5)
+				if bucket_index < len(buckets):
+					buckets[bucket_index] += 1
+		last_play_end = ref.datetime + length
+
+	x, y = data_generators.gen_idle_time_buckets(_view(table))
+	assert x == list(range(0, 3000, 5))
+	assert y == buckets
+	assert sum(y) > 0
+
+
+def test_wifescore_frequencies_are_labeled_with_lower_edge():
+	view = SimpleNamespace(wifescores=np.array([0.70, 0.7099, 0.57, 0.71, 0.7149, 0.7150, 0.999,
+			1.0, np.nan]))
+
+	x, y = data_generators.gen_wifescore_frequencies(view)
+	assert x[:2] == [70, 71] and x[-1] == 99
+	assert y[:2] == [2, 3] and y[-1] == 1 and sum(y) == 6
+
+	x, y = data_generators.gen_wifescore_frequencies(view, bin_width=0.5)
+	assert dict(zip(x, y))[71] == 2 and dict(zip(x, y))[71.5] == 1
@@ -0,0 +1,63 @@
+from typing import *
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import score_table
+import data_generators
+from generator_engine import ScoreView
+
+
+DATETIMES = np.array(["2020-01-03", "NaT", "2020-01-01", "2020-01-02T12:00", "2020-01-02", "NaT"],
+		dtype="datetime64[s]")
+
+def _view(table, scores: Optional[np.ndarray]=None) -> ScoreView:
+	if scores is None: scores = np.arange(len(table.datetimes))
+	inputs = {"table": table.version, "hide_invalidated": False, "blacklist": frozenset(),
+			"session_gap": 60, "analysis": None, "time_range": None}
+	return ScoreView(table, scores, inputs)
+
+@pytest.fixture
+def view() -> ScoreView:
+	return _view(SimpleNamespace(datetimes=DATETIMES, version=0))
+
+def day(s: str) -> np.datetime64:
+	return np.datetime64(s, "s")
+
+def test_time_range_is_half_open(view):
+	assert view.time_range().tolist() == [2, 4, 3, 0, 1, 5] # scores without a date last
+	assert view.time_range(day("2020-01-02"), day("2020-01-03")).tolist() == [4, 3]
+	assert view.time_range(day("2020-01-02")).tolist() == [4, 3, 0]
+	assert view.time_range(end=day("2020-01-02")).tolist() == [2]
+	assert view.time_range(day("2020-01-01"), day("2020-01-04")).tolist() == [2, 4, 3, 0]
+
+def test_time_range_start_after_end_is_empty(view):
+	assert view.time_range(day("2020-01-03"), day("2020-01-02")).tolist() == []
+	assert len(view.restrict(day("2020-01-03"), day("2020-01-02"))) == 0
+
+def test_restrict_keeps_view_order(view):
+	sub_view = _view(view.table, np.array([5, 3, 0, 4, 1]))
+	sub_view.datetimes # gathered before restricting, so restrict() reuses it
+	restricted = sub_view.restrict(day("2020-01-02"), day("2020-01-04"))
+	assert restricted.scores.tolist() == [3, 0, 4]
+	np.testing.assert_array_equal(restricted.datetimes, DATETIMES[[3, 0, 4]])
+	assert restricted.inputs["time_range"] == (None, day("2020-01-02"), day("2020-01-04"))
+
+def test_unbounded_restrict_keeps_scores_without_date(view):
+	assert view.restrict().scores.tolist() == view.scores.tolist()
+	assert view.restrict(day("2020-01-01")).scores.tolist() == [0, 2, 3, 4]
+
+# A date range in which every score has MaxCombo 0 has no longest combo
+def test_general_analysis_info_without_combo(xml_path):
+	table = score_table.load(xml_path)
+	table.max_combos[table.datetimes >= day("2020-02-01")] = 0
+	
+	text = data_generators.gen_text_general_analysis_info(_view(table), None)
+	assert "Longest combo: 412 on " in text
+	
+	restricted = _view(table).restrict(day("2020-02-01"))
+	assert data_generators.find_longest_combo(restricted) == (None, 0)
+	text = data_generators.gen_text_general_analysis_info(restricted, None)
+	assert "[no combo]" in text
@@ -0,0 +1,107 @@
+from typing import *
+
+import os, csv, json
+
+import numpy as np
+import pytest
+
+import headless
+import data_generators
+from process_pool import GeneratorCall
+
+
+# A table with missing values, which the plots of the test save game don't have
+MISSING_VALUES = {
+	"datetime": np.array(["2020-01-01T12:00:00", "NaT"], dtype="datetime64[s]"),
+	"value": np.array([np.nan, 1.5]),
+	"count": np.array([3, 4]),
+}
+
+@pytest.fixture
+def results(prepared_view, non_native_outputs) -> Dict[str, Any]:
+	results = headless.compute(prepared_view, None, non_native_outputs)
+	return {**results, "missing_values": MISSING_VALUES}
+
+def test_compute_splits_columns(prepared_view, non_native_outputs, results):
+	# There's no replays analysis, so the outputs that require it are left out
+	expected_outputs = [output for output in non_native_outputs if not output.requires_analysis]
+	assert list(results) == [output.name for output in expected_outputs] + ["missing_values"]
+	
+	for output in expected_outputs:
+		result = results[output.name]
+		if not output.columns:
+			assert isinstance(result, str)
+			continue
+		assert list(result) == list(output.columns)
+		assert len({len(column) for column in result.values()}) == 1, output.name
+	
+	# The list of skillset ratings of every week is spread over one column per skillset
+	week_starts, ratings = data_generators.gen_week_skillsets(prepared_view)
+	week_skillsets = results["week_skillsets"]
+	assert week_skillsets["week_start"].dtype == np.dtype("datetime64[s]")
+	for (i, skillset) in enumerate(headless.SKILLSET_COLUMNS):
+		assert week_skillsets[skillset].tolist() == [week[i] for week in ratings]
+
+def test_table_without_rows():
+	output = headless.Output("week_skillsets", GeneratorCall("gen_week_skillsets"),
+			["week_start", *headless.SKILLSET_COLUMNS])
+	table = headless._table(output, ([], []), None)
+	assert list(table) == list(output.columns)
+	assert all(len(column) == 0 for column in table.values())
+	
+	with pytest.raises(ValueError): # ratings of only two skillsets
+		headless._table(output, ([np.datetime64("2020-01-06")], [[1.0, 2.0]]), None)
+
+def test_column_values_turns_missing_values_into_none():
+	assert headless.column_values(MISSING_VALUES["datetime"]) == ["2020-01-01T12:00:00", None]
+	assert headless.column_values(MISSING_VALUES["value"]) == [None, 1.5]
+	assert headless.column_values(MISSING_VALUES["count"]) == [3, 4]
+
+def tables(results) -> Dict[str, Dict[str, np.ndarray]]:
+	return {name: result for (name, result) in results.items() if not isinstance(result, str)}
+
+def assert_texts_written(results, directory: str) -> None:
+	for name, result in results.items():
+		if isinstance(result, str):
+			with open(os.path.join(directory, f"{name}.html")) as f:
+				assert f.read() == result
+
+def test_write_json(results, tmp_path):
+	headless.write_json(results, str(tmp_path))
+	with open(tmp_path / "etterna-graph.json") as f:
+		data = json.load(f)
+	
+	assert list(data) == list(results)
+	for name, result in results.items():
+		if isinstance(result, str):
+			assert data[name] == result
+		else:
+			assert data[name] == {column: headless.column_values(values)
+					for (column, values) in result.items()}
+	assert data["missing_values"]["value"] == [None, 1.5]
+
+def test_write_csv(results, tmp_path):
+	headless.write_csv(results, str(tmp_path))
+	assert_texts_written(results, str(tmp_path))
+	
+	for name, result in tables(results).items():
+		with open(tmp_path / f"{name}.csv", newline="") as f:
+			rows = list(csv.reader(f))
+		assert rows[0] == list(result)
+		expected_columns = [["" if value is None else str(value)
+				for value in headless.column_values(values)] for values in result.values()]
+		assert rows[1:] == [list(row) for row in zip(*expected_columns)], name
+	with open(tmp_path / "missing_values.csv", newline="") as f:
+		assert list(csv.reader(f))[1:] == [["2020-01-01T12:00:00", "", "3"], ["", "1.5", "4"]]
+
+def test_write_npz(results, tmp_path):
+	headless.write_npz(results, str(tmp_path))
+	assert_texts_written(results, str(tmp_path))
+	
+	with np.load(tmp_path / "etterna-graph.npz", allow_pickle=False) as npz:
+		expected = {f"{name}/{column}": values
+				for (name, result) in tables(results).items() for (column, values) in result.items()}
+		assert sorted(npz.files) == sorted(expected)
+		for key, values in expected.items():
+			assert npz[key].dtype == values.dtype, key
+			np.testing.assert_array_equal(npz[key], values, err_msg=key)
@@ -0,0 +1,24 @@
+from typing import *
+
+from memo import Memo
+
+
+def test_datasets_are_cached_per_input_values():
+	memo = Memo(max_entries=4)
+	computed = []
+	def compute(inputs):
+		computed.append(inputs)
+		return inputs
+
+	# Like the full view and a date-restricted view asking for the same dataset in turns
+	for _ in range(3):
+		assert memo.get("sessions", ("table 1", None), lambda: compute("full")) == "full"
+		assert memo.get("sessions", ("table 1", "2020"), lambda: compute("2020")) == "2020"
+	assert computed == ["full", "2020"]
+
+	# Entries for outdated inputs fall out of the cache, least recently used first
+	for table in range(2, 6):
+		memo.get("sessions", (f"table {table}", None), lambda: compute("new"))
+	assert len(memo) == 4
+	memo.get("sessions", ("table 1", None), lambda: compute("full"))
+	assert computed[-1] == "full"
@@ -0,0 +1,47 @@
+from typing import *
+
+import math
+
+import numpy as np
+import pytest
+
+from modifiers import PERSPECTIVE_MULTIPLIERS, ModifierTable, parse_modifiers
+
+
+DISTANT = PERSPECTIVE_MULTIPLIERS["Distant"]
+
+# (modifier string, scroll type, speed, receptor size, perspective, perspective strength,
+# other mods, effective CMod)
+CASES = [
+	# Overhead after the actual perspective doesn't replace it
+	("C800, 50% Mini, 30% Distant, Overhead", "C", 800, 0.75, "Distant", 0.3, [],
+			800 * 0.75 * DISTANT ** 0.3),
+	# but a perspective after Overhead does
+	("Overhead, 30% Distant", "", math.nan, 1, "Distant", 0.3, [], math.nan),
+	("C650, Overhead", "C", 650, 1, "Overhead", 1, [], 650),
+	("M650", "M", 650, 1, "", 1, [], math.nan),
+	("2.5x", "X", 2.5, 1, "", 1, [], math.nan),
+	("Mini", "", math.nan, 0.5, "", 1, [], math.nan),
+	("C500, Mini, Distant", "C", 500, 0.5, "Distant", 1, [], 500 * 0.5 * DISTANT),
+	# only percentages count as Mini strength, anything else is an unknown mod
+	("abc Mini", "", math.nan, 1, "", 1, ["abc Mini"], math.nan),
+	("C700, abc% Mini, Reverse", "C", 700, 1, "", 1, ["abc% Mini", "Reverse"], 700),
+	("", "", math.nan, 1, "", 1, [], math.nan),
+]
+
+@pytest.mark.parametrize("string, scroll_type, speed, receptor_size, perspective, strength, "
+		"other_mods, effective_cmod", CASES)
+def test_parse_modifiers(string, scroll_type, speed, receptor_size, perspective, strength,
+		other_mods, effective_cmod):
+	parsed = parse_modifiers(string)
+	assert parsed.scroll_type == scroll_type
+	assert parsed.speed == pytest.approx(speed, nan_ok=True)
+	assert parsed.receptor_size == pytest.approx(receptor_size)
+	assert parsed.perspective == perspective
+	assert parsed.perspective_strength == pytest.approx(strength)
+	assert parsed.other_mods == other_mods
+
+def test_effective_cmods():
+	table = ModifierTable([case[0] for case in CASES])
+	expected = [case[-1] for case in CASES]
+	np.testing.assert_allclose(table.effective_cmods, expected)
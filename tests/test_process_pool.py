@@ -0,0 +1,46 @@
+from typing import *
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+import headless
+import process_pool
+from process_pool import GeneratorCall
+
+
+# Remembers the names of the shared memory blocks that run_generators creates
+@pytest.fixture
+def shm_names(monkeypatch) -> List[str]:
+	names = []
+	class RecordingSharedColumns(process_pool.SharedColumns):
+		def __init__(self, arrays):
+			super().__init__(arrays)
+			names.append(self.name)
+	monkeypatch.setattr(process_pool, "SharedColumns", RecordingSharedColumns)
+	return names
+
+def assert_unlinked(name: str) -> None:
+	with pytest.raises(FileNotFoundError):
+		shared_memory.SharedMemory(name=name)
+
+def test_pool_matches_single_process(prepared_view, non_native_outputs, shm_names):
+	expected = headless.compute(prepared_view, None, non_native_outputs, processes=1)
+	assert shm_names == []
+	
+	results = headless.compute(prepared_view, None, non_native_outputs, processes=3)
+	assert results.keys() == expected.keys()
+	for name in expected:
+		np.testing.assert_equal(results[name], expected[name], err_msg=name)
+	
+	assert len(shm_names) == 1
+	assert_unlinked(shm_names[0])
+
+def test_failing_generator_frees_shared_memory(prepared_view, shm_names):
+	calls = [GeneratorCall("gen_plays_by_hour"), GeneratorCall("gen_plays_by_hour", (), {"bogus": 1})]
+	with pytest.raises(TypeError):
+		process_pool.run_generators(prepared_view, calls, processes=2)
+	
+	assert len(shm_names) == 1
+	assert_unlinked(shm_names[0])
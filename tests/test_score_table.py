@@ -0,0 +1,130 @@
+from typing import *
+
+import logging
+
+import numpy as np
+
+import score_table
+from score_table import SSR_NAMES, JUDGEMENT_NAMES, HOLD_NAMES
+
+
+def test_find_chart_ranges_stops_at_truncated_chart(xml_path):
+	with open(xml_path, "rb") as f:
+		data = f.read()
+	complete = score_table._find_chart_ranges(data)
+	assert len(complete) == 5
+
+	# The </Chart> of the last chart is missing
+	last_close = data.rindex(b"</Chart>")
+	truncated = data[:last_close] + data[last_close + len(b"</Chart>"):]
+	assert score_table._find_chart_ranges(truncated) == complete[:-1]
+
+	# <PlayerScores> ends in the middle of the opening tag of the last chart
+	tag_end = data.index(b">", data.rindex(b"<Chart "))
+	truncated = data[:tag_end] + b"</PlayerScores></Stats>"
+	assert score_table._find_chart_ranges(truncated) == complete[:-1]
+
+def test_load_truncated_file(xml_path, tmp_path):
+	with open(xml_path, "rb") as f:
+		data = f.read()
+	last_close = data.rindex(b"</Chart>")
+	truncated_path = tmp_path / "Etterna.xml"
+	truncated_path.write_bytes(data[:last_close] + data[last_close + len(b"</Chart>"):])
+
+	table = score_table.load(str(truncated_path))
+	assert table.scorekeys.tolist() == [f"S{i:02}" for i in range(1, 10)]
+
+def test_load_matches_element_tree(xml_path, reference_scores):
+	table = score_table.load(xml_path)
+	assert len(table) == len(reference_scores) == 10
+	assert table.num_charts == 5 # the <Chart> in <Playlists> isn't one
+
+	for (i, ref) in enumerate(reference_scores):
+		score = ref.elem
+		assert table.scorekeys[i] == score.get("Key")
+		assert table.chart_indices[i] == ref.chart_index
+		assert table.score_metadata(i)[1:] == (ref.rate, ref.chart.get("Pack"), ref.chart.get("Song"),
+				ref.chart.get("Steps"))
+		assert table.datetimes[i] == np.datetime64(ref.datetime)
+		assert table.wifescores[i] == float(score.findtext("SSRNormPercent"))
+		assert table.survive_seconds[i] == float(score.findtext("SurviveSeconds"))
+		assert table.max_combos[i] == int(score.findtext("MaxCombo"))
+		assert table.valid[i] == (score.findtext("EtternaValid") != "0")
+		assert table.grade_name(i) == score.findtext("Grade")
+		assert table.modifier_string(i) == (score.findtext("Modifiers") or "")
+
+		ssrs = score.find("SkillsetSSRs")
+		expected_ssrs = [np.nan] * len(SSR_NAMES) if ssrs is None \
+				else [float(ssrs.findtext(name)) for name in SSR_NAMES]
+		np.testing.assert_array_equal(table.ssrs[i], expected_ssrs)
+		tap_note_scores, hold_note_scores = score.find("TapNoteScores"), score.find("HoldNoteScores")
+		assert table.judgements[i].tolist() == [int(tap_note_scores.findtext(name))
+				for name in JUDGEMENT_NAMES]
+		assert table.holds[i].tolist() == [int(hold_note_scores.findtext(name)) for name in HOLD_NAMES]
+
+	assert (table.total_session_seconds, table.total_gameplay_seconds) == (7200, 1800)
+
+def test_incremental_load_matches_full_load(xml_path, tmp_path, caplog, assert_tables_equal):
+	with open(xml_path, "rb") as f:
+		data = f.read()
+	previous = score_table.load(xml_path)
+
+	# A session later: a retry of Song A was added, a score of Sóng C changed, Song B was deleted and
+	# a new chart came in
+	s02_start = data.index(b'<Score Key="S02">')
+	s02 = data[s02_start:data.index(b"</Score>", s02_start) + len(b"</Score>")]
+	retry = s02.replace(b"S02", b"S11").replace(b"2020-01-01 12:03:00", b"2020-03-01 20:00:00")
+	data = data.replace(s02, s02 + retry)
+	data = data.replace(b"<SSRNormPercent>0.975</SSRNormPercent>", b"<SSRNormPercent>0.976</SSRNormPercent>")
+	song_b_start = data.index(b'<Chart Key="Xb"')
+	song_b_end = data.index(b"</Chart>", song_b_start) + len(b"</Chart>")
+	song_b = data[song_b_start:song_b_end]
+	data = data[:song_b_start] + data[song_b_end:]
+	new_chart = song_b.replace(b'Key="Xb"', b'Key="Xf"').replace(b'Key="S0', b'Key="S2')
+	data = data.replace(b"</PlayerScores>", new_chart + b"</PlayerScores>")
+	path = tmp_path / "Etterna.xml"
+	path.write_bytes(data)
+
+	caplog.set_level(logging.INFO)
+	table = score_table.load(str(path), previous)
+	assert "Re-parsing 3 of 5 charts" in caplog.text # Song A, Sóng C and the new one
+	full = score_table.load(str(path))
+	assert_tables_equal(table, full)
+	assert "S11" in table.scorekeys and "S24" in table.scorekeys and "S04" not in table.scorekeys
+	assert table.wifescores[table.find_score("S08")] == 0.976
+
+	# Reloading an unchanged file reuses every chart
+	assert_tables_equal(score_table.load(str(path), table), full)
+
+def _latin1_variant(xml_path, tmp_path) -> str:
+	# Only the song name of chart Xc is written in ISO-8859-1, the rest of the file stays UTF-8
+	with open(xml_path, "rb") as f:
+		data = f.read()
+	path = tmp_path / "Etterna.xml"
+	path.write_bytes(data.replace('Song="Sóng C"'.encode("utf-8"), 'Song="Sóng C"'.encode("latin-1")))
+	return str(path)
+
+def test_encoding_is_decided_per_file(xml_path, tmp_path):
+	table = score_table.load(xml_path)
+	assert table.encoding == score_table.UTF_8
+	assert "Sóng C" in table.songs
+
+	latin1_path = _latin1_variant(xml_path, tmp_path)
+	latin1_table = score_table.load(latin1_path)
+	assert latin1_table.encoding == score_table.LATIN_1
+	assert "Sóng C" in latin1_table.songs
+	assert latin1_table.scorekeys.tolist() == table.scorekeys.tolist()
+
+def test_incremental_load_follows_encoding_change(xml_path, tmp_path):
+	latin1_path = _latin1_variant(xml_path, tmp_path)
+	previous = score_table.load(latin1_path)
+
+	# All other charts are unchanged, but have to be decoded as UTF-8 now
+	with open(xml_path, "rb") as f:
+		data = f.read()
+	with open(latin1_path, "wb") as f:
+		f.write(data.replace(b'Song="Song E"', 'Song="Söng E"'.encode("utf-8")))
+	table = score_table.load(latin1_path, previous)
+	assert table.encoding == score_table.UTF_8
+	assert table.songs == score_table.load(latin1_path).songs
+	assert "Sóng C" in table.songs and "Söng E" in table.songs
@@ -0,0 +1,75 @@
+from typing import *
+
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+import activity_cube
+import score_table
+from session_table import SessionTable
+
+
+# divide_into_sessions from before the session table: chronologically sorted (score, datetime)
+# tuples, split wherever two scores are more than `threshold` apart
+def _divide_into_sessions(scores_and_datetimes, threshold: timedelta) -> List[List[Tuple[Any, Any]]]:
+	zipped = sorted(scores_and_datetimes, key=lambda pair: pair[1])
+	prev_score_datetime = zipped[0][1]
+	current_session = [zipped[0]]
+	sessions = []
+	for score, score_datetime in zipped[1:]:
+		if score_datetime - prev_score_datetime > threshold:
+			sessions.append(current_session)
+			current_session = []
+		current_session.append((score, score_datetime))
+		prev_score_datetime = score_datetime
+	sessions.append(current_session)
+	return sessions
+
+# The most common highest skillset (without Overall) of the given SkillsetSSRs elements, the lowest
+# one on ties
+def _main_skillset(ssrs_elems) -> int:
+	counts = [0] * 7
+	for ssrs in ssrs_elems:
+		if ssrs is None: continue
+		values = [float(ssrs[i].text) for i in range(1, 8)]
+		counts[values.index(max(values))] += 1
+	if sum(counts) == 0:
+		return activity_cube.NO_SKILLSET
+	return max(range(7), key=lambda skillset: (counts[skillset], -skillset))
+
+@pytest.mark.parametrize("gap_minutes", [60, 5, 2, 1])
+def test_session_table_matches_divide_into_sessions(xml_path, reference_scores, gap_minutes):
+	gap = timedelta(minutes=gap_minutes)
+	table = score_table.load(xml_path)
+	scores = np.arange(len(table))
+	sessions = SessionTable(scores, table.datetimes, table.survive_seconds, table.ssrs, gap)
+
+	expected = _divide_into_sessions([(ref.elem, ref.datetime) for ref in reference_scores], gap)
+	assert len(sessions) == len(expected)
+	for i, session in enumerate(expected):
+		session_scores = sessions.scores[sessions.starts[i]:sessions.ends[i]]
+		assert [table.scorekeys[score] for score in session_scores] \
+				== [score.get("Key") for (score, _) in session]
+		assert sessions.num_plays[i] == len(session)
+		assert sessions.start_datetimes[i] == np.datetime64(session[0][1])
+		assert sessions.end_datetimes[i] == np.datetime64(session[-1][1])
+		assert sessions.wall_seconds[i] == (session[-1][1] - session[0][1]).total_seconds()
+		assert sessions.gameplay_seconds[i] == pytest.approx(
+				sum(float(score.findtext("SurviveSeconds")) for (score, _) in session))
+		assert sessions.main_skillsets[i] == _main_skillset(
+				[score.find("SkillsetSSRs") for (score, _) in session])
+
+def test_session_table_skips_scores_without_date(xml_path):
+	table = score_table.load(xml_path)
+	datetimes = table.datetimes.copy()
+	datetimes[0] = np.datetime64("NaT")
+	sessions = SessionTable(np.arange(len(table)), datetimes, table.survive_seconds, table.ssrs)
+	assert 0 not in sessions.scores
+	assert sessions.num_plays.sum() == len(table) - 1
+
+def test_empty_session_table():
+	sessions = SessionTable(np.zeros(0, dtype=int), np.zeros(0, dtype="datetime64[s]"),
+			np.zeros(0), np.zeros((0, 8)))
+	assert len(sessions) == 0
+	assert len(sessions.gameplay_seconds) == len(sessions.main_skillsets) == 0
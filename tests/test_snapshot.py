@@ -0,0 +1,86 @@
+from typing import *
+
+import os, json, shutil, logging
+
+import numpy as np
+import pytest
+
+import snapshot
+import score_table
+from score_table import ScoreTable
+
+
+@pytest.fixture
+def xml_copy(xml_path, tmp_path, monkeypatch) -> str:
+	monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshot"))
+	path = tmp_path / "Etterna.xml"
+	shutil.copy(xml_path, path)
+	return str(path)
+
+def _assert_snapshot_loaded(table: ScoreTable) -> None:
+	for name in ScoreTable.COLUMNS:
+		assert isinstance(getattr(table, name), np.memmap), name
+
+def test_unchanged_xml_loads_snapshot(xml_copy, caplog):
+	parsed = snapshot.load_score_table(xml_copy)
+	assert os.path.exists(os.path.join(snapshot.SNAPSHOT_DIR, "manifest.json"))
+
+	caplog.set_level(logging.INFO)
+	table = snapshot.load_score_table(xml_copy)
+	_assert_snapshot_loaded(table)
+	assert "Re-parsing" not in caplog.text
+
+	# A fresh parse interns the strings in the same order, so every column is equal as is
+	fresh = score_table.load(xml_copy)
+	for name in ScoreTable.COLUMNS:
+		np.testing.assert_array_equal(getattr(table, name), getattr(fresh, name), err_msg=name)
+	for name in ScoreTable.LISTS + ScoreTable.SCALARS:
+		assert getattr(table, name) == getattr(fresh, name) == getattr(parsed, name), name
+
+def test_modified_xml_reuses_unchanged_charts(xml_copy, caplog, assert_tables_equal):
+	snapshot.load_score_table(xml_copy)
+
+	with open(xml_copy, "rb") as f:
+		data = f.read()
+	data = data.replace(b"<SSRNormPercent>0.975</SSRNormPercent>", b"<SSRNormPercent>0.976</SSRNormPercent>")
+	with open(xml_copy, "wb") as f:
+		f.write(data)
+
+	caplog.set_level(logging.INFO)
+	table = snapshot.load_score_table(xml_copy)
+	assert "Re-parsing 1 of 5 charts" in caplog.text
+	assert not isinstance(table.scorekeys, np.memmap)
+	assert_tables_equal(table, score_table.load(xml_copy))
+	assert table.wifescores[table.find_score("S08")] == 0.976
+
+	# The snapshot was rewritten for the modified file
+	reloaded = snapshot.load_score_table(xml_copy)
+	_assert_snapshot_loaded(reloaded)
+	assert reloaded.wifescores[reloaded.find_score("S08")] == 0.976
+
+def _rewrite_manifest_version(version: int) -> None:
+	manifest_path = os.path.join(snapshot.SNAPSHOT_DIR, "manifest.json")
+	with open(manifest_path) as f:
+		manifest = json.load(f)
+	manifest["version"] = version
+	with open(manifest_path, "w") as f:
+		json.dump(manifest, f)
+
+@pytest.mark.parametrize("break_snapshot", [
+	lambda: _rewrite_manifest_version(snapshot.SNAPSHOT_VERSION - 1),
+	lambda: os.remove(os.path.join(snapshot.SNAPSHOT_DIR, "manifest.json")),
+], ids=["wrong_version", "missing_manifest"])
+def test_invalid_snapshot_is_ignored(xml_copy, caplog, assert_tables_equal, break_snapshot):
+	snapshot.load_score_table(xml_copy)
+	break_snapshot()
+	assert snapshot.load(snapshot.fingerprint(xml_copy), snapshot.SNAPSHOT_DIR) is None
+
+	# Parsed from scratch, without reusing any chart of the ignored snapshot
+	caplog.set_level(logging.INFO)
+	table = snapshot.load_score_table(xml_copy)
+	assert "Re-parsing" not in caplog.text
+	assert not isinstance(table.scorekeys, np.memmap)
+	assert_tables_equal(table, score_table.load(xml_copy))
+
+	# ...and a valid snapshot replaces it
+	_assert_snapshot_loaded(snapshot.load_score_table(xml_copy))
@@ -0,0 +1,97 @@
+from typing import *
+
+import json, time, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import unranked
+
+
+# Rows like the ones on the EtternaOnline unranked page. The row parsing only picks up the song
+# name (the link text); the steps cell is never matched, so steps is always None
+UNRANKED_PAGE = """<html><body><table>
+<tr>
+<td><a href="/song/1">
+Song A</a></td><td>Dance_Single</td>
+</tr>
+<tr>
+<td><a href="/song/2">
+Sóng B</a></td> <td>Dance_Double</td>
+</tr>
+<tr><td>Pack without link</td><td>Dance_Single</td></tr>
+</table></body></html>"""
+UNRANKED_CHARTS = frozenset({("Song A", None), ("Sóng B", None), (None, None)})
+
+TIMEOUT = 0.5 # seconds
+
+class _Handler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		if self.path == "/unranked":
+			body = UNRANKED_PAGE.encode("utf-8")
+			self.send_response(200)
+			self.send_header("Content-Type", "text/html; charset=utf-8")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+		elif self.path == "/slow":
+			time.sleep(4 * TIMEOUT)
+		else:
+			self.send_error(500)
+
+	def log_message(self, *args):
+		pass
+
+@pytest.fixture
+def server_url() -> Iterator[str]:
+	server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+	server.daemon_threads = True
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	yield f"http://127.0.0.1:{server.server_address[1]}"
+	server.shutdown()
+	server.server_close()
+
+def _download(url: str, cache_path: str) -> List[unranked.UnrankedCharts]:
+	calls = []
+	thread = unranked.download_in_background(calls.append, url, cache_path, timeout=TIMEOUT)
+	thread.join(10 * TIMEOUT)
+	assert not thread.is_alive()
+	return calls
+
+def test_parse():
+	assert unranked.parse(UNRANKED_PAGE) == UNRANKED_CHARTS
+
+def test_download_in_background(server_url, tmp_path):
+	cache_path = str(tmp_path / "unranked.json")
+	assert _download(server_url + "/unranked", cache_path) == [UNRANKED_CHARTS]
+	assert unranked.load_cache(cache_path) == (UNRANKED_CHARTS, False)
+
+@pytest.mark.parametrize("path", ["/error", "/slow"])
+def test_failed_download_never_calls_back(server_url, tmp_path, path):
+	cache_path = tmp_path / "unranked.json"
+	assert _download(server_url + path, str(cache_path)) == []
+	assert not cache_path.exists()
+
+def test_cache_expires(tmp_path, monkeypatch):
+	cache_path = str(tmp_path / "unranked.json")
+	unranked.save_cache(UNRANKED_CHARTS, cache_path)
+	downloaded = time.time()
+
+	monkeypatch.setattr(time, "time", lambda: downloaded + unranked.CACHE_MAX_AGE - 60)
+	assert unranked.load_cache(cache_path) == (UNRANKED_CHARTS, False)
+	monkeypatch.setattr(time, "time", lambda: downloaded + unranked.CACHE_MAX_AGE + 60)
+	assert unranked.load_cache(cache_path) == (UNRANKED_CHARTS, True)
+
+def test_cache_roundtrip(tmp_path):
+	cache_path = str(tmp_path / "unranked.json")
+	charts = frozenset({("Song A", "Dance_Single"), ("Song A", None), (None, "Dance_Double"),
+			(None, None), ("Sóng B", "Dance_Single")})
+	unranked.save_cache(charts, cache_path)
+	assert unranked.load_cache(cache_path) == (charts, False)
+
+def test_missing_or_broken_cache(tmp_path):
+	cache_path = tmp_path / "unranked.json"
+	assert unranked.load_cache(str(cache_path)) is None
+	cache_path.write_text(json.dumps({"charts": [["Song A", None]]})) # no download time
+	assert unranked.load_cache(str(cache_path)) is None
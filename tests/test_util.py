@@ -0,0 +1,32 @@
+from typing import *
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import util
+
+
+def _strptime(s: str) -> datetime:
+	return datetime.strptime(s, "%Y-%m-%d %H:%M:%S" if len(s) == 19 else "%Y-%m-%d")
+
+def test_parse_datetimes_matches_strptime(reference_scores):
+	strings = [ref.elem.findtext("DateTime") for ref in reference_scores]
+	strings += ["2000-02-29 23:59:59", "1999-12-31", "2100-03-01 00:00:01", "1970-01-01 00:00:00"]
+	assert "2020-01-02" in strings # midnight, without the time part
+
+	parsed = util.parse_datetimes(strings)
+	assert parsed.dtype == np.dtype("datetime64[s]")
+	assert parsed.tolist() == [_strptime(s) for s in strings]
+
+def test_parse_datetimes_without_date():
+	parsed = util.parse_datetimes(["2020-01-01 12:00:00", None, ""])
+	assert parsed[0] == np.datetime64("2020-01-01T12:00:00")
+	assert np.isnat(parsed[1:]).all()
+
+@pytest.mark.parametrize("string", ["2020-01-01T12:00:00", "2020-1-01 12:00:00", "2020-01-01 12:00",
+		"2020-01-01 1a:00:00", "2020-01-01 12:00:0é"])
+def test_parse_datetimes_rejects_malformed(string):
+	with pytest.raises(ValueError):
+		util.parse_datetimes([string])